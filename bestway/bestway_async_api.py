@@ -0,0 +1,211 @@
+""" Bestway Async - asyncio counterpart of the Bestway web API abstraction """
+""" Uses only asyncio streams (no third party HTTP library) """
+""" so that several devices can be polled concurrently """
+
+import asyncio
+import http.client
+import io
+import json
+import logging
+import ssl
+import time
+import urllib.error
+import urllib.parse
+
+from bestway.bestway_user_token import BestwayUserToken
+import bestway.bestway_exceptions as bestway_exceptions
+from bestway.bestwayapi import ENCODING, HEADERS, GIZWITS_USER_TOKEN, TIMEOUT, ERROR_TOKEN_INVALID, get_error_code
+
+# -- ----------------------------------------------------------------------- --
+# CONSTANTS
+
+CONCURRENCY = 4  # maximum simultaneous requests
+MAX_IDLE = 4  # idle connections kept for re-use
+
+# -- ----------------------------------------------------------------------- --
+
+class BestwayAsyncAPI:
+    """asyncio abstraction of the Bestway web API"""
+
+    def __init__(self, baseURL, concurrency=CONCURRENCY):
+        self.baseURL = baseURL
+        parts = urllib.parse.urlsplit(baseURL)
+        self.__https = parts.scheme == "https"
+        self.__host = parts.hostname
+        self.__port = parts.port or (443 if self.__https else 80)
+        self.__base_path = parts.path.rstrip("/")
+        self.__concurrency = concurrency
+        # connections and the semaphore belong to the event loop that made them, so each
+        # loop (e.g. each asyncio.run()) has its own, dropped once that loop is closed
+        self.__semaphores = {}  # loop -> asyncio.Semaphore
+        self.__idle = {}  # loop -> [(reader, writer)] available for re-use
+        logging.debug(f"initializing async Bestway API with {baseURL}")
+
+    def is_token_expired(self, token):
+        return time.gmtime(token.expiry) < time.gmtime()
+
+    async def get_user_token(self, username, password) -> BestwayUserToken:
+        """perform login, return token"""
+        body = {"username": username, "password": password, "lang": "en"}
+        logging.debug("logging in")
+        r = await self._post("/app/login", dict(HEADERS), body)
+        return BestwayUserToken.from_values(r["uid"], r["token"], r["expire_at"])
+
+    async def check_login(self, token, username, password) -> BestwayUserToken:
+        """check and refresh token, logging in with username and password if required"""
+        if self.is_token_expired(token):
+            logging.warning("token expired - logging in")
+            token = await self.get_user_token(username, password)
+        return token
+
+    async def get_devices(self, token):
+        """ retrieve list of configured devices"""
+        if self.is_token_expired(token):
+            raise bestway_exceptions.InvalidToken()
+        devices = await self._get("/app/bindings", self._get_headers(token))
+        if devices['devices']:
+            return devices['devices']
+        else:
+            return []
+
+    async def get_device_raw_info(self, token, device_id):
+        """retrieve current device status"""
+        if self.is_token_expired(token):
+            raise bestway_exceptions.InvalidToken()
+        logging.debug(f"getting info for device {device_id}")
+        return await self._get(f"/app/devdata/{device_id}/latest", self._get_headers(token))
+
+    async def get_devices_raw_info(self, token, device_ids):
+        """retrieve current status of many devices concurrently
+           returns dict of device_id -> raw info, or the exception raised for that device"""
+        results = await asyncio.gather(
+            *[self.get_device_raw_info(token, device_id) for device_id in device_ids],
+            return_exceptions=True)
+        return dict(zip(device_ids, results))
+
+    async def send_controls(self, token, device_id, controls):
+        logging.debug(f"controls: {controls}")
+        await self._post(f"/app/control/{device_id}", self._get_headers(token), controls)
+
+    async def close(self):
+        """close the running event loop's idle connections"""
+        idle = self.__idle.pop(asyncio.get_running_loop(), [])
+        for reader, writer in idle:
+            writer.close()
+
+    def _get_headers(self, user_token):
+        d = dict(HEADERS)
+        if user_token: d[GIZWITS_USER_TOKEN] = user_token.user_token
+        return d
+
+    async def _get(self, path, headers):
+        content = await self._request("GET", path, headers)
+        return json.loads(content)
+
+    async def _post(self, path, headers, data):
+        body_data = json.dumps(data).encode(ENCODING)
+        content = await self._request("POST", path, headers, body_data)
+        return json.loads(content)
+
+    # minimal HTTP/1.1 client
+
+    async def _request(self, method, path, headers, body=None):
+        loop = asyncio.get_running_loop()
+        semaphore = self.__semaphores.get(loop)
+        if semaphore is None:
+            for closed in [other for other in self.__semaphores if other.is_closed()]:
+                del self.__semaphores[closed]
+                self.__idle.pop(closed, None)
+            semaphore = self.__semaphores[loop] = asyncio.Semaphore(self.__concurrency)
+        async with semaphore:
+            return await asyncio.wait_for(self.__request(method, path, headers, body), TIMEOUT)
+
+    async def __request(self, method, path, headers, body):
+        request = self.__format_request(method, path, headers, body)
+        idle = self.__idle.setdefault(asyncio.get_running_loop(), [])
+        reused = bool(idle)
+        if reused:
+            reader, writer = idle.pop()
+        else:
+            reader, writer = await self.__connect()
+        try:
+            writer.write(request)
+            await writer.drain()
+            status, reason, response_headers, content, keep_alive = await self.__read_response(reader)
+        except (ConnectionError, asyncio.IncompleteReadError) as err:
+            writer.close()
+            if not reused: raise
+            # server dropped an idle connection - retry once on a fresh one
+            logging.debug(f"stale connection ({err!r}) - reconnecting")
+            reader, writer = await self.__connect()
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, reason, response_headers, content, keep_alive = await self.__read_response(reader)
+            except BaseException:
+                writer.close()
+                raise
+        except BaseException:
+            writer.close()
+            raise
+
+        if keep_alive and len(idle) < MAX_IDLE:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+        if status >= 400:
+            err = urllib.error.HTTPError(f"{self.baseURL}{path}", status, reason, response_headers, io.BytesIO(content))
+            if get_error_code(err) == ERROR_TOKEN_INVALID:
+                raise bestway_exceptions.InvalidToken() from err
+            raise err
+        return content
+
+    async def __connect(self):
+        logging.debug(f"opening connection to {self.__host}:{self.__port}")
+        context = ssl.create_default_context() if self.__https else None
+        return await asyncio.open_connection(self.__host, self.__port, ssl=context)
+
+    def __format_request(self, method, path, headers, body):
+        lines = [f"{method} {self.__base_path}{path} HTTP/1.1", f"Host: {self.__host}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        if body is not None:
+            lines.append(f"Content-Length: {len(body)}")
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+        return head + body if body is not None else head
+
+    async def __read_response(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed by server")
+        # the reason phrase may be empty or missing altogether: "HTTP/1.1 200"
+        version, status, *reason = status_line.decode("latin-1").split(None, 2)
+        reason = reason[0].strip() if reason else ""
+        headers = http.client.HTTPMessage()
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, value = line.decode("latin-1").split(":", 1)
+            headers[name.strip()] = value.strip()
+
+        keep_alive = version == "HTTP/1.1" and headers.get("Connection", "").lower() != "close"
+        if headers.get("Transfer-Encoding", "").lower() == "chunked":
+            content = b""
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # skip any trailer fields, up to the blank line ending the message
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                content += await reader.readexactly(size)
+                await reader.readline()
+        elif "Content-Length" in headers:
+            content = await reader.readexactly(int(headers["Content-Length"]))
+        else:
+            content = await reader.read()
+            keep_alive = False
+        return int(status), reason, headers, content, keep_alive
+
+# -- ----------------------------------------------------------------------- --
@@ -0,0 +1,91 @@
+"""
+Bestway Bindings Cache - local copy of the /app/bindings device list
+
+Indexed by device id, held in memory and (optionally) persisted to a JSON
+file so that short-lived scripts can skip downloading the bindings list
+"""
+
+import json
+import logging
+import os
+import time
+
+# -- ----------------------------------------------------------------------- --
+# constants
+
+BINDINGS_TTL = 60 * 60  # seconds before cached bindings are re-fetched
+
+# -- ----------------------------------------------------------------------- --
+
+class BestwayBindingsCache:
+    """Cache of raw device bindings, keyed by device id"""
+
+    def __init__(self, filename=None, ttl=BINDINGS_TTL):
+        self.__filename = filename
+        self.__ttl = ttl
+        self.__user_id = None
+        self.__fetched = 0
+        self.__devices = {}
+        self.__loaded = False
+
+    def get(self, user_id, device_id):
+        """return the cached raw binding for device_id, or None if not cached or out of date"""
+        self.__load()
+        if user_id != self.__user_id or self.is_expired():
+            return None
+        return self.__devices.get(device_id)
+
+    def update(self, user_id, raw_devices):
+        """replace the cache with a freshly downloaded bindings list"""
+        self.__user_id = user_id
+        self.__fetched = time.time()
+        self.__devices = {device['did']: device for device in raw_devices if 'did' in device}
+        self.__loaded = True
+        logging.debug(f"cached bindings for {len(self.__devices)} devices")
+        self.__save()
+
+    def invalidate(self):
+        """discard cached bindings (e.g. when a device is not found or reported offline)"""
+        logging.debug("invalidating bindings cache")
+        self.__user_id = None
+        self.__fetched = 0
+        self.__devices = {}
+        self.__loaded = True
+        if self.__filename:
+            try:
+                os.remove(self.__filename)
+            except FileNotFoundError:
+                pass
+
+    def is_expired(self):
+        return time.time() - self.__fetched > self.__ttl
+
+    # internal methods
+
+    def __load(self):
+        if self.__loaded: return
+        self.__loaded = True
+        if not self.__filename: return
+        try:
+            with open(self.__filename) as json_data:
+                data = json.load(json_data)
+            self.__user_id = data["user_id"]
+            self.__fetched = data["fetched"]
+            self.__devices = data["devices"]
+        except FileNotFoundError:
+            logging.debug("no bindings cache file")
+        except (ValueError, KeyError, TypeError) as err:
+            logging.warning(f"ignoring corrupt bindings cache {self.__filename}: {err}")
+
+    def __save(self):
+        if not self.__filename: return
+        data = {"user_id": self.__user_id, "fetched": self.__fetched, "devices": self.__devices}
+        temp_filename = f"{self.__filename}.{os.getpid()}.tmp"
+        try:
+            with open(temp_filename, 'w') as json_data:
+                json.dump(data, json_data, indent=2)
+            os.replace(temp_filename, self.__filename)  # atomic, so concurrent readers never see half a file
+        except OSError as err:
+            logging.warning(f"unable to save bindings cache {self.__filename}: {err}")
+
+# -- ----------------------------------------------------------------------- --
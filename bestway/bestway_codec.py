@@ -0,0 +1,130 @@
+"""
+Bestway Codec - table-driven translation between device JSON and normalized values
+
+Each device model describes its protocol as a table of Fields: which JSON
+attribute carries each normalized value, and how to convert it each way.
+A BestwayCodec compiles that table once into decode and encode functions:
+raw 'attr' dicts become BestwayStatusSnapshot records and BestwayCommand
+options become control payloads.
+"""
+
+import logging
+from typing import Callable, NamedTuple, Optional
+
+import bestway.bestway_exceptions as bestway_exceptions
+from bestway.bestway_device import BestwayStatusSnapshot
+
+# -- ----------------------------------------------------------------------- --
+
+class Field(NamedTuple):
+    name: str  # normalized name: a BestwayStatusSnapshot field
+    attr: str  # JSON attribute
+    decode: Optional[Callable] = None  # JSON value -> normalized value (None: unchanged)
+    encode: Optional[Callable] = None  # normalized value -> JSON value (None: unchanged)
+    required: bool = False  # device is unsupported if attribute is missing
+    control: bool = False  # may be set with a control command
+
+
+class Errors(NamedTuple):
+    prefix: str  # attribute name prefix, numbered from 1
+    count: int
+    on: int  # value indicating the error is present
+
+
+def switch(on, off):
+    """(decode, encode) pair for an on/off attribute"""
+    return (lambda value: value == on), (lambda value: on if value else off)
+
+# BestwayCommand getter for each controllable field
+COMMAND_OPTIONS = {
+    'pump': 'get_pump',
+    'heat': 'get_heat',
+    'target_temp': 'get_target_temp',
+    'bubbles': 'get_bubbles',
+    'timer_delay': 'get_delay',
+    'timer_duration': 'get_duration',
+}
+
+# -- ----------------------------------------------------------------------- --
+
+class BestwayCodec:
+    """Compiled protocol table for one device model"""
+
+    def __init__(self, model, fields, errors=None):
+        self.model = model
+        self.__fields = {field.name: field for field in fields}
+        self.__decode = self.__compile_decoder(fields, errors)
+        self.__encoders = {field.name: (field.attr, field.encode or _identity)
+                           for field in fields if field.control}
+
+    def decode(self, raw_status, updated_at=None) -> BestwayStatusSnapshot:
+        """raw 'attr' dict -> snapshot"""
+        return self.__decode(raw_status, updated_at)
+
+    def decode_batch(self, raw_statuses, updated_ats=None):
+        """list of raw 'attr' dicts (and optional matching updated_at values) -> list of snapshots"""
+        decode = self.__decode
+        if updated_ats is None:
+            return [decode(raw_status, None) for raw_status in raw_statuses]
+        return [decode(raw_status, updated_at) for raw_status, updated_at in zip(raw_statuses, updated_ats)]
+
+    def decode_field(self, raw_status, name):
+        """decode a single normalized value; raises UnsupportedDevice if the model or device lacks it"""
+        field = self.__fields.get(name)
+        if field is None or field.attr not in raw_status:
+            raise bestway_exceptions.UnsupportedDevice()
+        value = raw_status[field.attr]
+        return field.decode(value) if field.decode else value
+
+    def encode(self, command, names=None):
+        """BestwayCommand -> control payload {'attrs': {...}} for the options set (optionally limited to names)"""
+        attrs = {}
+        for name in (names or COMMAND_OPTIONS):
+            value = getattr(command, COMMAND_OPTIONS[name])()
+            if value is None: continue
+            encoder = self.__encoders.get(name)
+            if encoder is None:
+                raise bestway_exceptions.InvalidArgument(f"{self.model} does not support setting {name}")
+            attr, encode = encoder
+            attrs[attr] = encode(value)
+            logging.debug(f"{name}: {value} -> {attr}={attrs[attr]}")
+        return {'attrs': attrs}
+
+    def get_attr(self, name):
+        """JSON attribute for a normalized field"""
+        return self.__fields[name].attr
+
+    # internal methods
+
+    def __compile_decoder(self, fields, errors):
+        required = tuple((field.name, field.attr, field.decode or _identity) for field in fields if field.required)
+        optional = tuple((field.name, field.attr, field.decode or _identity) for field in fields if not field.required)
+        if errors:
+            error_attrs = tuple((number, f"{errors.prefix}{number}") for number in range(1, errors.count + 1))
+            error_on = errors.on
+        else:
+            error_attrs = ()
+            error_on = None
+
+        def decode(raw_status, updated_at):
+            values = {}
+            try:
+                for name, attr, convert in required:
+                    values[name] = convert(raw_status[attr])
+            except KeyError:
+                raise bestway_exceptions.UnsupportedDevice()
+            get = raw_status.get
+            for name, attr, convert in optional:
+                value = get(attr)
+                values[name] = None if value is None else convert(value)
+            values['errors'] = [number for number, attr in error_attrs if get(attr) == error_on]
+            values['updated_at'] = updated_at
+            return BestwayStatusSnapshot(**values)
+
+        return decode
+
+
+def _identity(value):
+    return value
+
+# -- ----------------------------------------------------------------------- --
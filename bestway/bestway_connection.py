@@ -0,0 +1,143 @@
+"""
+Bestway Connection - keep-alive HTTP(S) connection pool for the Bestway web API
+
+Re-uses http.client connections per host so that consecutive API calls
+do not each pay for a fresh TCP + TLS handshake
+"""
+
+import http.client
+import io
+import logging
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+import bestway.bestway_exceptions as bestway_exceptions
+
+# -- ----------------------------------------------------------------------- --
+# constants
+
+TIMEOUT = 10  # socket timeout (seconds)
+IDLE_TIMEOUT = 30  # seconds an idle connection is kept before being discarded
+MAX_IDLE = 4  # idle connections kept per host
+
+# -- ----------------------------------------------------------------------- --
+
+class BestwayConnectionPool:
+    """Pool of persistent connections, keyed by (scheme, host, port)"""
+
+    def __init__(self, timeout=TIMEOUT, idle_timeout=IDLE_TIMEOUT, max_idle=MAX_IDLE, on_connect=None):
+        """on_connect: optional callback(seconds, error) timing each new connection (DNS + TCP + TLS)"""
+        self.__timeout = timeout
+        self.__on_connect = on_connect
+        self.__idle_timeout = idle_timeout
+        self.__max_idle = max_idle
+        self.__lock = threading.Lock()
+        self.__idle = {}  # key -> list of (connection, time last used)
+
+    def request(self, method, url, headers, body=None) -> bytes:
+        """perform request, returning the response body; raises urllib.error.HTTPError on HTTP errors"""
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query: path = f"{path}?{parts.query}"
+
+        connection, reused = self._checkout(key)
+        sent = False
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            sent = True
+            response = connection.getresponse()
+        except (ConnectionError, http.client.BadStatusLine) as err:
+            connection.close()
+            if not reused: raise
+            # a POST may have been acted on before the connection dropped: only resend it if it never went
+            if sent and method != "GET": raise
+            # server dropped an idle connection - retry once on a fresh one
+            logging.debug(f"stale connection to {parts.hostname} ({err!r}) - reconnecting")
+            connection = self._connect(key)
+            try:
+                response = self.__send(connection, method, path, headers, body)
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+
+        try:
+            content = response.read()
+        except Exception:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(key, connection)
+
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(content))
+        return content
+
+    def close(self):
+        """close all idle connections"""
+        with self.__lock:
+            idle, self.__idle = self.__idle, {}
+        for connections in idle.values():
+            for connection, last_used in connections:
+                connection.close()
+
+    # internal methods
+
+    def __send(self, connection, method, path, headers, body):
+        connection.request(method, path, body=body, headers=headers)
+        return connection.getresponse()
+
+    def _connect(self, key):
+        scheme, host, port = key
+        logging.debug(f"opening connection to {scheme}://{host}:{port or ''}")
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(host, port, timeout=self.__timeout)
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=self.__timeout)
+        start = time.perf_counter()
+        try:
+            connection.connect()
+        except Exception as err:
+            if self.__on_connect: self.__on_connect(time.perf_counter() - start, err)
+            if isinstance(err, OSError):
+                raise bestway_exceptions.ConnectFailed(host, err) from err
+            raise
+        if self.__on_connect: self.__on_connect(time.perf_counter() - start, None)
+        return connection
+
+    def _checkout(self, key):
+        """return (connection, reused) - evicting any connections idle for too long"""
+        now = time.monotonic()
+        stale = []
+        connection = None
+        with self.__lock:
+            connections = self.__idle.get(key, [])
+            while connections:
+                candidate, last_used = connections.pop()
+                if now - last_used > self.__idle_timeout:
+                    stale.append(candidate)
+                else:
+                    connection = candidate
+                    break
+        for candidate in stale:
+            candidate.close()
+        if connection:
+            return connection, True
+        return self._connect(key), False
+
+    def _checkin(self, key, connection):
+        with self.__lock:
+            connections = self.__idle.setdefault(key, [])
+            if len(connections) < self.__max_idle:
+                connections.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+# -- ----------------------------------------------------------------------- --
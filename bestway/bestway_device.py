@@ -5,8 +5,8 @@ This is a base class
 """
 
 import logging
+import time
 
-import bestway.bestwayapi
 import bestway.bestway_exceptions as bestway_exceptions
 
 # -- ----------------------------------------------------------------------- --
@@ -15,11 +15,21 @@ import bestway.bestway_exceptions as bestway_exceptions
 AIRJET = 'Airjet'
 AIRJET_V01 = 'Airjet_V01'
 
+CONFIRM_POLL = 1  # seconds between status polls while awaiting confirmation of a command
+MIN_POLL = 15  # seconds: shortest interval between polls in wait_for()
+MAX_POLL = 15 * 60  # seconds: longest interval between polls in wait_for()
+POLL_FRACTION = 0.3  # wait_for() sleeps for this fraction of the predicted time remaining
+OVERDUE_FRACTION = 0.25  # ... or, once overdue, this fraction of the time overdue
+OVERDUE_POLL = 30  # seconds: longest interval between polls once overdue
+LOCAL_STATE_TTL = 5 * 60  # seconds a sent control is assumed to hold while the API has not caught up
+
 # -- ----------------------------------------------------------------------- --
 
 class BestwayDevice:
     """ Abstract Bestway Device base class"""
 
+    _codec = None  # BestwayCodec protocol table, set by each model
+
     # constructor
     def __init__(self, api, device_id, raw_device_data):
         logging.debug(f"Constructing BestwayDevice({raw_device_data})")
@@ -34,6 +44,9 @@ class BestwayDevice:
             self.__name = raw_device_data['dev_alias']
         else:
             raise bestway_exceptions.UnsupportedDevice()
+        self.__events = None
+        self.__local_state = {}  # attr -> (value, time sent, API updated_at when sent): controls not yet reflected
+        self.__reported_at = None  # updated_at of the latest report received from the API
 
     def __repr__(self):
         return f"BestwayDevice: {self.__name} ({self.__type})"
@@ -49,19 +62,126 @@ class BestwayDevice:
     def get_device_type(self):
         return self.__type
 
-    def _get_raw_status(self, token):
+    def _get_raw_info(self, token, cached=True, since=None):
+        """latest device data from the API
+           cached: overlay controls sent since the API last reported (see _post_controls)
+           since: a previous updated_at - return None unless the device has reported after it"""
         raw_device_info = self._get_api().get_device_raw_info(token, self._get_device_id())
-        if 'attr' in raw_device_info:
-            return raw_device_info['attr']
-        else:
+        if 'attr' not in raw_device_info:
             raise bestway_exceptions.UnsupportedDevice()
+        if self.__local_state:
+            self.__expire_local_state(raw_device_info.get('updated_at'))
+        self.__reported_at = raw_device_info.get('updated_at')
+        if since is not None and self.__reported_at is not None and self.__reported_at <= since:
+            logging.debug(f"no update since {since}")
+            return None
+        if cached and self.__local_state:
+            return self.__apply_local_state(raw_device_info)
+        return raw_device_info
+
+    def _get_raw_status(self, token, cached=True):
+        return self._get_raw_info(token, cached)['attr']
+
+    def _post_controls(self, token, controls):
+        """send a control payload, remembering the expected attributes
+           the Gizwits API does not reflect a control straight away, so cached reads are answered
+           with these values until the API reports anything new (its updated_at changes)
+           the API's updated_at is never compared with the local clock, which may differ"""
+        self._get_api().send_controls(token, self._get_device_id(), controls)
+        sent_at = time.monotonic()
+        for attr, value in controls['attrs'].items():
+            self.__local_state[attr] = (value, sent_at, self.__reported_at)
+
+    def __expire_local_state(self, updated_at):
+        """forget controls once the API has reported since they were sent, or after LOCAL_STATE_TTL"""
+        now = time.monotonic()
+        local_state = {}
+        for attr, (value, sent_at, reported_at) in self.__local_state.items():
+            if reported_at is None:
+                reported_at = updated_at  # no report seen before sending: this one predates the control
+            if updated_at == reported_at and now - sent_at < LOCAL_STATE_TTL:
+                local_state[attr] = (value, sent_at, reported_at)
+        self.__local_state = local_state
+
+    def __apply_local_state(self, raw_device_info):
+        """raw_device_info with controls still pending overlaid; updated_at is left as the API gave it"""
+        attrs = dict(raw_device_info['attr'])
+        for attr, (value, sent_at, reported_at) in self.__local_state.items():
+            attrs[attr] = value
+        logging.debug(f"API has not reported since controls were sent - using {self.__local_state}")
+        return dict(raw_device_info, attr=attrs)
+
+    def get_status(self, token, since=None, cached=True):
+        """return current status
+           if since (a previous status' updated_at) is given, return None unless the device has reported since
+           cached=False: as the API reports it, without controls still awaiting confirmation - to verify a command"""
+        raw_device_info = self._get_raw_info(token, cached, since)
+        if raw_device_info is None: return None
+        return self._make_status(raw_device_info['attr'], raw_device_info.get('updated_at'))
+
+    def get_snapshot(self, token, since=None, cached=True):
+        """return current status as a BestwayStatusSnapshot, decoded in one pass
+           if since is given, return None unless the device has reported since
+           cached=False: as the API reports it (see get_status)"""
+        raw_device_info = self._get_raw_info(token, cached, since)
+        if raw_device_info is None: return None
+        return self._decode_snapshot(raw_device_info['attr'], raw_device_info.get('updated_at'))
+
+    def get_events(self):
+        """BestwayEventDispatcher for subscribing to status changes, fed by poll()"""
+        if self.__events is None:
+            from bestway.bestway_events import BestwayEventDispatcher
+            self.__events = BestwayEventDispatcher()
+        return self.__events
+
+    def poll(self, token):
+        """fetch status and dispatch any changes to subscribers; returns the latest snapshot
+           (the previous one if the device has not reported since)"""
+        events = self.get_events()
+        previous = events.get_snapshot()
+        snapshot = self.get_snapshot(token, previous.updated_at if previous else None)
+        if snapshot is None:
+            return previous
+        events.update(snapshot)
+        return snapshot
+
+    def wait_for(self, token, condition, predict=None, timeout=None, min_poll=MIN_POLL, max_poll=MAX_POLL):
+        """poll status until condition(snapshot) holds; returns that snapshot, or None after timeout seconds
+           predict(snapshot): estimated seconds until the condition holds (negative if overdue, None if unknown)
+           - polls sparsely while the condition is predicted to be far off and densely around the expected time"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.poll(token)
+            if condition(snapshot):
+                return snapshot
+            remaining = predict(snapshot) if predict else None
+            if remaining is None:
+                interval = max_poll
+            elif remaining > 0:
+                interval = remaining * POLL_FRACTION
+            else:
+                interval = min(-remaining * OVERDUE_FRACTION, OVERDUE_POLL)
+            interval = min(max(interval, min_poll), max_poll)
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    logging.debug(f"condition not met after {timeout}s")
+                    return None
+                interval = min(interval, left)
+            logging.debug(f"predicted {remaining}s to go - next poll in {interval:.0f}s")
+            time.sleep(interval)
 
     # override methods
 
-    def get_status(self, token):
+    def _make_status(self, raw_status, updated_at):
         raise NotImplemented()
 
-    def send_controls(self, command):
+    def _decode_snapshot(self, raw_status, updated_at):
+        return self._codec.decode(raw_status, updated_at)
+
+    def send_controls(self, token, command):
+        """send command; returns True if the device confirmed it, False if it did not,
+           None if the model does not wait for confirmation"""
         raise NotImplemented()
 
 
@@ -70,10 +190,13 @@ class BestwayDevice:
 class BestwayStatus:
     """ Abstract Bestway Device Status base class"""
 
+    _codec = None  # BestwayCodec protocol table, set by each model
+
     # constructor
-    def __init__(self, raw_device_data):
+    def __init__(self, raw_device_data, updated_at=None):
         logging.debug(f"Constructing BestwayStatus({raw_device_data})")
         self.__device_data = raw_device_data
+        self.__updated_at = updated_at
 
     def __repr__(self):
         return f"BestwayStatus: {self.__device_data})"
@@ -81,33 +204,93 @@ class BestwayStatus:
     def _get_device_data(self):
         return self.__device_data
 
-    # override methods
+    def _get_field(self, name):
+        return self._codec.decode_field(self.__device_data, name)
+
+    def get_updated_at(self):
+        """time (epoch seconds) the device last reported, as given by the API"""
+        return self.__updated_at
+
+    def get_snapshot(self):
+        """decode into an immutable BestwayStatusSnapshot"""
+        return self._codec.decode(self.__device_data, self.__updated_at)
 
     def get_temp(self):
-        raise NotImplemented()
+        return self._get_field('temp')
 
     def get_temp_unit(self):
-        raise NotImplemented()
+        return self._get_field('temp_unit')
 
     def get_target_temp(self):
-        raise NotImplemented()
+        return self._get_field('target_temp')
 
     def get_pump_is_on(self):
-        raise NotImplemented()
+        return self._get_field('pump')
 
     def get_heat_is_on(self):
-        raise NotImplemented()
-
-    def get_bubble_level(self):
-        raise NotImplemented()
+        return self._get_field('heat')
 
     def get_timer_duration(self):
-        raise NotImplemented()
+        return self._get_field('timer_duration')
 
     def get_timer_delay(self):
+        return self._get_field('timer_delay')
+
+    # override methods
+
+    def get_bubble_level(self):
         raise NotImplemented()
 
 
+# -- ----------------------------------------------------------------------- --
+
+class BestwayStatusSnapshot:
+    """ Compact, immutable device status - decoded once, fields in °C/°F as reported"""
+
+    __slots__ = ('temp', 'temp_unit', 'target_temp', 'pump', 'heat', 'bubbles',
+                 'timer_duration', 'timer_delay', 'locked', 'earth', 'errors', 'updated_at')
+
+    def __init__(self, temp, temp_unit, target_temp, pump, heat, bubbles=None,
+                 timer_duration=None, timer_delay=None, locked=None, earth=None, errors=(), updated_at=None):
+        setter = object.__setattr__
+        setter(self, 'temp', temp)
+        setter(self, 'temp_unit', temp_unit)
+        setter(self, 'target_temp', target_temp)
+        setter(self, 'pump', pump)
+        setter(self, 'heat', heat)
+        setter(self, 'bubbles', bubbles)
+        setter(self, 'timer_duration', timer_duration)
+        setter(self, 'timer_delay', timer_delay)
+        setter(self, 'locked', locked)
+        setter(self, 'earth', earth)
+        setter(self, 'errors', tuple(errors))
+        setter(self, 'updated_at', updated_at)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, BestwayStatusSnapshot): return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, field) for field in self.__slots__))
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"BestwayStatusSnapshot({fields})"
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def replace(self, **changes):
+        """copy, with some fields changed"""
+        return BestwayStatusSnapshot(**dict(self.as_dict(), **changes))
+
+
 # -- ----------------------------------------------------------------------- --
 
 # BestwayCommand
@@ -134,7 +317,7 @@ class BestwayCommand:
         self.__bubbles = on
 
     def set_target_temp(self, temp):
-        self__temp = temp
+        self.__temp = temp
 
     def set_schedule(self, delay, duration):
         self.__delay = delay
@@ -160,3 +343,47 @@ class BestwayCommand:
 
 
 # -- ----------------------------------------------------------------------- --
+
+# BestwayCommandSequencer
+# sends a series of control steps, polling status after each step
+# and moving on as soon as the device reports the change
+
+class BestwayCommandSequencer:
+
+    def __init__(self, device, token, poll_interval=CONFIRM_POLL):
+        self.__device = device
+        self.__token = token
+        self.__poll_interval = poll_interval
+
+    def send(self, controls, timeout=0, tolerance=None):
+        """send controls, then wait up to timeout seconds for the device to report them
+           tolerance: optional dict of attribute -> allowed difference (e.g. for timers counting down)
+           returns True if confirmed, False if timed out, None if not waited for (timeout 0)"""
+        device = self.__device
+        device._post_controls(self.__token, controls)
+        if timeout <= 0: return None
+        return self.confirm(controls["attrs"], timeout, tolerance)
+
+    def confirm(self, expected, timeout, tolerance=None):
+        """poll status until the raw attributes match expected, for at most timeout seconds"""
+        tolerance = tolerance or {}
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logging.debug(f"no confirmation of {expected} after {timeout}s")
+                return False
+            time.sleep(min(self.__poll_interval, remaining))
+            raw_status = self.__device._get_raw_status(self.__token, cached=False)
+            if all(self.__matches(raw_status.get(attr), value, tolerance.get(attr, 0))
+                   for attr, value in expected.items()):
+                logging.debug(f"confirmed {expected} after {timeout - remaining:.1f}s")
+                return True
+
+    def __matches(self, actual, expected, tolerance):
+        if actual is None: return False
+        if tolerance: return abs(actual - expected) <= tolerance
+        return actual == expected
+
+
+# -- ----------------------------------------------------------------------- --
@@ -6,10 +6,10 @@ devised by reverse-engineering the JSON data exchanged
 """
 
 import logging
-import time
 
 import bestway.bestway_device
 import bestway.bestway_exceptions as bestway_exceptions
+from bestway.bestway_codec import BestwayCodec, Field, switch
 
 # -- ----------------------------------------------------------------------- --
 # 'Airjet' JSON tags for device info:
@@ -37,133 +37,73 @@ EARTHED = 1 # TODO: check
 # -- ----------------------------------------------------------------------- --
 # constants
 
-STOP_DELAY = 15  # gap between stop command and subsequent commands
-PROG_DELAY = 3  # gap between delay and heat commands`
+STOP_DELAY = 15  # longest wait for tub to stop before subsequent commands
+PROG_DELAY = 3  # longest wait for tub to take the timer duration
+SETTLE_DELAY = 5  # longest wait for tub to take the timer delay, completing the schedule
 
 # -- ----------------------------------------------------------------------- --
+# protocol table (no bubbles on this model; error attributes not yet identified)
+
+CODEC = BestwayCodec(bestway.bestway_device.AIRJET_V01, [
+    Field('temp', TEMP_NOW, required=True),
+    Field('temp_unit', TEMP_UNIT, lambda unit: '°C' if unit == TEMP_UNIT_C else '°F', required=True),
+    Field('target_temp', TEMP_TARGET, required=True, control=True),
+    Field('pump', PUMP_STATE, *switch(PUMP_STATE_ON, PUMP_STATE_OFF), required=True, control=True),
+    Field('heat', HEAT_STATE, *switch(HEAT_STATE_ON, HEAT_STATE_OFF), required=True, control=True),
+    Field('timer_duration', TIMER_DURN, control=True),
+    Field('timer_delay', TIMER_DELAY, control=True),
+    Field('locked', LOCK_STATE, *switch(LOCKED, 0)),
+    Field('earth', EARTH_STATE, *switch(EARTHED, 0)),
+])
+
+SWITCHES = ('pump', 'heat', 'target_temp', 'bubbles')  # sent together, ahead of any timer programming
 
-class BestwayDeviceAirjet_V01(bestway.bestway_device.BestwayDevice):
+# -- ----------------------------------------------------------------------- --
 
-    def __get_empty_control(self):
-        return {'attrs': {}}
+class BestwayDeviceAirjet_V01(bestway.bestway_device.BestwayDevice):
 
-    def __add_control(self, controls, control, value):
-        controls["attrs"][control] = value
-        return controls
+    _codec = CODEC
 
-    def get_status(self, token):
-        return BestwayStatusAirjet_V01(self._get_raw_status(token))
+    def _make_status(self, raw_status, updated_at):
+        return BestwayStatusAirjet_V01(raw_status, updated_at)
 
     def send_controls(self, token, command):
-        pump = command.get_pump()
-        heat = command.get_heat()
-        temp = command.get_target_temp()
-        bubbles = command.get_bubbles()
         delay = command.get_delay()
         duration = command.get_duration()
-
-        controls = self.__get_empty_control()
+        if (delay is None) != (duration is None):
+            raise bestway_exceptions.InvalidArgument("Must specify delay and timer together")
 
         logging.debug("Setting switch controls")
-        switches_set = False
-        if pump is not None:
-            logging.debug(f"pump: {'ON' if pump else 'OFF'}")
-            self.__add_control(controls, PUMP_STATE, PUMP_STATE_ON if pump else PUMP_STATE_OFF)
-            switches_set = True
-        if heat is not None:
-            logging.debug(f"heat: {'ON' if heat else 'OFF'}")
-            self.__add_control(controls, HEAT_STATE, HEAT_STATE_ON if heat else HEAT_STATE_OFF)
-            switches_set = True
-        if temp is not None:
-            logging.debug(f"set temperature to {temp}")
-            self.__add_control(controls, TEMP_TARGET, temp)
-            switches_set = True
-        if bubbles is not None:
-            logging.debug(f"turn bubbles {'ON' if bubbles else 'OFF'}")
-            self.__add_control(controls, BUBBLES, BUBBLES_ON if bubbles else BUBBLES_OFF)
-            switches_set = True
-
-        if switches_set:
+        controls = CODEC.encode(command, SWITCHES)
+
+        sequencer = bestway.bestway_device.BestwayCommandSequencer(self, token)
+        scheduling = delay is not None
+        confirmed = []
+        if controls['attrs']:
             logging.debug("passing switch controls to API")
-            self._get_api().send_controls(token, self._get_device_id(), controls)
-            controls = self.__get_empty_control()
+            # leave time for tub to stop - but only until it reports the change
+            confirmed.append(sequencer.send(controls, STOP_DELAY if scheduling else 0))
 
-        if delay is not None and duration is not None:
-            if switches_set: time.sleep(STOP_DELAY)  # leave time for tub to stop
+        if scheduling:
             logging.debug(f"schedule heating in {delay} minutes for {duration} minutes")
-            self.__add_control(controls, TIMER_DURN, duration)
+            controls = CODEC.encode(command, ('timer_duration',))
             logging.debug(f"sending duration: {controls}")
-            self._get_api().send_controls(token, self._get_device_id(), controls)
-            time.sleep(PROG_DELAY)
+            confirmed.append(sequencer.send(controls, PROG_DELAY))
 
-            controls = self.__get_empty_control()
-            self.__add_control(controls, TIMER_DELAY, delay)
+            controls = CODEC.encode(command, ('timer_delay',))
             logging.debug(f"sending delay: {controls}")
-            self._get_api().send_controls(token, self._get_device_id(), controls)
-        elif delay is not None or duration is not None:
-            raise bestway_exceptions.InvalidArgument("Must specify delay and timer together")
+            confirmed.append(sequencer.send(controls, SETTLE_DELAY, {TIMER_DELAY: 1}))  # delay counts down in minutes
+
+        confirmed = [result for result in confirmed if result is not None]
+        if not confirmed: return None
+        if not all(confirmed): logging.warning("tub did not confirm every control step")
+        return all(confirmed)
 
 
 # -- ----------------------------------------------------------------------- --
 
 class BestwayStatusAirjet_V01(bestway.bestway_device.BestwayStatus):
 
-    def get_temp(self):
-        raw_status = self._get_device_data()
-        if TEMP_NOW in raw_status:
-            return raw_status[TEMP_NOW]
-        else:
-            raise bestway_exceptions.UnsupportedDevice()
-
-    def get_temp_unit(self):
-        raw_status = self._get_device_data()
-        if TEMP_UNIT in raw_status:
-            if raw_status[TEMP_UNIT] == 1:
-                return '°C'
-            else:
-                return '°F'
-        else:
-            raise bestway_exceptions.UnsupportedDevice()
-
-    def get_target_temp(self):
-        raw_status = self._get_device_data()
-        if TEMP_TARGET in raw_status:
-            return raw_status[TEMP_TARGET]
-        else:
-            raise bestway_exceptions.UnsupportedDevice()
-
-    def get_pump_is_on(self):
-        raw_status = self._get_device_data()
-        if PUMP_STATE in raw_status:
-            if raw_status[PUMP_STATE] == PUMP_STATE_ON:
-                return True
-            else:
-                return False
-        else:
-            raise bestway_exceptions.UnsupportedDevice()
-
-    def get_heat_is_on(self):
-        raw_status = self._get_device_data()
-        if HEAT_STATE in raw_status:
-            if raw_status[HEAT_STATE] == HEAT_STATE_ON:
-                return True
-            else:
-                return False
-        else:
-            raise bestway_exceptions.UnsupportedDevice()
-
-    def get_timer_duration(self):
-        raw_status = self._get_device_data()
-        if TIMER_DURN in raw_status:
-            return raw_status[TIMER_DURN]
-        else:
-            raise bestway_exceptions.UnsupportedDevice()
-
-    def get_timer_delay(self):
-        raw_status = self._get_device_data()
-        if TIMER_DELAY in raw_status:
-            return raw_status[TIMER_DELAY]
-        else:
-            raise bestway_exceptions.UnsupportedDevice()
+    _codec = CODEC
 
 # -- ----------------------------------------------------------------------- --
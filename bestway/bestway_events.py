@@ -0,0 +1,153 @@
+"""
+Bestway Events - status diffing and change-event subscriptions
+
+A BestwayEventDispatcher is fed successive BestwayStatusSnapshots. It diffs
+each one against the previous snapshot and calls only the subscriptions
+registered for the fields that actually changed, so reacting to a change
+costs O(changes) rather than every consumer re-reading every attribute.
+"""
+
+import logging
+from typing import Any, NamedTuple
+
+import bestway.bestway_exceptions as bestway_exceptions
+from bestway.bestway_device import BestwayStatusSnapshot
+
+# -- ----------------------------------------------------------------------- --
+# constants
+
+FIELDS = tuple(field for field in BestwayStatusSnapshot.__slots__ if field != 'updated_at')
+
+# -- ----------------------------------------------------------------------- --
+
+class BestwayEvent(NamedTuple):
+    field: str
+    old: Any
+    new: Any
+    snapshot: BestwayStatusSnapshot  # the status in which the change was seen
+
+
+def diff_snapshots(old, new):
+    """dict of field -> (old value, new value) for the fields that differ (updated_at ignored)"""
+    if old is None:
+        return {}
+    changes = {}
+    for field in FIELDS:
+        old_value = getattr(old, field)
+        new_value = getattr(new, field)
+        if old_value != new_value:
+            changes[field] = (old_value, new_value)
+    return changes
+
+# -- ----------------------------------------------------------------------- --
+# subscriptions: decide whether a change to their field should fire the callback
+
+class _Subscription:
+    def __init__(self, field, callback):
+        self.field = field
+        self.callback = callback
+
+    def prime(self, snapshot):
+        """called with the current snapshot when the subscription starts"""
+        pass
+
+    def matches(self, old, new):
+        return True
+
+
+class _Transition(_Subscription):
+    def __init__(self, field, callback, to):
+        super().__init__(field, callback)
+        self.to = to
+
+    def matches(self, old, new):
+        return new == self.to
+
+
+class _Delta(_Subscription):
+    """fires when the value has moved at least delta from where it was last reported"""
+
+    def __init__(self, field, callback, delta):
+        super().__init__(field, callback)
+        self.delta = delta
+        self.baseline = None
+
+    def prime(self, snapshot):
+        self.baseline = getattr(snapshot, self.field)
+
+    def matches(self, old, new):
+        if new is None: return False
+        if self.baseline is None or abs(new - self.baseline) >= self.delta:
+            self.baseline = new
+            return True
+        return False
+
+
+class _TimerEnd(_Subscription):
+    def matches(self, old, new):
+        return bool(old) and new == 0
+
+# -- ----------------------------------------------------------------------- --
+
+class BestwayEventDispatcher:
+    """Diffs successive snapshots and dispatches the changes to subscribers"""
+
+    def __init__(self):
+        self.__snapshot = None
+        self.__subscriptions = {}  # field -> list of _Subscription
+
+    def get_snapshot(self):
+        """most recent snapshot seen (None before the first update)"""
+        return self.__snapshot
+
+    def on_change(self, field, callback):
+        """callback(event) whenever field changes"""
+        return self.__add(_Subscription(field, callback))
+
+    def on_transition(self, field, callback, to):
+        """callback(event) when field changes to the value to (e.g. heat to True)"""
+        return self.__add(_Transition(field, callback, to))
+
+    def on_delta(self, field, callback, delta):
+        """callback(event) when a numeric field has moved at least delta since it last fired"""
+        return self.__add(_Delta(field, callback, delta))
+
+    def on_timer_end(self, field, callback):
+        """callback(event) when a timer field (timer_delay, timer_duration) counts down to zero"""
+        return self.__add(_TimerEnd(field, callback))
+
+    def unsubscribe(self, subscription):
+        subscriptions = self.__subscriptions.get(subscription.field, [])
+        if subscription in subscriptions:
+            subscriptions.remove(subscription)
+
+    def update(self, snapshot):
+        """diff snapshot against the previous one, call the affected subscribers; returns the events"""
+        previous, self.__snapshot = self.__snapshot, snapshot
+        if previous is None:
+            for subscriptions in self.__subscriptions.values():
+                for subscription in subscriptions:
+                    subscription.prime(snapshot)
+            return []
+
+        events = []
+        for field, (old, new) in diff_snapshots(previous, snapshot).items():
+            event = BestwayEvent(field, old, new, snapshot)
+            events.append(event)
+            for subscription in list(self.__subscriptions.get(field, ())):
+                if subscription.matches(old, new):
+                    logging.debug(f"{field}: {old} -> {new}")
+                    subscription.callback(event)
+        return events
+
+    # internal methods
+
+    def __add(self, subscription):
+        if subscription.field not in FIELDS:
+            raise bestway_exceptions.InvalidArgument(f"unknown status field '{subscription.field}'")
+        self.__subscriptions.setdefault(subscription.field, []).append(subscription)
+        if self.__snapshot is not None:
+            subscription.prime(self.__snapshot)
+        return subscription
+
+# -- ----------------------------------------------------------------------- --
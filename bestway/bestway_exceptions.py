@@ -24,3 +24,18 @@ class UnsupportedDevice(Exception):
 class DeviceOffline(Exception):
     def __init__(self):
         super().__init__('Device offline')
+
+class BindingsUnavailable(Exception):
+    """the device list could not be fetched to resolve the device; the cause is chained"""
+    def __init__(self, id):
+        super().__init__(f"Device list unavailable for: {id}")
+
+class ConnectFailed(ConnectionError):
+    """no connection could be made, so the request was never sent (and is safe to retry)"""
+    def __init__(self, host, reason):
+        super().__init__(f"Cannot connect to {host}: {reason}")
+
+class RateLimited(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__(f"Rate limited{f' - retry after {retry_after:.0f}s' if retry_after else ''}")
+        self.retry_after = retry_after
@@ -0,0 +1,256 @@
+"""
+Bestway Fake Server - local stand-in for the Gizwits endpoints used by BestwayAPI
+
+Serves /app/login, /app/bindings, /app/devdata/{did}/latest and /app/control/{did}
+for a number of simulated Airjet and Airjet_V01 devices,
+with configurable latency, error rate and rate limits, and optionally
+chunked replies (as from a proxy), with a trailer.
+For tests and load testing - not a faithful emulation of the real service.
+
+Run standalone with: python -m bestway.bestway_fake_server --help
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bestway.bestway_device as bestway_device
+from bestway.bestway_throttle import TokenBucket, LOGIN, READ, CONTROL
+
+# -- ----------------------------------------------------------------------- --
+# constants
+
+TOKEN_LIFETIME = 7 * 24 * 60 * 60  # seconds
+ERROR_TOKEN_INVALID = 9004
+ERROR_DEVICE_OFFLINE = 9042
+
+DEVDATA_PATH = re.compile(r"^/app/devdata/([^/]+)/latest$")
+CONTROL_PATH = re.compile(r"^/app/control/([^/]+)$")
+
+AIRJET_ATTRS = {
+    "temp_now": 30, "temp_set": 38, "temp_set_unit": "摄氏", "heat_temp_reach": 0,
+    "filter_power": 0, "heat_power": 0, "wave_power": 0, "locked": 0, "earth": 0,
+    "heat_timer_min": 0, "heat_appm_min": 0,
+    **{f"system_err{n}": 0 for n in range(1, 10)},
+}
+AIRJET_V01_ATTRS = {
+    "Tnow": 30, "Tset": 38, "Tunit": 1, "filter": 0, "heat": 0,
+    "word0": 0, "word1": 0, "word2": 0, "word3": 0, "bit5": 0, "bit6": 0,
+}
+
+# -- ----------------------------------------------------------------------- --
+
+class FakeDevice:
+    """A simulated tub: bindings entry plus latest attributes"""
+
+    def __init__(self, did, product_name, alias, online=True):
+        self.did = did
+        self.product_name = product_name
+        self.alias = alias
+        self.online = online
+        self.attrs = dict(AIRJET_ATTRS if product_name == bestway_device.AIRJET else AIRJET_V01_ATTRS)
+        self.updated_at = int(time.time())
+        self.lock = threading.Lock()
+
+    def binding(self):
+        return {"did": self.did, "product_name": self.product_name, "dev_alias": self.alias,
+                "is_online": self.online, "protoc": 3,
+                "mcu_soft_version": "fake", "mcu_hard_version": "fake", "wifi_soft_version": "fake"}
+
+    def latest(self):
+        with self.lock:
+            return {"did": self.did, "updated_at": self.updated_at, "attr": dict(self.attrs)}
+
+    def control(self, attrs):
+        with self.lock:
+            self.attrs.update(attrs)
+            self.updated_at = int(time.time())
+
+
+class FakeGizwitsServer:
+    """Threaded HTTP server simulating the Gizwits API; use as a context manager or start()/stop()"""
+
+    def __init__(self, airjet=1, airjet_v01=1, latency=0.0, error_rate=0.0, rate_limits=None,
+                 host="127.0.0.1", port=0, seed=None, chunked=False):
+        """rate_limits: optional dict of budget (login/read/control) -> (requests per second, burst)
+           chunked: reply with Transfer-Encoding: chunked and a trailer, rather than Content-Length"""
+        self.latency = latency
+        self.chunked = chunked
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.devices = {}
+        for n in range(airjet):
+            self.add_device(bestway_device.AIRJET, f"Airjet {n + 1}")
+        for n in range(airjet_v01):
+            self.add_device(bestway_device.AIRJET_V01, f"Airjet_V01 {n + 1}")
+        self.limits = {budget: TokenBucket(rate, burst) for budget, (rate, burst) in (rate_limits or {}).items()}
+        self.tokens = {}  # user token -> (uid, expiry)
+        self.counts = {}  # endpoint -> requests served
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer((host, port), _FakeGizwitsHandler)
+        self.__server.daemon_threads = True
+        self.__server.fake = self
+        self.__thread = None
+
+    @property
+    def url(self):
+        host, port = self.__server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_device(self, product_name, alias, online=True):
+        device = FakeDevice(uuid.uuid4().hex[:22], product_name, alias, online)
+        self.devices[device.did] = device
+        return device
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        logging.info(f"fake Gizwits API serving {len(self.devices)} devices at {self.url}")
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def serve_forever(self):
+        self.__server.serve_forever()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, endpoint):
+        with self.__lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def login(self, username):
+        user_token = uuid.uuid4().hex
+        expiry = int(time.time()) + TOKEN_LIFETIME
+        with self.__lock:
+            self.tokens[user_token] = (f"uid-{username}", expiry)
+        return {"uid": f"uid-{username}", "token": user_token, "expire_at": expiry}
+
+    def is_valid_token(self, user_token):
+        with self.__lock:
+            entry = self.tokens.get(user_token)
+        return entry is not None and entry[1] > time.time()
+
+# -- ----------------------------------------------------------------------- --
+
+class _FakeGizwitsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body are written separately
+
+    def do_GET(self):
+        fake = self.server.fake
+        if self.path == "/app/bindings":
+            if self.__admit("bindings", READ):
+                self.__reply(200, {"devices": [device.binding() for device in fake.devices.values()]})
+        elif match := DEVDATA_PATH.match(self.path):
+            if self.__admit("devdata", READ):
+                device = self.__find_device(match.group(1))
+                if device: self.__reply(200, device.latest())
+        else:
+            self.__reply(404, {"error_message": "not found"})
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/app/login":
+            if self.__admit("login", LOGIN, authenticate=False):
+                self.__reply(200, fake.login(json.loads(body).get("username", "")))
+        elif match := CONTROL_PATH.match(self.path):
+            if self.__admit("control", CONTROL):
+                device = self.__find_device(match.group(1))
+                if device:
+                    device.control(json.loads(body).get("attrs", {}))
+                    self.__reply(200, {})
+        else:
+            self.__reply(404, {"error_message": "not found"})
+
+    def log_message(self, format, *args):
+        logging.debug(f"fake Gizwits: {format % args}")
+
+    def __admit(self, endpoint, budget, authenticate=True):
+        """apply simulated latency, rate limits, errors and authentication; False if already answered"""
+        fake = self.server.fake
+        fake.count(endpoint)
+        if fake.latency: time.sleep(fake.latency)
+        bucket = fake.limits.get(budget)
+        if bucket and not bucket.try_acquire():
+            self.__reply(429, {"error_message": "rate limited"}, {"Retry-After": "1"})
+            return False
+        if fake.error_rate and fake.random.random() < fake.error_rate:
+            self.__reply(503, {"error_message": "simulated failure"})
+            return False
+        if authenticate and not fake.is_valid_token(self.headers.get("X-Gizwits-User-token")):
+            self.__reply(400, {"error_code": ERROR_TOKEN_INVALID, "error_message": "token invalid"})
+            return False
+        return True
+
+    def __find_device(self, did):
+        device = self.server.fake.devices.get(did)
+        if device is None:
+            self.__reply(404, {"error_message": "unknown device"})
+        elif not device.online:
+            self.__reply(400, {"error_code": ERROR_DEVICE_OFFLINE, "error_message": "device offline"})
+            return None
+        return device
+
+    def __reply(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if self.server.fake.chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("Trailer", "X-Fake-Checksum")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.server.fake.chunked:
+            half = len(body) // 2
+            for chunk in (body[:half], body[half:]):
+                self.wfile.write(b"%x;fake=1\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\nX-Fake-Checksum: %x\r\n\r\n" % zlib.crc32(body))
+        else:
+            self.wfile.write(body)
+
+# -- ----------------------------------------------------------------------- --
+
+def main():
+    argparser = argparse.ArgumentParser(prog="bestway_fake_server", description="Fake Gizwits API for testing")
+    argparser.add_argument('-p', '--port', type=int, default=8080, help="port to listen on, default 8080")
+    argparser.add_argument('-a', '--airjet', type=int, default=1, help="number of Airjet devices")
+    argparser.add_argument('-v', '--airjet_v01', type=int, default=1, help="number of Airjet_V01 devices")
+    argparser.add_argument('-L', '--latency', type=float, default=0.0, help="added latency per request (seconds)")
+    argparser.add_argument('-e', '--error_rate', type=float, default=0.0, help="fraction of requests failing with 503")
+    argparser.add_argument('-r', '--read_rate', type=float, help="read requests per second before 429")
+    argparser.add_argument('-l', '--loglevel', help="logging level: INFO, DEBUG, WARNING, ERROR, CRITICAL")
+    args = argparser.parse_args()
+    logging.basicConfig(level=args.loglevel or "INFO")
+
+    rate_limits = {READ: (args.read_rate, math.ceil(args.read_rate))} if args.read_rate else None
+    fake = FakeGizwitsServer(args.airjet, args.airjet_v01, args.latency, args.error_rate, rate_limits,
+                             host="0.0.0.0", port=args.port)
+    for device in fake.devices.values():
+        print(f"{device.did}: {device.alias} ({device.product_name})")
+    print(f"serving on port {args.port}")
+    fake.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
+
+# -- ----------------------------------------------------------------------- --
@@ -0,0 +1,247 @@
+"""
+Bestway Fleet - poll many tubs, across several accounts, from one process
+
+Devices are sharded across worker threads by a stable hash of their id.
+Each worker has its own BestwayAPI, so its own keep-alive connections and
+rate budget; user tokens and device bindings are shared per account, with a
+single login per account however many workers hold its devices. Given a
+BestwayTokenStore and BestwayBindingsCache per account, tokens and bindings
+also outlive the process, so a fleet run from cron does not log in each time.
+Statuses from all workers are merged into one stream of FleetStatus records.
+
+Threads rather than processes: polling is network bound, and threads let
+the workers share tokens without any inter-process plumbing.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+import zlib
+from typing import NamedTuple, Optional
+
+import bestway.bestway_exceptions as bestway_exceptions
+from bestway.bestwayapi import BestwayAPI
+from bestway.bestway_bindings_cache import BestwayBindingsCache
+from bestway.bestway_device import BestwayStatusSnapshot
+from bestway.bestway_throttle import BestwayThrottle
+
+# -- ----------------------------------------------------------------------- --
+# constants
+
+GIZWITS_URL = 'https://euapi.gizwits.com'
+WORKERS = 4  # worker threads
+INTERVAL = 60  # seconds between polls of each device
+
+# -- ----------------------------------------------------------------------- --
+
+class FleetAccount(NamedTuple):
+    name: str
+    username: str
+    password: str
+    device_ids: tuple
+    gizwits_url: str = GIZWITS_URL
+
+
+class FleetStatus(NamedTuple):
+    account: str
+    device_id: str
+    snapshot: Optional[BestwayStatusSnapshot]  # None if the poll failed
+    error: Optional[Exception]
+    time: float  # epoch seconds of the poll
+
+
+def get_shard(device_id, workers):
+    """worker index for device_id - stable across runs and processes"""
+    return zlib.crc32(device_id.encode()) % workers
+
+# -- ----------------------------------------------------------------------- --
+
+class BestwayFleet:
+    """Polls the devices of several accounts on a pool of worker threads"""
+
+    def __init__(self, accounts, workers=WORKERS, interval=INTERVAL, budgets=None, token_stores=None,
+                 bindings_caches=None):
+        """budgets: optional BestwayThrottle budgets, applied to each worker separately
+           token_stores: optional {account name: BestwayTokenStore}, to keep tokens between runs
+           bindings_caches: optional {account name: BestwayBindingsCache}, likewise for the bindings"""
+        self.__interval = interval
+        self.__account_locks = {account.name: threading.Lock() for account in accounts}
+        self.__tokens = {}  # account name -> BestwayUserToken
+        self.__token_stores = token_stores or {}
+        bindings_caches = bindings_caches or {}
+        self.__bindings = {account.name: bindings_caches.get(account.name) or BestwayBindingsCache()
+                           for account in accounts}
+        self.__queue = queue.Queue()
+        self.__stopping = threading.Event()
+        self.__threads = []
+
+        shards = [[] for i in range(workers)]
+        for account in accounts:
+            for device_id in account.device_ids:
+                shards[get_shard(device_id, workers)].append((account, device_id))
+        self.__workers = [_FleetWorker(self, index, shard, budgets) for index, shard in enumerate(shards) if shard]
+        logging.debug(f"fleet: {sum(len(shard) for shard in shards)} devices over {len(self.__workers)} workers")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def get_shards(self):
+        """list of each worker's [(account name, device id), ...]"""
+        return [[(account.name, device_id) for account, device_id in worker.devices] for worker in self.__workers]
+
+    def start(self):
+        """start polling every device each interval, feeding statuses()"""
+        self.__stopping.clear()
+        for worker in self.__workers:
+            thread = threading.Thread(target=worker.run, args=(self.__stopping, self.__interval, self.__queue.put),
+                                      name=f"fleet-{worker.index}", daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+        return self
+
+    def stop(self):
+        """stop the workers, close their connections and end statuses()"""
+        self.__stopping.set()
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+        for worker in self.__workers:
+            worker.close()
+        self.__queue.put(None)
+
+    def statuses(self):
+        """yield FleetStatus records from all workers as they arrive, until stop()"""
+        while True:
+            status = self.__queue.get()
+            if status is None: return
+            yield status
+
+    def poll_once(self):
+        """poll every device once (workers in parallel); returns {(account name, device id): FleetStatus}"""
+        results = {}
+        lock = threading.Lock()
+
+        def collect(status):
+            with lock: results[(status.account, status.device_id)] = status
+
+        threads = [threading.Thread(target=worker.poll_round, args=(collect,)) for worker in self.__workers]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        return results
+
+    def get_metrics(self):
+        """each worker's BestwayMetrics, keyed by (worker index, account name)"""
+        return {key: metrics for worker in self.__workers for key, metrics in worker.get_metrics().items()}
+
+    def dump_metrics(self, filename):
+        """write the statistics as JSON: {account name: {worker index: {endpoint: statistics}}}"""
+        stats = {}
+        for (index, name), metrics in sorted(self.get_metrics().items()):
+            stats.setdefault(name, {})[str(index)] = metrics.get_stats()
+        with open(filename, 'w') as json_data:
+            json.dump(stats, json_data, indent=2)
+
+    def dump_metrics_at_exit(self, filename):
+        """write the statistics to filename when the script ends (the workers' APIs are made as needed)"""
+        def dump():
+            logging.debug(f"writing fleet API metrics to {filename}")
+            self.dump_metrics(filename)
+        atexit.register(dump)
+
+    def get_bindings(self, account):
+        """the BestwayBindingsCache shared by every worker's API for account"""
+        return self.__bindings[account.name]
+
+    def get_token(self, account, api, stale=None):
+        """shared token for account, logging in (once, whichever worker asks first) if there is none,
+           it has expired, or it is the stale token a worker has just had rejected"""
+        with self.__account_locks[account.name]:
+            token = self.__tokens.get(account.name)
+            if token is None or token is stale or api.is_token_expired(token):
+                token = self.__tokens[account.name] = self.__login(account, api, stale)
+            return token
+
+    def get_device(self, account, api, token, device_id):
+        """resolve device_id through the account's bindings cache, one worker at a time"""
+        with self.__account_locks[account.name]:
+            return api.get_device(token, device_id)
+
+    # internal methods
+
+    def __login(self, account, api, stale):
+        store = self.__token_stores.get(account.name)
+        if store is None:
+            logging.info(f"fleet: logging in to {account.name}")
+            return api.get_user_token(account.username, account.password)
+        # if stale, the store logs in unless another process has saved a new token since
+        return store.get_token(api, account.username, account.password, stale=stale)
+
+# -- ----------------------------------------------------------------------- --
+
+class _FleetWorker:
+    """One shard of the fleet, with its own API connections and rate budget"""
+
+    def __init__(self, fleet, index, devices, budgets):
+        self.index = index
+        self.devices = devices  # [(FleetAccount, device id)]
+        self.__fleet = fleet
+        self.__budgets = budgets
+        self.__apis = {}  # account name -> BestwayAPI (bindings are per account)
+        self.__devices = {}  # device id -> BestwayDevice
+
+    def run(self, stopping, interval, publish):
+        while not stopping.is_set():
+            start = time.monotonic()
+            self.poll_round(publish, stopping)
+            stopping.wait(max(interval - (time.monotonic() - start), 0))
+
+    def poll_round(self, publish, stopping=None):
+        for account, device_id in self.devices:
+            if stopping is not None and stopping.is_set(): return
+            publish(self.poll(account, device_id))
+
+    def poll(self, account, device_id):
+        api = self.__get_api(account)
+        now = time.time()
+        try:
+            token = self.__fleet.get_token(account, api)
+            try:
+                snapshot = self.__get_device(account, api, token, device_id).poll(token)
+            except bestway_exceptions.InvalidToken:
+                token = self.__fleet.get_token(account, api, stale=token)
+                snapshot = self.__get_device(account, api, token, device_id).poll(token)
+        except Exception as err:
+            logging.warning(f"fleet: {account.name}/{device_id}: {err!r}")
+            return FleetStatus(account.name, device_id, None, err, now)
+        return FleetStatus(account.name, device_id, snapshot, None, now)
+
+    def get_metrics(self):
+        return {(self.index, name): api.get_metrics() for name, api in self.__apis.items()}
+
+    def close(self):
+        for api in self.__apis.values():
+            api.close()
+
+    # internal methods
+
+    def __get_api(self, account):
+        api = self.__apis.get(account.name)
+        if api is None:
+            throttle = BestwayThrottle(self.__budgets) if self.__budgets else None
+            api = self.__apis[account.name] = BestwayAPI(account.gizwits_url, self.__fleet.get_bindings(account),
+                                                         throttle=throttle)
+        return api
+
+    def __get_device(self, account, api, token, device_id):
+        device = self.__devices.get(device_id)
+        if device is None:
+            device = self.__devices[device_id] = self.__fleet.get_device(account, api, token, device_id)
+        return device
+
+# -- ----------------------------------------------------------------------- --
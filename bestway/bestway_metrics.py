@@ -0,0 +1,128 @@
+"""
+Bestway Metrics - per-endpoint latency, traffic and error counts for the Bestway web API
+
+Requests are grouped by endpoint template (login, bindings, devdata, control).
+Each HTTP attempt is timed; time spent waiting on rate limits and retry
+backoff, and time spent opening connections (DNS + TCP + TLS),
+is recorded separately so slow runs can be explained.
+"""
+
+import atexit
+import json
+import logging
+import re
+import threading
+
+# -- ----------------------------------------------------------------------- --
+# constants
+
+ENDPOINTS = [
+    ('login', re.compile(r"^/app/login$")),
+    ('bindings', re.compile(r"^/app/bindings$")),
+    ('devdata', re.compile(r"^/app/devdata/[^/]+/latest$")),
+    ('control', re.compile(r"^/app/control/[^/]+$")),
+]
+OTHER = 'other'
+CONNECT = 'connect'
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # histogram upper bounds (seconds)
+
+# -- ----------------------------------------------------------------------- --
+
+class EndpointStats:
+    """Counters for one endpoint template"""
+
+    def __init__(self):
+        self.count = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.waited = 0.0
+        self.errors = {}
+
+    def add(self, elapsed, bytes_out, bytes_in, error):
+        self.count += 1
+        self.bytes_out += bytes_out
+        self.bytes_in += bytes_in
+        self.latency_total += elapsed
+        self.latency_max = max(self.latency_max, elapsed)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound: break
+        else:
+            index = len(LATENCY_BUCKETS)
+        self.histogram[index] += 1
+        if error is not None:
+            name = type(error).__name__
+            if getattr(error, 'code', None): name = f"{name} {error.code}"
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def to_dict(self):
+        labels = [f"<={bound}" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}"]
+        return {
+            "count": self.count,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "latency_mean": self.latency_total / self.count if self.count else None,
+            "latency_max": self.latency_max,
+            "latency_histogram": dict(zip(labels, self.histogram)),
+            "waited": self.waited,
+            "errors": dict(self.errors),
+        }
+
+# -- ----------------------------------------------------------------------- --
+
+class BestwayMetrics:
+    """Thread-safe collection of EndpointStats"""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__stats = {}
+
+    def endpoint(self, path):
+        """endpoint template name for a request path"""
+        for name, pattern in ENDPOINTS:
+            if pattern.match(path): return name
+        return OTHER
+
+    def record(self, endpoint, elapsed, bytes_out=0, bytes_in=0, error=None):
+        """record one HTTP attempt (or, for CONNECT, one connection opened)"""
+        with self.__lock:
+            self.__get(endpoint).add(elapsed, bytes_out, bytes_in, error)
+
+    def record_wait(self, endpoint, seconds):
+        """record time spent waiting for rate limits or retry backoff"""
+        if seconds <= 0: return
+        with self.__lock:
+            self.__get(endpoint).waited += seconds
+
+    def get_stats(self):
+        """dict of endpoint -> statistics"""
+        with self.__lock:
+            return {name: stats.to_dict() for name, stats in self.__stats.items()}
+
+    def to_json(self):
+        return json.dumps(self.get_stats(), indent=2)
+
+    def dump(self, filename):
+        with open(filename, 'w') as json_data:
+            json_data.write(self.to_json())
+
+    def dump_at_exit(self, filename):
+        """write statistics to filename as JSON when the script ends"""
+        def dump():
+            logging.debug(f"writing API metrics to {filename}")
+            self.dump(filename)
+        atexit.register(dump)
+
+    def reset(self):
+        with self.__lock:
+            self.__stats = {}
+
+    def __get(self, endpoint):
+        stats = self.__stats.get(endpoint)
+        if stats is None:
+            stats = self.__stats[endpoint] = EndpointStats()
+        return stats
+
+# -- ----------------------------------------------------------------------- --
@@ -0,0 +1,176 @@
+"""
+Bestway Throttle - client-side rate limiting and retry policy for the Bestway web API
+
+The Gizwits server rate-limits requests (/app/login particularly aggressively)
+so requests are paced by a token bucket per budget (login, read, control)
+and failures are retried with jittered exponential backoff,
+honouring HTTP 429 and Retry-After
+Only idempotent requests (GETs) are retried after any transient failure: a
+POST (a control, or a login) is retried only on 429 or when it was never
+sent, so a command reaches the tub at most once
+"""
+
+import email.utils
+import logging
+import random
+import threading
+import time
+import urllib.error
+from typing import NamedTuple
+
+import bestway.bestway_exceptions as bestway_exceptions
+
+# -- ----------------------------------------------------------------------- --
+# constants
+
+LOGIN = 'login'
+READ = 'read'
+CONTROL = 'control'
+
+TOO_MANY_REQUESTS = 429
+RETRY_STATUSES = (TOO_MANY_REQUESTS, 500, 502, 503, 504)
+MAX_RETRY_AFTER = 120  # longest Retry-After (seconds) worth waiting for
+
+class Budget(NamedTuple):
+    rate: float  # requests per second, sustained
+    burst: int  # requests allowed back-to-back
+    attempts: int  # total attempts per request
+    base_delay: float  # first backoff (seconds)
+    max_delay: float  # backoff ceiling (seconds)
+
+DEFAULT_BUDGETS = {
+    LOGIN: Budget(rate=1 / 30, burst=2, attempts=2, base_delay=10, max_delay=60),
+    READ: Budget(rate=2, burst=5, attempts=4, base_delay=1, max_delay=30),
+    CONTROL: Budget(rate=1, burst=3, attempts=3, base_delay=2, max_delay=30),
+}
+
+# -- ----------------------------------------------------------------------- --
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a request may be made"""
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.__rate = float(rate)
+        self.__burst = float(burst)
+        self.__tokens = float(burst)
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__last = clock()
+        self.__lock = threading.Lock()
+
+    def acquire(self):
+        """take a token, waiting if necessary; returns the time waited (seconds)"""
+        with self.__lock:
+            self.__refill()
+            self.__tokens -= 1  # reserve now, so concurrent callers queue up behind us
+            wait = -self.__tokens / self.__rate if self.__tokens < 0 else 0.0
+        if wait > 0:
+            logging.debug(f"rate limit: waiting {wait:.2f}s")
+            self.__sleep(wait)
+        return wait
+
+    def try_acquire(self):
+        """take a token if one is available now, without waiting; returns True if taken"""
+        with self.__lock:
+            self.__refill()
+            if self.__tokens < 1: return False
+            self.__tokens -= 1
+            return True
+
+    def pause(self, seconds):
+        """hold back all callers for the given time (e.g. after a 429 response)"""
+        with self.__lock:
+            self.__refill()
+            self.__tokens = min(self.__tokens, 1 - seconds * self.__rate)
+
+    def __refill(self):
+        now = self.__clock()
+        self.__tokens = min(self.__burst, self.__tokens + (now - self.__last) * self.__rate)
+        self.__last = now
+
+# -- ----------------------------------------------------------------------- --
+
+class RetryPolicy:
+    """Retry with jittered exponential backoff
+       equal_jitter keeps at least half of each backoff step, for callers that must
+       outlast an outage rather than merely spread out requests"""
+
+    def __init__(self, attempts, base_delay, max_delay, sleep=time.sleep, equal_jitter=False):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.equal_jitter = equal_jitter
+        self.__sleep = sleep
+
+    def delays(self):
+        """generate the backoff delays between attempts"""
+        for retry in range(self.attempts - 1):
+            cap = min(self.max_delay, self.base_delay * 2 ** (retry + 1))
+            if self.equal_jitter:
+                yield cap / 2 + random.uniform(0, cap / 2)
+            else:
+                yield random.uniform(self.base_delay, cap)
+
+    def call(self, function, bucket=None, idempotent=True):
+        """call function(), pacing with bucket and retrying transient failures
+           unless idempotent, only rejected (429) or unsent (ConnectFailed) calls are retried"""
+        delays = self.delays()
+        while True:
+            if bucket: bucket.acquire()
+            try:
+                return function()
+            except urllib.error.HTTPError as err:
+                if err.code not in RETRY_STATUSES: raise
+                if not idempotent and err.code != TOO_MANY_REQUESTS: raise
+                retry_after = get_retry_after(err)
+                delay = next(delays, None)
+                if delay is None or (retry_after or 0) > MAX_RETRY_AFTER:
+                    if err.code == TOO_MANY_REQUESTS:
+                        raise bestway_exceptions.RateLimited(retry_after) from err
+                    raise
+                delay = max(delay, retry_after or 0)
+                logging.warning(f"HTTP {err.code} - retrying in {delay:.1f}s")
+                if bucket and err.code == TOO_MANY_REQUESTS:
+                    # hold back every caller sharing this budget, not just this one
+                    bucket.pause(delay)
+                    continue
+            except OSError as err:
+                # connection refused/reset, timeouts, DNS failures ...
+                if not idempotent and not isinstance(err, bestway_exceptions.ConnectFailed): raise
+                delay = next(delays, None)
+                if delay is None: raise
+                logging.warning(f"{err!r} - retrying in {delay:.1f}s")
+            self.__sleep(delay)
+
+# -- ----------------------------------------------------------------------- --
+
+class BestwayThrottle:
+    """Token bucket and retry policy for each request budget"""
+
+    def __init__(self, budgets=None, clock=time.monotonic, sleep=time.sleep):
+        budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.__buckets = {}
+        self.__policies = {}
+        for name, budget in budgets.items():
+            self.__buckets[name] = TokenBucket(budget.rate, budget.burst, clock, sleep)
+            self.__policies[name] = RetryPolicy(budget.attempts, budget.base_delay, budget.max_delay, sleep)
+
+    def call(self, budget, function, idempotent=True):
+        return self.__policies[budget].call(function, self.__buckets[budget], idempotent)
+
+# -- ----------------------------------------------------------------------- --
+
+def get_retry_after(err):
+    """Retry-After header (delta-seconds or HTTP-date) in seconds, or None"""
+    value = err.headers.get("Retry-After") if err.headers else None
+    if not value: return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# -- ----------------------------------------------------------------------- --
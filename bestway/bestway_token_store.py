@@ -0,0 +1,135 @@
+"""
+Bestway Token Store - user token shared between processes
+
+The token is kept in its own JSON file, guarded by a lock file, so that when
+several scripts start together only one of them logs in ("single flight");
+the others wait for, and re-use, the fresh token.
+Tokens are refreshed a margin ahead of expiry.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows: fall back to in-process locking only
+    fcntl = None
+
+from bestway.bestway_user_token import BestwayUserToken
+
+# -- ----------------------------------------------------------------------- --
+# constants
+
+REFRESH_MARGIN = 60 * 60  # seconds before expiry at which a token is refreshed
+
+# -- ----------------------------------------------------------------------- --
+
+class BestwayTokenStore:
+    """File-backed, lock-protected store for a BestwayUserToken"""
+
+    def __init__(self, filename, refresh_margin=REFRESH_MARGIN):
+        self.__filename = filename
+        self.__lock_filename = f"{filename}.lock"
+        self.__refresh_margin = refresh_margin
+        self.__lock = threading.Lock()
+
+    def get_token(self, api, username, password, initial=None, stale=None) -> BestwayUserToken:
+        """return a valid token, logging in only if no other process has already done so
+           initial: token data (e.g. from an older configuration file) used if the store is empty
+           stale: a token the server has just rejected, which is replaced however long it has to run"""
+        with self.__lock:
+            if stale is not None:
+                with _FileLock(self.__lock_filename, blocking=True):
+                    return self.__refresh(api, username, password, stale)
+
+            token = self.read()
+            if token is None and initial:
+                token = BestwayUserToken(initial)
+                if not self.__is_expiring(token): self.write(token)
+
+            if token is not None and not self.__is_expiring(token):
+                return token
+
+            if token is not None and not self.__is_expired(token):
+                # still usable: refresh early, unless another process is already doing so
+                with _FileLock(self.__lock_filename, blocking=False) as locked:
+                    if not locked:
+                        logging.debug("token refresh in progress elsewhere - using current token")
+                        return token
+                    try:
+                        return self.__refresh(api, username, password)
+                    except Exception as err:
+                        logging.warning(f"early token refresh failed ({err}) - using current token")
+                        return token
+
+            with _FileLock(self.__lock_filename, blocking=True):
+                return self.__refresh(api, username, password)
+
+    def read(self):
+        """stored token, or None"""
+        try:
+            with open(self.__filename) as json_data:
+                return BestwayUserToken(json.load(json_data))
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as err:
+            logging.warning(f"ignoring corrupt token file {self.__filename}: {err}")
+            return None
+
+    def write(self, token):
+        temp_filename = f"{self.__filename}.{os.getpid()}.tmp"
+        with open(temp_filename, 'w') as json_data:
+            json.dump(dict(token), json_data, indent=2)
+        os.replace(temp_filename, self.__filename)  # atomic, so readers never see half a file
+
+    # internal methods
+
+    def __refresh(self, api, username, password, stale=None):
+        """log in - unless, while we waited for the lock, another process already has"""
+        token = self.read()
+        if (token is not None and not self.__is_expiring(token)
+                and (stale is None or token.user_token != stale.user_token)):
+            logging.debug("using token refreshed by another process")
+            return token
+        logging.warning("token rejected - logging in" if stale is not None else "token expired or expiring - logging in")
+        token = api.get_user_token(username, password)
+        self.write(token)
+        return token
+
+    def __is_expired(self, token):
+        return token.expiry <= time.time()
+
+    def __is_expiring(self, token):
+        return token.expiry - self.__refresh_margin <= time.time()
+
+# -- ----------------------------------------------------------------------- --
+
+class _FileLock:
+    """exclusive advisory lock on a file; 'as' value is True if the lock was obtained"""
+
+    def __init__(self, filename, blocking=True):
+        self.__filename = filename
+        self.__blocking = blocking
+        self.__file = None
+
+    def __enter__(self):
+        if fcntl is None: return True
+        self.__file = open(self.__filename, 'a')
+        try:
+            fcntl.flock(self.__file, fcntl.LOCK_EX if self.__blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            self.__file.close()
+            self.__file = None
+            return False
+
+    def __exit__(self, *exc_info):
+        if self.__file:
+            fcntl.flock(self.__file, fcntl.LOCK_UN)
+            self.__file.close()
+            self.__file = None
+
+# -- ----------------------------------------------------------------------- --
@@ -4,12 +4,16 @@
 """ See: https://docs.gizwits.com/en-us/cloud/OpenAPI.html"""
 """ See: https://docs.gizwits.com/en-us/UserManual/UseOpenAPI.html"""
 
-import urllib.request as request
 import time
 import json
 import logging
+import urllib.error
 
 from bestway.bestway_user_token import BestwayUserToken
+from bestway.bestway_connection import BestwayConnectionPool
+from bestway.bestway_bindings_cache import BestwayBindingsCache
+from bestway.bestway_throttle import BestwayThrottle, LOGIN, READ, CONTROL
+from bestway.bestway_metrics import BestwayMetrics, CONNECT
 import bestway.bestway_exceptions as bestway_exceptions
 import bestway.bestway_device as bestway_device
 from bestway.bestway_device_airjet import BestwayDeviceAirjet
@@ -25,16 +29,26 @@ HEADERS = {
 }
 GIZWITS_USER_TOKEN = "X-Gizwits-User-token"
 TIMEOUT = 10
+MAX_WORKERS = 4  # parallel requests made by get_statuses
+ERROR_TOKEN_INVALID = 9004  # Gizwits error_code for a token the server no longer accepts
 
 # -- ----------------------------------------------------------------------- --
 
 class BestwayAPI:
     """Abstraction of the Bestway web API"""
 
-    def __init__(self, baseURL):
+    def __init__(self, baseURL, bindings_cache=None, throttle=None):
         self.baseURL = baseURL
+        self._metrics = BestwayMetrics()
+        self._pool = BestwayConnectionPool(timeout=TIMEOUT, on_connect=self.__record_connect)
+        self._bindings = bindings_cache if bindings_cache is not None else BestwayBindingsCache()
+        self._throttle = throttle if throttle is not None else BestwayThrottle()
         logging.debug(f"initializing Bestway API with {baseURL}")
 
+    def close(self):
+        """release any pooled connections"""
+        self._pool.close()
+
     def is_token_expired(self, token):
         return time.gmtime(token.expiry) < time.gmtime()
 
@@ -42,7 +56,7 @@ class BestwayAPI:
         """perform login, return token"""
         body = {"username": username, "password": password, "lang": "en"}
         logging.debug("logging in")
-        r = self._post("/app/login", dict(HEADERS), body)
+        r = self._post("/app/login", dict(HEADERS), body, LOGIN)
         logging.debug(f"login response: {r}")
         return BestwayUserToken.from_values(r["uid"], r["token"], r["expire_at"])
 
@@ -71,33 +85,87 @@ class BestwayAPI:
         logging.debug(f"getting info for device {device_id}")
         return self._get(f"/app/devdata/{device_id}/latest", self._get_headers(token))
 
-    def _get_device_raw(self, token, device_id):
-        raw_devices = self._get_devices(token)
-        for device in raw_devices:
-            if 'did' in device:
-                if device['did'] == device_id:
-                    return device
+    def invalidate_bindings(self):
+        """force the device list to be re-fetched on next use"""
+        self._bindings.invalidate()
+
+    def _get_device_raw(self, token, device_id, refresh=True):
+        device = self._bindings.get(token.user_id, device_id)
+        if refresh and not self.__is_current(device):
+            # not cached, out of date or (possibly stale) offline: refresh from server
+            if device is not None: self.invalidate_bindings()
+            self._bindings.update(token.user_id, self._get_devices(token))
+            device = self._bindings.get(token.user_id, device_id)
+        if device is not None:
+            return device
         raise bestway_exceptions.UnsupportedDevice()
 
-    def get_device(self, token, device_id):
-        raw_device = self._get_device_raw(token, device_id)
+    def __is_current(self, raw_device):
+        """cached and, as far as the cache knows, online"""
+        return raw_device is not None and raw_device.get('is_online', True)
+
+    def get_device(self, token, device_id, refresh=True):
+        """device_id's BestwayDevice; unless refresh is False, the bindings list is re-downloaded
+           if the device is not in the cache or is cached as offline"""
+        raw_device = self._get_device_raw(token, device_id, refresh)
         if raw_device:
-            if 'product_name' in raw_device:
-                device_type = raw_device['product_name']
-            else:
-                raise bestway_exceptions.UnsupportedDevice()
-            if ('is_online' in raw_device) & (raw_device['is_online']) == False:
-                raise bestway_exceptions.DeviceOffline()
-
-            if device_type == bestway_device.AIRJET:
-                return BestwayDeviceAirjet(self, device_id, raw_device)
-            elif device_type == bestway_device.AIRJET_V01:
-                return BestwayDeviceAirjet_V01(self, device_id, raw_device)
-            else:
-                raise bestway_exceptions.UnsupportedDevice()
+            return self._make_device(device_id, raw_device)
         else:
             raise bestway_exceptions.UnknownDevice(device_id)
 
+    def get_statuses(self, token, device_ids, max_workers=MAX_WORKERS):
+        """retrieve status of several devices in parallel
+           returns dict of device_id -> BestwayStatus, or the exception raised for that device
+           (e.g. DeviceOffline, UnsupportedDevice) so one failure does not fail the batch"""
+        import concurrent.futures  # only needed here; keeps start-up of the single-device scripts quick
+
+        results = {}
+        devices = {}
+        # resolved up front, against bindings re-downloaded at most once for the whole batch
+        bindings_error = None
+        if not all(self.__is_current(self._bindings.get(token.user_id, device_id)) for device_id in device_ids):
+            self.invalidate_bindings()
+            try:
+                self._bindings.update(token.user_id, self._get_devices(token))
+            except Exception as err:
+                bindings_error = err  # then every device fails, chained to it
+        for device_id in device_ids:
+            try:
+                if isinstance(bindings_error, bestway_exceptions.InvalidToken):
+                    raise bestway_exceptions.InvalidToken() from bindings_error  # callers act on its type
+                if bindings_error:
+                    raise bestway_exceptions.BindingsUnavailable(device_id) from bindings_error
+                devices[device_id] = self.get_device(token, device_id, refresh=False)
+            except Exception as err:
+                logging.warning(f"device {device_id}: {err}")
+                results[device_id] = err
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {device_id: executor.submit(device.get_status, token) for device_id, device in devices.items()}
+        for device_id, future in futures.items():
+            err = future.exception()
+            if err:
+                logging.warning(f"device {device_id}: {err}")
+                results[device_id] = err
+            else:
+                results[device_id] = future.result()
+        return {device_id: results[device_id] for device_id in device_ids}
+
+    def _make_device(self, device_id, raw_device):
+        if 'product_name' in raw_device:
+            device_type = raw_device['product_name']
+        else:
+            raise bestway_exceptions.UnsupportedDevice()
+        if ('is_online' in raw_device) & (raw_device['is_online']) == False:
+            raise bestway_exceptions.DeviceOffline()
+
+        if device_type == bestway_device.AIRJET:
+            return BestwayDeviceAirjet(self, device_id, raw_device)
+        elif device_type == bestway_device.AIRJET_V01:
+            return BestwayDeviceAirjet_V01(self, device_id, raw_device)
+        else:
+            raise bestway_exceptions.UnsupportedDevice()
+
     def send_controls(self, token, device_id, controls):
         logging.debug(f"controls: {controls}")
         logging.debug("sending controls")
@@ -115,19 +183,63 @@ class BestwayAPI:
         controls["attrs"][control] = value
         return controls
 
-    def _get(self, path, headers):
-        req = request.Request(f"{self.baseURL}{path}", headers=headers)  # GET
-        resp = request.urlopen(req)
-        content = resp.read()
+    def get_metrics(self) -> BestwayMetrics:
+        """per-endpoint request statistics"""
+        return self._metrics
+
+    def _get(self, path, headers, budget=READ):
+        content = self._request("GET", path, headers, None, budget)
         result = json.loads(content)
         return result
 
-    def _post(self, path, headers, data):
+    def _post(self, path, headers, data, budget=CONTROL):
         body_data = json.dumps(data).encode(ENCODING)
-        req = request.Request(f"{self.baseURL}{path}", headers=headers, data=body_data)  # POST
-        resp = request.urlopen(req)
-        content = resp.read()
+        content = self._request("POST", path, headers, body_data, budget)
         result = json.loads(content)
         return result
 
+    def _request(self, method, path, headers, body, budget):
+        endpoint = self._metrics.endpoint(path)
+        url = f"{self.baseURL}{path}"
+        bytes_out = len(body) if body else 0
+        in_requests = [0.0]  # time spent in HTTP attempts, as opposed to throttling/backoff
+
+        def attempt():
+            start = time.perf_counter()
+            try:
+                content = self._pool.request(method, url, headers, body)
+            except Exception as err:
+                elapsed = time.perf_counter() - start
+                in_requests[0] += elapsed
+                self._metrics.record(endpoint, elapsed, bytes_out, 0, err)
+                raise
+            elapsed = time.perf_counter() - start
+            in_requests[0] += elapsed
+            self._metrics.record(endpoint, elapsed, bytes_out, len(content))
+            return content
+
+        start = time.perf_counter()
+        try:
+            return self._throttle.call(budget, attempt, idempotent=method == "GET")
+        except urllib.error.HTTPError as err:
+            if get_error_code(err) == ERROR_TOKEN_INVALID:
+                raise bestway_exceptions.InvalidToken() from err
+            raise
+        finally:
+            self._metrics.record_wait(endpoint, time.perf_counter() - start - in_requests[0])
+
+    def __record_connect(self, elapsed, error):
+        self._metrics.record(CONNECT, elapsed, error=error)
+
+# -- ----------------------------------------------------------------------- --
+
+def get_error_code(err):
+    """Gizwits error_code from the JSON body of an HTTPError, or None; the body can still be read"""
+    try:
+        content = err.fp.read()
+        err.fp.seek(0)
+        return json.loads(content).get("error_code")
+    except (AttributeError, OSError, ValueError):
+        return None
+
 # -- ----------------------------------------------------------------------- --
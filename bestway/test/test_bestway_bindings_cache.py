@@ -0,0 +1,39 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from bestway.bestway_bindings_cache import BestwayBindingsCache
+
+DEVICES = [
+    {"did": "dev1", "product_name": "Airjet", "dev_alias": "Tub 1", "is_online": True},
+    {"did": "dev2", "product_name": "Airjet_V01", "dev_alias": "Tub 2", "is_online": True},
+]
+
+
+class TestBestwayBindingsCache(TestCase):
+    def test_lookup(self):
+        cache = BestwayBindingsCache()
+        self.assertIsNone(cache.get("uid", "dev1"))
+        cache.update("uid", DEVICES)
+        self.assertEqual(cache.get("uid", "dev2")["dev_alias"], "Tub 2")
+        self.assertIsNone(cache.get("uid", "dev3"))
+        self.assertIsNone(cache.get("other_uid", "dev1"))
+
+    def test_expiry(self):
+        cache = BestwayBindingsCache(ttl=-1)
+        cache.update("uid", DEVICES)
+        self.assertIsNone(cache.get("uid", "dev1"))
+
+    def test_invalidate(self):
+        cache = BestwayBindingsCache()
+        cache.update("uid", DEVICES)
+        cache.invalidate()
+        self.assertIsNone(cache.get("uid", "dev1"))
+
+    def test_persisted(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "bindings.json")
+            BestwayBindingsCache(filename).update("uid", DEVICES)
+            self.assertEqual(BestwayBindingsCache(filename).get("uid", "dev1")["dev_alias"], "Tub 1")
+            BestwayBindingsCache(filename).invalidate()
+            self.assertFalse(os.path.exists(filename))
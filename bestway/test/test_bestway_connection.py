@@ -0,0 +1,77 @@
+import socket
+import threading
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+import bestway.bestway_exceptions as bestway_exceptions
+from bestway.bestway_connection import BestwayConnectionPool
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    client_ports = []
+
+    def do_GET(self):
+        self.client_ports.append(self.client_address[1])
+        status = 404 if self.path == "/missing" else 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.path == "/drop":
+            # hang up without telling the client
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestBestwayConnectionPool(TestCase):
+    def setUp(self):
+        _Handler.client_ports = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        pool = BestwayConnectionPool()
+        self.assertEqual(pool.request("GET", f"{self.url}/a", {}), b'{"ok": true}')
+        self.assertEqual(pool.request("GET", f"{self.url}/b", {}), b'{"ok": true}')
+        pool.close()
+        self.assertEqual(len(set(_Handler.client_ports)), 1)
+
+    def test_reconnect_on_dropped_connection(self):
+        pool = BestwayConnectionPool()
+        pool.request("GET", f"{self.url}/drop", {})
+        self.assertEqual(pool.request("GET", f"{self.url}/a", {}), b'{"ok": true}')
+        pool.close()
+        self.assertEqual(len(set(_Handler.client_ports)), 2)
+
+    def test_idle_connection_evicted(self):
+        pool = BestwayConnectionPool(idle_timeout=-1)
+        pool.request("GET", f"{self.url}/a", {})
+        pool.request("GET", f"{self.url}/b", {})
+        pool.close()
+        self.assertEqual(len(set(_Handler.client_ports)), 2)
+
+    def test_http_error(self):
+        pool = BestwayConnectionPool()
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            pool.request("GET", f"{self.url}/missing", {})
+        self.assertEqual(context.exception.code, 404)
+
+    def test_connect_failed(self):
+        closed = socket.socket()
+        closed.bind(("127.0.0.1", 0))
+        port = closed.getsockname()[1]
+        closed.close()
+        pool = BestwayConnectionPool()
+        with self.assertRaises(bestway_exceptions.ConnectFailed):
+            pool.request("POST", f"http://127.0.0.1:{port}/a", {}, b"{}")
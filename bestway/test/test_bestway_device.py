@@ -0,0 +1,259 @@
+from unittest import TestCase
+
+import bestway.bestway_exceptions as bestway_exceptions
+import bestway.bestway_device_airjet as airjet
+import bestway.bestway_device_airjet_v01 as airjet_v01
+import bestway.bestway_device as bestway_device
+from bestway.bestway_device import BestwayCommand
+from bestway.bestway_device_airjet import BestwayStatusAirjet
+from bestway.bestway_device_airjet_v01 import BestwayStatusAirjet_V01
+from bestway.bestway_events import BestwayEventDispatcher, diff_snapshots
+
+AIRJET_ATTRS = {
+    "temp_now": 35, "temp_set": 38, "temp_set_unit": "摄氏", "filter_power": 1, "heat_power": 0,
+    "wave_power": 1, "locked": 0, "earth": 0, "heat_timer_min": 120, "heat_appm_min": 30,
+    "system_err1": 0, "system_err2": 1, "system_err3": 0,
+}
+AIRJET_V01_ATTRS = {
+    "Tnow": 36, "Tset": 40, "Tunit": 1, "filter": 2, "heat": 3,
+    "word0": 15, "word1": 90, "bit5": 0, "bit6": 1,
+}
+
+
+class TestBestwayStatusSnapshot(TestCase):
+    def test_airjet(self):
+        snapshot = BestwayStatusAirjet(AIRJET_ATTRS, 1234).get_snapshot()
+        self.assertEqual(snapshot.temp, 35)
+        self.assertEqual(snapshot.temp_unit, '°C')
+        self.assertEqual(snapshot.target_temp, 38)
+        self.assertTrue(snapshot.pump)
+        self.assertFalse(snapshot.heat)
+        self.assertTrue(snapshot.bubbles)
+        self.assertEqual(snapshot.timer_duration, 120)
+        self.assertEqual(snapshot.timer_delay, 30)
+        self.assertFalse(snapshot.locked)
+        self.assertEqual(snapshot.errors, (2,))
+        self.assertEqual(snapshot.updated_at, 1234)
+
+    def test_airjet_v01(self):
+        snapshot = BestwayStatusAirjet_V01(AIRJET_V01_ATTRS).get_snapshot()
+        self.assertEqual(snapshot.temp, 36)
+        self.assertTrue(snapshot.pump)
+        self.assertTrue(snapshot.heat)
+        self.assertIsNone(snapshot.bubbles)
+        self.assertEqual(snapshot.timer_duration, 90)
+        self.assertEqual(snapshot.timer_delay, 15)
+        self.assertTrue(snapshot.locked)
+
+    def test_matches_getters(self):
+        status = BestwayStatusAirjet_V01(AIRJET_V01_ATTRS)
+        snapshot = status.get_snapshot()
+        self.assertEqual(snapshot.temp, status.get_temp())
+        self.assertEqual(snapshot.temp_unit, status.get_temp_unit())
+        self.assertEqual(snapshot.pump, status.get_pump_is_on())
+        self.assertEqual(snapshot.heat, status.get_heat_is_on())
+
+    def test_immutable(self):
+        snapshot = BestwayStatusAirjet(AIRJET_ATTRS).get_snapshot()
+        with self.assertRaises(AttributeError):
+            snapshot.temp = 20
+        self.assertFalse(hasattr(snapshot, '__dict__'))
+        changed = snapshot.replace(temp=20)
+        self.assertEqual(changed.temp, 20)
+        self.assertEqual(snapshot.temp, 35)
+        self.assertNotEqual(snapshot, changed)
+
+    def test_missing_attribute(self):
+        with self.assertRaises(bestway_exceptions.UnsupportedDevice):
+            BestwayStatusAirjet({"temp_now": 30}).get_snapshot()
+
+
+class TestBestwayCodec(TestCase):
+    def test_encode_airjet(self):
+        command = BestwayCommand()
+        command.set_pump(True)
+        command.set_heat(False)
+        command.set_target_temp(39)
+        command.set_schedule(60, 120)
+        self.assertEqual(airjet.CODEC.encode(command), {"attrs": {
+            "filter_power": 1, "heat_power": 0, "temp_set": 39, "heat_appm_min": 60, "heat_timer_min": 120}})
+
+    def test_encode_airjet_v01(self):
+        command = BestwayCommand()
+        command.set_pump(True)
+        command.set_heat(True)
+        command.set_schedule(60, 120)
+        self.assertEqual(airjet_v01.CODEC.encode(command, airjet_v01.SWITCHES), {"attrs": {"filter": 2, "heat": 3}})
+        self.assertEqual(airjet_v01.CODEC.encode(command, ("timer_delay",)), {"attrs": {"word0": 60}})
+
+    def test_encode_unsupported(self):
+        command = BestwayCommand()
+        command.set_bubbles(True)
+        with self.assertRaises(bestway_exceptions.InvalidArgument):
+            airjet_v01.CODEC.encode(command)
+
+    def test_decode_batch(self):
+        raw_statuses = [dict(AIRJET_V01_ATTRS, Tnow=temp) for temp in range(30, 35)]
+        snapshots = airjet_v01.CODEC.decode_batch(raw_statuses, range(5))
+        self.assertEqual([snapshot.temp for snapshot in snapshots], list(range(30, 35)))
+        self.assertEqual([snapshot.updated_at for snapshot in snapshots], list(range(5)))
+
+
+class TestBestwayEvents(TestCase):
+    def setUp(self):
+        self.snapshot = BestwayStatusAirjet(AIRJET_ATTRS, 1).get_snapshot()
+        self.events = BestwayEventDispatcher()
+        self.fired = []
+
+    def record(self, event):
+        self.fired.append((event.field, event.old, event.new))
+
+    def test_diff(self):
+        changed = self.snapshot.replace(temp=36, heat=True, updated_at=2)
+        self.assertEqual(diff_snapshots(self.snapshot, changed), {'temp': (35, 36), 'heat': (False, True)})
+        self.assertEqual(diff_snapshots(self.snapshot, self.snapshot.replace(updated_at=2)), {})
+
+    def test_transition(self):
+        self.events.on_transition('heat', self.record, to=True)
+        self.events.on_change('pump', self.record)
+        self.events.update(self.snapshot)
+        self.events.update(self.snapshot.replace(heat=True))
+        self.events.update(self.snapshot.replace(heat=False))
+        self.assertEqual(self.fired, [('heat', False, True)])
+
+    def test_delta(self):
+        self.events.on_delta('temp', self.record, 2)
+        for temp in (35, 36, 37, 38, 39):
+            self.events.update(self.snapshot.replace(temp=temp))
+        self.assertEqual(self.fired, [('temp', 36, 37), ('temp', 38, 39)])
+
+    def test_timer_end(self):
+        self.events.on_timer_end('timer_delay', self.record)
+        for delay in (2, 1, 0, 0):
+            self.events.update(self.snapshot.replace(timer_delay=delay))
+        self.assertEqual(self.fired, [('timer_delay', 1, 0)])
+
+    def test_unknown_field(self):
+        with self.assertRaises(bestway_exceptions.InvalidArgument):
+            self.events.on_change('colour', self.record)
+
+
+class FakeSequencedDevice:
+    """reports posted controls after a number of status polls, or never; ignore: attributes it drops"""
+
+    def __init__(self, attrs, reflect_after=1, ignore=()):
+        self.attrs = dict(attrs)
+        self.reflect_after = reflect_after
+        self.ignore = ignore
+        self.polls = 0
+        self.pending = None
+
+    def _post_controls(self, token, controls):
+        self.pending = (self.polls + self.reflect_after, controls["attrs"])
+
+    def _get_raw_status(self, token, cached=True):
+        assert not cached, "confirmation must read the API, not the controls sent"
+        self.polls += 1
+        if self.pending and self.polls >= self.pending[0]:
+            self.attrs.update({attr: value for attr, value in self.pending[1].items() if attr not in self.ignore})
+            self.pending = None
+        return dict(self.attrs)
+
+
+class TestCommandSequencer(TestCase):
+    def sequencer(self, device):
+        return bestway_device.BestwayCommandSequencer(device, "token", poll_interval=0.001)
+
+    def test_confirmed(self):
+        device = FakeSequencedDevice(AIRJET_V01_ATTRS, reflect_after=3)
+        self.assertTrue(self.sequencer(device).send({"attrs": {"filter": 0}}, timeout=1))
+        self.assertEqual(device.polls, 3)  # moved on as soon as the tub reported the change
+
+    def test_timeout(self):
+        device = FakeSequencedDevice(AIRJET_V01_ATTRS, ignore=("filter",))
+        self.assertFalse(self.sequencer(device).send({"attrs": {"filter": 0}}, timeout=0.02))
+        self.assertGreater(device.polls, 1)
+
+    def test_not_waited_for(self):
+        device = FakeSequencedDevice(AIRJET_V01_ATTRS)
+        self.assertIsNone(self.sequencer(device).send({"attrs": {"filter": 0}}))
+        self.assertEqual(device.polls, 0)
+
+    def test_tolerance(self):
+        device = FakeSequencedDevice(dict(AIRJET_V01_ATTRS, word0=59), ignore=("word0",))
+        sequencer = self.sequencer(device)
+        self.assertTrue(sequencer.send({"attrs": {"word0": 60}}, timeout=0.02, tolerance={"word0": 1}))
+        self.assertFalse(sequencer.send({"attrs": {"word0": 60}}, timeout=0.02))
+
+
+class FakeApi:
+    """enough of BestwayAPI for a device to send controls and read them back; ignore: attributes it drops"""
+
+    def __init__(self, attrs, ignore=()):
+        self.attrs = dict(attrs)
+        self.ignore = ignore
+        self.sent = []
+        self.updated_at = 1000
+
+    def send_controls(self, token, device_id, controls):
+        self.sent.append(controls["attrs"])
+        self.attrs.update({attr: value for attr, value in controls["attrs"].items() if attr not in self.ignore})
+        self.updated_at += 1
+
+    def get_device_raw_info(self, token, device_id):
+        return {"did": device_id, "updated_at": self.updated_at, "attr": dict(self.attrs)}
+
+
+class TestAirjetV01SendControls(TestCase):
+    def setUp(self):
+        self.delays = airjet_v01.STOP_DELAY, airjet_v01.PROG_DELAY, airjet_v01.SETTLE_DELAY
+        airjet_v01.STOP_DELAY = airjet_v01.PROG_DELAY = airjet_v01.SETTLE_DELAY = 0.01
+
+    def tearDown(self):
+        airjet_v01.STOP_DELAY, airjet_v01.PROG_DELAY, airjet_v01.SETTLE_DELAY = self.delays
+
+    def send(self, api):
+        device = airjet_v01.BestwayDeviceAirjet_V01(api, "did", {"product_name": bestway_device.AIRJET_V01, "dev_alias": "tub"})
+        command = BestwayCommand()
+        command.set_pump(False)
+        command.set_schedule(60, 120)
+        return device.send_controls("token", command)
+
+    def test_confirmed(self):
+        api = FakeApi(AIRJET_V01_ATTRS)
+        self.assertTrue(self.send(api))
+        self.assertEqual(api.sent, [{"filter": 0}, {"word1": 120}, {"word0": 60}])
+
+    def test_unconfirmed(self):
+        self.assertFalse(self.send(FakeApi(AIRJET_V01_ATTRS, ignore=("word0",))))
+
+    def test_switches_only(self):
+        device = airjet_v01.BestwayDeviceAirjet_V01(FakeApi(AIRJET_V01_ATTRS), "did",
+                                                    {"product_name": bestway_device.AIRJET_V01, "dev_alias": "tub"})
+        command = BestwayCommand()
+        command.set_pump(False)
+        self.assertIsNone(device.send_controls("token", command))  # not waited for
+
+
+class TestChangedSince(TestCase):
+    def setUp(self):
+        self.api = FakeApi(AIRJET_ATTRS)
+        self.device = airjet.BestwayDeviceAirjet(self.api, "did", {"product_name": bestway_device.AIRJET, "dev_alias": "tub"})
+
+    def test_status_unchanged(self):
+        status = self.device.get_status(None)
+        self.assertEqual(status.get_updated_at(), 1000)
+        self.assertIsNone(self.device.get_status(None, since=status.get_updated_at()))
+        self.assertIsNone(self.device.get_snapshot(None, since=status.get_updated_at()))
+
+        self.api.attrs["temp_now"] = 36
+        self.api.updated_at += 1  # the tub reports again
+        status = self.device.get_status(None, since=status.get_updated_at())
+        self.assertEqual((status.get_updated_at(), status.get_temp()), (1001, 36))
+        snapshot = self.device.get_snapshot(None, since=1000)
+        self.assertEqual((snapshot.updated_at, snapshot.temp), (1001, 36))
+
+    def test_no_updated_at(self):
+        self.api.updated_at = None  # nothing to compare: never short-circuited
+        self.assertIsNotNone(self.device.get_status(None, since=1000))
+        self.assertIsNotNone(self.device.get_snapshot(None, since=1000))
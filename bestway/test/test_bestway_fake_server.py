@@ -0,0 +1,236 @@
+import asyncio
+from unittest import TestCase
+
+import bestway.bestway_device as bestway_device
+import bestway.bestway_exceptions as bestway_exceptions
+from bestway.bestwayapi import BestwayAPI
+from bestway.bestway_user_token import BestwayUserToken
+from bestway.bestway_async_api import BestwayAsyncAPI
+from bestway.bestway_fake_server import FakeGizwitsServer
+from bestway.bestway_throttle import BestwayThrottle, Budget, READ
+
+
+class TestFakeServer(TestCase):
+    def setUp(self):
+        self.fake = FakeGizwitsServer(airjet=2, airjet_v01=1).start()
+        self.api = BestwayAPI(self.fake.url)
+        self.token = self.api.get_user_token("user", "password")
+
+    def tearDown(self):
+        self.api.close()
+        self.fake.stop()
+
+    def test_status_and_control(self):
+        did = next(did for did, device in self.fake.devices.items() if device.product_name == bestway_device.AIRJET)
+        device = self.api.get_device(self.token, did)
+        status = device.get_status(self.token)
+        self.assertEqual(status.get_temp(), 30)
+        self.assertFalse(status.get_pump_is_on())
+
+        command = bestway_device.BestwayCommand()
+        command.set_pump(True)
+        device.send_controls(self.token, command)
+        self.assertTrue(device.get_status(self.token).get_pump_is_on())
+
+    def test_poll_events(self):
+        fake_device = next(device for device in self.fake.devices.values() if device.product_name == bestway_device.AIRJET)
+        device = self.api.get_device(self.token, fake_device.did)
+        fired = []
+        device.get_events().on_transition('heat', fired.append, to=True)
+        self.assertEqual(device.poll(self.token).temp, 30)
+
+        fake_device.control({"heat_power": 1})
+        fake_device.updated_at += 1
+        self.assertTrue(device.poll(self.token).heat)
+        self.assertEqual([(event.field, event.old, event.new) for event in fired], [('heat', False, True)])
+        self.assertTrue(device.poll(self.token).heat)  # unchanged: no new event
+        self.assertEqual(len(fired), 1)
+
+    def test_wait_for(self):
+        fake_device = next(device for device in self.fake.devices.values() if device.product_name == bestway_device.AIRJET)
+        device = self.api.get_device(self.token, fake_device.did)
+        polls = []
+
+        def predict(snapshot):
+            polls.append(snapshot.temp)
+            if len(polls) == 3:
+                fake_device.control({"temp_now": 31})
+                fake_device.updated_at += 1
+            return 0
+
+        snapshot = device.wait_for(self.token, lambda snapshot: snapshot.temp >= 31, predict, min_poll=0.01)
+        self.assertEqual(snapshot.temp, 31)
+        self.assertEqual(polls, [30, 30, 30])
+        self.assertIsNone(device.wait_for(self.token, lambda snapshot: False, timeout=0.05, max_poll=0.01))
+
+    def test_token_rejected(self):
+        did = next(iter(self.fake.devices))
+        self.fake.tokens.clear()  # e.g. the account logged in elsewhere
+        with self.assertRaises(bestway_exceptions.InvalidToken):
+            self.api.get_device_raw_info(self.token, did)
+
+        async def poll():
+            api = BestwayAsyncAPI(self.fake.url)
+            try:
+                return await api.get_device_raw_info(self.token, did)
+            finally:
+                await api.close()
+
+        with self.assertRaises(bestway_exceptions.InvalidToken):
+            asyncio.run(poll())
+
+    def test_local_state(self):
+        fake_device = next(device for device in self.fake.devices.values() if device.product_name == bestway_device.AIRJET)
+        device = self.api.get_device(self.token, fake_device.did)
+        command = bestway_device.BestwayCommand()
+        command.set_pump(True)
+        device.send_controls(self.token, command)
+        fake_device.attrs["filter_power"] = 0  # API yet to reflect the control
+        fake_device.updated_at -= 10
+        self.assertTrue(device.get_status(self.token).get_pump_is_on())
+        self.assertEqual(device._get_raw_status(self.token, cached=False)["filter_power"], 0)
+
+        fake_device.updated_at += 20  # newer report from the tub wins
+        self.assertFalse(device.get_status(self.token).get_pump_is_on())
+
+    def test_local_state_clock_skew(self):
+        fake_device = next(device for device in self.fake.devices.values() if device.product_name == bestway_device.AIRJET)
+        device = self.api.get_device(self.token, fake_device.did)
+        fake_device.updated_at += 3600  # the cloud's clock is an hour ahead of ours
+        reported = device.get_status(self.token).get_updated_at()
+        command = bestway_device.BestwayCommand()
+        command.set_pump(True)
+        device.send_controls(self.token, command)
+        fake_device.attrs["filter_power"] = 0  # API yet to reflect the control
+        fake_device.updated_at = reported
+        status = device.get_status(self.token)
+        self.assertTrue(status.get_pump_is_on())
+        self.assertEqual(status.get_updated_at(), reported)  # the API's time, untouched
+        self.assertIsNone(device.get_status(self.token, since=reported))  # no new report
+        self.assertFalse(device.get_status(self.token, cached=False).get_pump_is_on())
+        self.assertFalse(device.get_snapshot(self.token, cached=False).pump)
+
+        fake_device.updated_at = reported + 1  # the tub reports: its data wins
+        self.assertFalse(device.get_status(self.token).get_pump_is_on())
+
+    def test_bindings_cached(self):
+        for did in self.fake.devices:
+            self.api.get_device(self.token, did)
+        self.assertEqual(self.fake.counts["bindings"], 1)
+
+    def test_get_statuses(self):
+        offline = self.fake.add_device(bestway_device.AIRJET_V01, "offline", online=False)
+        dids = list(self.fake.devices) + ["nosuchdevice"]
+        statuses = self.api.get_statuses(self.token, dids)
+        self.assertEqual(list(statuses), dids)
+        self.assertIsInstance(statuses[offline.did], bestway_exceptions.DeviceOffline)
+        self.assertIsInstance(statuses["nosuchdevice"], bestway_exceptions.UnsupportedDevice)
+        for did in dids[:3]:
+            self.assertEqual(statuses[did].get_temp(), 30)
+        # offline and unknown devices cost one bindings download per call, not one each
+        self.assertEqual(self.fake.counts["bindings"], 1)
+        self.api.get_statuses(self.token, dids)
+        self.assertEqual(self.fake.counts["bindings"], 2)
+        self.api.get_statuses(self.token, dids[:3])  # all cached and online
+        self.assertEqual(self.fake.counts["bindings"], 2)
+
+    def test_get_statuses_bindings_error(self):
+        rejected = BestwayUserToken.from_values(self.token.user_id, "rejected", self.token.expiry)
+        dids = list(self.fake.devices)
+        statuses = self.api.get_statuses(rejected, dids)
+        errors = [statuses[did] for did in dids]
+        for err in errors:
+            self.assertIsInstance(err, bestway_exceptions.InvalidToken)
+            self.assertIs(err.__cause__, errors[0].__cause__)
+        self.assertEqual(len({id(err) for err in errors}), len(dids))  # not one instance re-raised for all
+        self.assertEqual(self.fake.counts["bindings"], 1)
+
+    def test_async_polling(self):
+        async def poll():
+            api = BestwayAsyncAPI(self.fake.url, concurrency=2)
+            try:
+                return await api.get_devices_raw_info(self.token, list(self.fake.devices))
+            finally:
+                await api.close()
+
+        results = asyncio.run(poll())
+        self.assertEqual(set(results), set(self.fake.devices))
+        for did, result in results.items():
+            self.assertEqual(result["did"], did)
+
+    def test_async_chunked(self):
+        fake = FakeGizwitsServer(airjet=2, airjet_v01=1, chunked=True).start()
+
+        async def poll():
+            api = BestwayAsyncAPI(fake.url, concurrency=1)  # one connection, re-used for every request
+            try:
+                token = await api.get_user_token("user", "password")
+                first = await api.get_devices_raw_info(token, list(fake.devices))
+                second = await api.get_devices_raw_info(token, list(fake.devices))
+                return first, second
+            finally:
+                await api.close()
+
+        try:
+            for results in asyncio.run(poll()):
+                self.assertEqual({did: result["did"] for did, result in results.items()},
+                                 {did: did for did in fake.devices})
+        finally:
+            fake.stop()
+
+    def test_async_event_loops(self):
+        api = BestwayAsyncAPI(self.fake.url, concurrency=2)
+        dids = list(self.fake.devices)
+
+        async def poll(close):
+            results = await api.get_devices_raw_info(self.token, dids)
+            if close: await api.close()
+            return results
+
+        # the idle connections of the first loop must not be re-used by the second
+        for close in (False, False, True):
+            results = asyncio.run(poll(close))
+            self.assertEqual([results[did]["did"] for did in dids], dids)
+
+    def test_async_status_line(self):
+        async def serve_and_get():
+            async def reply(reader, writer):
+                await reader.readuntil(b"\r\n\r\n")
+                writer.write(b"HTTP/1.1 200\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}")
+                await writer.drain()
+                writer.close()
+
+            server = await asyncio.start_server(reply, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            api = BestwayAsyncAPI(f"http://127.0.0.1:{port}")
+            try:
+                return await api.send_controls(self.token, "did", {"attrs": {}})
+            finally:
+                await api.close()
+                server.close()
+                await server.wait_closed()
+
+        self.assertIsNone(asyncio.run(serve_and_get()))  # no reason phrase after the status code
+
+    def test_metrics(self):
+        for did in self.fake.devices:
+            self.api.get_device(self.token, did).get_status(self.token)
+        stats = self.api.get_metrics().get_stats()
+        self.assertEqual(stats["login"]["count"], 1)
+        self.assertEqual(stats["bindings"]["count"], 1)
+        self.assertEqual(stats["devdata"]["count"], 3)
+        self.assertGreater(stats["devdata"]["bytes_in"], 0)
+        self.assertEqual(stats["connect"]["count"], 1)
+
+    def test_rate_limited(self):
+        fake = FakeGizwitsServer(airjet=1, airjet_v01=0, rate_limits={READ: (0.01, 1)}).start()
+        throttle = BestwayThrottle({READ: Budget(rate=100, burst=100, attempts=1, base_delay=0, max_delay=0)})
+        api = BestwayAPI(fake.url, throttle=throttle)
+        try:
+            token = api.get_user_token("user", "password")
+            api._get_devices(token)
+            with self.assertRaises(bestway_exceptions.RateLimited):
+                api._get_devices(token)
+        finally:
+            api.close()
+            fake.stop()
@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from bestway.bestway_bindings_cache import BestwayBindingsCache
+
+from bestway.bestway_fake_server import FakeGizwitsServer
+from bestway.bestway_fleet import BestwayFleet, FleetAccount, get_shard
+from bestway.bestway_token_store import BestwayTokenStore
+
+
+class TestBestwayFleet(TestCase):
+    def setUp(self):
+        self.fake = FakeGizwitsServer(airjet=4, airjet_v01=2).start()
+        dids = list(self.fake.devices)
+        self.accounts = [FleetAccount("site1", "user1", "password", tuple(dids[:3]), self.fake.url),
+                         FleetAccount("site2", "user2", "password", tuple(dids[3:]) + ("nosuchdevice",), self.fake.url)]
+
+    def tearDown(self):
+        self.fake.stop()
+
+    def test_shards(self):
+        fleet = BestwayFleet(self.accounts, workers=3)
+        shards = fleet.get_shards()
+        self.assertEqual(sum(len(shard) for shard in shards), 7)
+        for shard in shards:
+            self.assertEqual(len({get_shard(device_id, 3) for account, device_id in shard}), 1)
+
+    def test_poll_once(self):
+        fleet = BestwayFleet(self.accounts, workers=3)
+        results = fleet.poll_once()
+        fleet.stop()
+        self.assertEqual(len(results), 7)
+        self.assertIsNotNone(results[("site2", "nosuchdevice")].error)
+        for did in self.fake.devices:
+            status = next(status for status in results.values() if status.device_id == did)
+            self.assertEqual(status.snapshot.temp, 30)
+        self.assertEqual(self.fake.counts["login"], 2)  # one login per account, however many workers
+
+    def test_dump_metrics(self):
+        fleet = BestwayFleet(self.accounts, workers=3)
+        fleet.poll_once()
+        fleet.stop()
+        with tempfile.TemporaryDirectory() as tempdir:
+            filename = os.path.join(tempdir, "metrics.json")
+            fleet.dump_metrics(filename)
+            with open(filename) as json_data:
+                stats = json.load(json_data)
+        self.assertEqual(set(stats), {"site1", "site2"})
+        for account in stats.values():
+            self.assertEqual(sum(worker["login"]["count"] for worker in account.values() if "login" in worker), 1)
+
+    def test_poll_once_persisted(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            accounts = [account._replace(device_ids=tuple(did for did in account.device_ids if did in self.fake.devices))
+                        for account in self.accounts]
+
+            def make_fleet():
+                names = [account.name for account in accounts]
+                return BestwayFleet(accounts, workers=3,
+                                    token_stores={name: BestwayTokenStore(os.path.join(tempdir, f"token_{name}.json"))
+                                                  for name in names},
+                                    bindings_caches={name: BestwayBindingsCache(os.path.join(tempdir, f"bindings_{name}.json"))
+                                                     for name in names})
+            for run in range(3):  # e.g. from cron, each a new process
+                fleet = make_fleet()
+                results = fleet.poll_once()
+                fleet.stop()
+                self.assertEqual(len([status for status in results.values() if status.snapshot]), 6)
+        # first run only: one login, and one bindings download, per account
+        self.assertEqual(self.fake.counts["login"], 2)
+        self.assertEqual(self.fake.counts["bindings"], 2)
+
+    def test_stream(self):
+        fleet = BestwayFleet(self.accounts[:1], workers=2, interval=60).start()
+        seen = set()
+        for status in fleet.statuses():
+            seen.add(status.device_id)
+            if len(seen) == 3: break
+        fleet.stop()
+        self.assertEqual(seen, set(self.accounts[0].device_ids))
@@ -0,0 +1,130 @@
+import email.message
+import urllib.error
+from unittest import TestCase
+
+import bestway.bestway_exceptions as bestway_exceptions
+from bestway.bestway_throttle import TokenBucket, RetryPolicy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def http_error(code, retry_after=None):
+    headers = email.message.Message()
+    if retry_after is not None: headers["Retry-After"] = str(retry_after)
+    return urllib.error.HTTPError("/", code, "error", headers, None)
+
+
+class TestTokenBucket(TestCase):
+    def test_burst_then_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=3, clock=clock, sleep=clock.sleep)
+        for i in range(3):
+            self.assertEqual(bucket.acquire(), 0)
+        self.assertAlmostEqual(bucket.acquire(), 0.5)
+        self.assertAlmostEqual(bucket.acquire(), 0.5)
+
+    def test_pause(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, burst=5, clock=clock, sleep=clock.sleep)
+        bucket.pause(10)
+        self.assertAlmostEqual(bucket.acquire(), 10)
+
+
+class TestRetryPolicy(TestCase):
+    def test_delays(self):
+        policy = RetryPolicy(attempts=5, base_delay=1, max_delay=5)
+        delays = list(policy.delays())
+        self.assertEqual(len(delays), 4)
+        for delay in delays:
+            self.assertTrue(1 <= delay <= 5)
+
+    def test_equal_jitter_delays(self):
+        policy = RetryPolicy(attempts=7, base_delay=5, max_delay=60, equal_jitter=True)
+        for delay, cap in zip(policy.delays(), [10, 20, 40, 60, 60, 60]):
+            self.assertTrue(cap / 2 <= delay <= cap)
+
+    def test_retry_then_succeed(self):
+        clock = FakeClock()
+        policy = RetryPolicy(attempts=3, base_delay=1, max_delay=4, sleep=clock.sleep)
+        results = [http_error(503), ConnectionResetError(), "ok"]
+
+        def function():
+            result = results.pop(0)
+            if isinstance(result, Exception): raise result
+            return result
+
+        self.assertEqual(policy.call(function), "ok")
+        self.assertEqual(len(clock.sleeps), 2)
+
+    def test_no_retry_on_client_error(self):
+        policy = RetryPolicy(attempts=3, base_delay=1, max_delay=4)
+        calls = []
+
+        def function():
+            calls.append(1)
+            raise http_error(404)
+
+        with self.assertRaises(urllib.error.HTTPError):
+            policy.call(function)
+        self.assertEqual(len(calls), 1)
+
+    def test_retry_after_honoured(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10, burst=10, clock=clock, sleep=clock.sleep)
+        policy = RetryPolicy(attempts=2, base_delay=1, max_delay=2, sleep=clock.sleep)
+        results = [http_error(429, retry_after=7), "ok"]
+
+        def function():
+            result = results.pop(0)
+            if isinstance(result, Exception): raise result
+            return result
+
+        self.assertEqual(policy.call(function, bucket), "ok")
+        self.assertAlmostEqual(sum(clock.sleeps), 7)
+
+    def test_rate_limited(self):
+        clock = FakeClock()
+        policy = RetryPolicy(attempts=2, base_delay=1, max_delay=2, sleep=clock.sleep)
+
+        def function():
+            raise http_error(429, retry_after=3)
+
+        with self.assertRaises(bestway_exceptions.RateLimited):
+            policy.call(function)
+
+    def test_post_not_retried(self):
+        policy = RetryPolicy(attempts=3, base_delay=1, max_delay=4, sleep=lambda seconds: None)
+        for error in (http_error(503), ConnectionResetError(), TimeoutError()):
+            calls = []
+
+            def function():
+                calls.append(1)
+                raise error
+
+            with self.assertRaises(type(error)):
+                policy.call(function, idempotent=False)
+            self.assertEqual(len(calls), 1)
+
+    def test_post_retried_if_unsent(self):
+        clock = FakeClock()
+        policy = RetryPolicy(attempts=3, base_delay=1, max_delay=4, sleep=clock.sleep)
+        results = [http_error(429), bestway_exceptions.ConnectFailed("host", "refused"), "ok"]
+
+        def function():
+            result = results.pop(0)
+            if isinstance(result, Exception): raise result
+            return result
+
+        self.assertEqual(policy.call(function, idempotent=False), "ok")
+        self.assertEqual(len(clock.sleeps), 2)
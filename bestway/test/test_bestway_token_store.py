@@ -0,0 +1,76 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from bestway.bestway_user_token import BestwayUserToken
+from bestway.bestway_token_store import BestwayTokenStore
+
+
+class FakeAPI:
+    def __init__(self, lifetime=7 * 24 * 60 * 60):
+        self.lifetime = lifetime
+        self.logins = 0
+        self.lock = threading.Lock()
+
+    def get_user_token(self, username, password):
+        with self.lock:
+            self.logins += 1
+            count = self.logins
+        time.sleep(0.1)  # slow login widens the race
+        return BestwayUserToken.from_values("uid", f"tkn{count}", int(time.time()) + self.lifetime)
+
+
+class TestBestwayTokenStore(TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.folder.name, "token.json")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_initial_token_used(self):
+        api = FakeAPI()
+        initial = {"user_id": "uid", "user_token": "cfg", "expiry": int(time.time()) + 86400}
+        token = BestwayTokenStore(self.filename).get_token(api, "user", "password", initial)
+        self.assertEqual(token.user_token, "cfg")
+        self.assertEqual(api.logins, 0)
+        self.assertEqual(BestwayTokenStore(self.filename).read().user_token, "cfg")
+
+    def test_single_flight_login(self):
+        api = FakeAPI()
+        expired = {"user_id": "uid", "user_token": "old", "expiry": 99}
+        tokens = []
+
+        def worker():
+            # separate store objects behave like separate processes
+            tokens.append(BestwayTokenStore(self.filename).get_token(api, "user", "password", expired))
+
+        threads = [threading.Thread(target=worker) for i in range(5)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(api.logins, 1)
+        self.assertEqual({token.user_token for token in tokens}, {"tkn1"})
+
+    def test_early_refresh(self):
+        api = FakeAPI()
+        expiring = {"user_id": "uid", "user_token": "old", "expiry": int(time.time()) + 60}
+        token = BestwayTokenStore(self.filename, refresh_margin=600).get_token(api, "user", "password", expiring)
+        self.assertEqual(token.user_token, "tkn1")
+        self.assertEqual(api.logins, 1)
+
+    def test_single_flight_after_rejection(self):
+        api = FakeAPI()
+        rejected = {"user_id": "uid", "user_token": "old", "expiry": int(time.time()) + 86400}
+        stale = BestwayTokenStore(self.filename).get_token(api, "user", "password", rejected)
+        tokens = []
+
+        def worker():
+            tokens.append(BestwayTokenStore(self.filename).get_token(api, "user", "password", stale=stale))
+
+        threads = [threading.Thread(target=worker) for i in range(5)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(api.logins, 1)
+        self.assertEqual({token.user_token for token in tokens}, {"tkn1"})
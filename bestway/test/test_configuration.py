@@ -0,0 +1,35 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from configuration import Configuration, DEFAULT_CONFIG
+
+
+class TestConfiguration(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "configuration.json")
+        Configuration({"username": "user", "password": "password", "did": "did1"}).toFile(self.filename)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_update_keeps_other_changes(self):
+        # two scripts read the configuration, then each saves its own key
+        log_cfg = Configuration.fromFile(self.filename)
+        heat_cfg = Configuration.fromFile(self.filename)
+        Configuration.update(self.filename, {"log_updated_at": 1700000000})
+        Configuration.update(self.filename, {"thermal": {"heat_rate": 40}})
+        with open(self.filename) as json_data:
+            saved = json.load(json_data)
+        self.assertEqual(saved, {"username": "user", "password": "password", "did": "did1",
+                                 "log_updated_at": 1700000000, "thermal": {"heat_rate": 40}})
+        self.assertIsNone(log_cfg['thermal'])
+        self.assertIsNone(heat_cfg['log_updated_at'])
+
+    def test_update_new_file(self):
+        filename = os.path.join(self.directory.name, "new.json")
+        Configuration.update(filename, {"log_updated_at": 1})
+        self.assertEqual(Configuration.fromFile(filename)['log_updated_at'], 1)
+        self.assertNotIn("log_updated_at", DEFAULT_CONFIG)
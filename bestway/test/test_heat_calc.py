@@ -42,4 +42,84 @@ class TestHeatCalc(TestCase):
                     self.assertAlmostEqual(al_heating.start_time, time_left, delta=STEP_RATE)
             else:
                 self.assertAlmostEqual(it_heating.start_time, al_heating.start_time, delta=STEP_RATE)
-                self.assertAlmostEqual(it_heating.time_to_heat, al_heating.time_to_heat, delta=STEP_RATE)
\ No newline at end of file
+                self.assertAlmostEqual(it_heating.time_to_heat, al_heating.time_to_heat, delta=STEP_RATE)
+
+class TestHeatPredictor(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.predict = tub_utils.HeatPredictor(38, 45, clock=lambda: self.now)
+
+    def snapshot(self, temp):
+        return type("Snapshot", (), {"temp": temp})()
+
+    def test_model_rate(self):
+        # unknown phase within the first degree: assume half way through it
+        self.assertEqual(self.predict(self.snapshot(35)), 2.5 * 45 * 60)
+        self.now = 600
+        self.assertEqual(self.predict(self.snapshot(35)), 2.5 * 45 * 60 - 600)
+
+    def test_late_phase(self):
+        self.assertEqual(self.predict(self.snapshot(37)), 45 * 60 / 2)
+        self.now = 45 * 60 / 2 + 60  # no rise when expected: the degree began at the first poll at the latest
+        self.assertEqual(self.predict(self.snapshot(37)), 45 * 60 / 2 - 60)
+        self.now = 45 * 60 + 60  # overdue even then
+        self.assertEqual(self.predict(self.snapshot(37)), -60)
+
+    def test_observed_rate(self):
+        self.predict(self.snapshot(35))
+        self.now = 1000
+        self.predict(self.snapshot(35))
+        self.now = 1500  # reached 36 at the earliest just after the previous poll
+        self.assertEqual(self.predict(self.snapshot(36)), 2 * 45 * 60 - 500)
+        self.now = 3000
+        self.predict(self.snapshot(36))
+        self.now = 3300  # 2000s for the last degree observed
+        self.assertEqual(self.predict(self.snapshot(37)), 2000 - 300)
+
+
+class TestHeatCalcNewton(TestCase):
+    def simulate(self, start_temp, cool_rate, heat_rate, time_left, ambient_temp, heating):
+        """step the Newton model minute by minute through a planned heating"""
+        k = 1.0 / (cool_rate * tub_utils.REF_DELTA)
+        power = 1.0 / heat_rate + k * tub_utils.REF_DELTA
+        temp = float(start_temp)
+        for minute in range(int(time_left) * 10):
+            on = heating.start_time is not None and minute / 10 >= heating.start_time
+            temp += ((power if on else 0) - k * (temp - ambient_temp)) / 10
+        return temp
+
+    def test_matches_linear_at_reference(self):
+        # with the water REF_DELTA above ambient, the exponential model is close to the linear one
+        ambient = 37 - tub_utils.REF_DELTA
+        newton = tub_utils.CalcHeatTime_newton(36, 38, 350, 40, 9.5 * 60, ambient_temp=ambient)
+        linear = tub_utils.CalcHeatTime_algebra(36, 38, 350, 40, 9.5 * 60)
+        self.assertAlmostEqual(newton.time_to_heat, linear.time_to_heat, delta=STEP_RATE)
+        self.assertEqual(newton.start_time + newton.time_to_heat, 9.5 * 60)
+
+    def test_colder_needs_longer(self):
+        mild = tub_utils.CalcHeatTime_newton(36, 38, 300, 45, 9.5 * 60, ambient_temp=15)
+        cold = tub_utils.CalcHeatTime_newton(36, 38, 300, 45, 9.5 * 60, ambient_temp=-5)
+        self.assertGreater(cold.time_to_heat, mild.time_to_heat)
+
+    def test_reaches_target(self):
+        for i in range(100):
+            start_temp = randint(25, 38)
+            target_temp = randint(30, 40)
+            cool_rate = randint(160, 400)
+            heat_rate = randint(30, 60)
+            ambient_temp = randint(-5, 25)
+            time_left = 9.5 * 60
+            heating = tub_utils.CalcHeatTime_newton(start_temp, target_temp, cool_rate, heat_rate, time_left, ambient_temp)
+            end_temp = self.simulate(start_temp, cool_rate, heat_rate, time_left, ambient_temp, heating)
+            one_minute = 1.0 / heat_rate  # heating is rounded up to whole minutes
+            if heating.start_time is None:
+                self.assertGreaterEqual(end_temp, target_temp - 0.01)
+            elif heating.time_to_heat < tub_utils.ECO_MINS:
+                self.assertGreaterEqual(end_temp, target_temp - 0.01)
+                self.assertLessEqual(end_temp, target_temp + one_minute + 0.01)
+            else:
+                self.assertLessEqual(end_temp, target_temp + one_minute + 0.01)  # capped: as close as Economy 7 allows
+
+    def test_no_heating_needed(self):
+        self.assertEqual(tub_utils.CalcHeatTime_newton(40, 36, 300, 45, 9.5 * 60, ambient_temp=10),
+                         tub_utils.tub_heating(None, None))
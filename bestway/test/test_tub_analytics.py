@@ -0,0 +1,69 @@
+import datetime
+import os
+import tempfile
+from unittest import TestCase
+
+import tub_history
+from tub_analytics import Reading, readings, time_filter, resample, moving_average, heater_episodes
+from tub_history import TubSample
+
+START = datetime.datetime(2024, 1, 1)
+# two hours of minute samples: heater on from 0:10 to 0:40 (warming 1 degree per 10 minutes), then off
+SAMPLES = [TubSample(int(START.timestamp()) + 60 * i, 30 + min(max(i - 10, 0), 30) // 10, True, 10 <= i < 40)
+           for i in range(120)]
+
+
+def reading(minute, temp, heat=False, pump=True):
+    return Reading(START + datetime.timedelta(minutes=minute), temp, pump, heat)
+
+
+class TestTubAnalytics(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "tub_log.csv")
+        with tub_history.open_writer(self.filename) as writer:
+            for sample in SAMPLES: writer.append(sample)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_readings(self):
+        all_readings = list(readings(self.filename))
+        self.assertEqual(len(all_readings), 120)
+        self.assertEqual(all_readings[10], reading(10, 30.0, heat=True))
+        self.assertIsInstance(all_readings[10].temp, float)
+        ranged = list(readings(self.filename, START + datetime.timedelta(minutes=30), START.timestamp() + 40 * 60))
+        self.assertEqual(ranged, all_readings[30:40])
+
+    def test_time_filter(self):
+        stream = readings(self.filename)
+        self.assertEqual([r.time.minute for r in time_filter(stream, START + datetime.timedelta(minutes=5),
+                                                             START + datetime.timedelta(minutes=8))], [5, 6, 7])
+        self.assertEqual(next(stream).time.minute, 9)  # stopped reading at the end of the range
+
+    def test_resample(self):
+        resampled = list(resample(readings(self.filename), datetime.timedelta(minutes=30)))
+        self.assertEqual([r.time for r in resampled], [START + datetime.timedelta(minutes=30 * i) for i in range(4)])
+        self.assertEqual([r.heat for r in resampled], [True, True, False, False])
+        self.assertAlmostEqual(resampled[1].temp, (10 * 32 + 20 * 33) / 30)  # minutes 30-59
+        gappy = [reading(0, 30), reading(1, None), reading(25, 32)]
+        self.assertEqual(list(resample(gappy, 600)), [reading(0, 30.0), reading(20, 32.0)])
+
+    def test_moving_average(self):
+        temps = [r.temp for r in moving_average([reading(i, t) for i, t in enumerate([30, 32, None, 34, 36])], 2)]
+        self.assertEqual(temps, [30, 31, 31, 33, 35])
+
+    def test_heater_episodes(self):
+        episodes = list(heater_episodes(readings(self.filename)))
+        self.assertEqual(len(episodes), 1)
+        episode = episodes[0]
+        self.assertEqual((episode.start, episode.end), (START + datetime.timedelta(minutes=10),
+                                                        START + datetime.timedelta(minutes=40)))
+        self.assertEqual((episode.start_temp, episode.end_temp, episode.samples), (30, 33, 30))
+        self.assertEqual(episode.get_rate(), 6)
+
+    def test_heater_episode_gap(self):
+        stream = [reading(0, 30, heat=True), reading(5, 31, heat=True), reading(60, 35, heat=True), reading(61, 35)]
+        episodes = list(heater_episodes(stream, max_gap=datetime.timedelta(minutes=15)))
+        self.assertEqual([(e.start, e.end, e.samples) for e in episodes],
+                         [(reading(0, 0).time, reading(5, 0).time, 2), (reading(60, 0).time, reading(61, 0).time, 1)])
@@ -0,0 +1,59 @@
+import random
+from unittest import TestCase, skipUnless
+
+import tub_calibration
+from tub_calibration import calibrate, segments, fit_slope, HEAT, COOL
+from tub_history import TubSample
+
+HEAT_RATE = 40  # minutes per degree
+COOL_RATE = 250
+
+
+def simulate(days=3, seed=1):
+    """a tub heated each night from 01:00 to a 38 degree target, logged each minute as whole degrees"""
+    rng = random.Random(seed)
+    samples = []
+    temp = 36.0
+    for minute in range(days * 24 * 60):
+        heat = 60 <= minute % (24 * 60) < 8 * 60
+        if heat:
+            temp = min(temp + 1 / HEAT_RATE, 38.0)  # thermostat holds the target
+        else:
+            temp -= 1 / COOL_RATE
+        if rng.random() < 0.01: continue  # a missed poll
+        samples.append(TubSample(1700000000 + 60 * minute, int(temp + rng.uniform(-0.3, 0.3) + 0.5), True, heat))
+    return samples
+
+
+class TestTubCalibration(TestCase):
+    def test_segments(self):
+        found = list(segments(simulate()))
+        self.assertEqual([segment.kind for segment in found[:3]], [HEAT, COOL, HEAT])  # the first hour is too short
+        heating = found[0]
+        self.assertLess(heating.minutes[-1], 7 * 60)  # plateau at the target dropped
+
+    def test_gap_splits(self):
+        samples = [TubSample(60 * i, 30, False, False) for i in range(200)]
+        samples += [TubSample(60 * i, 30, False, False) for i in range(300, 600)]
+        self.assertEqual([len(segment.minutes) for segment in segments(samples)], [200, 300])
+
+    def test_calibrate(self):
+        calibration = calibrate(simulate(days=10))
+        self.assertAlmostEqual(calibration.heat_rate, HEAT_RATE, delta=HEAT_RATE * 0.1)
+        self.assertAlmostEqual(calibration.cool_rate, COOL_RATE, delta=COOL_RATE * 0.1)
+        self.assertEqual(calibration.heat_segments, 10)
+
+    def test_insufficient(self):
+        calibration = calibrate(TubSample(60 * i, 30, False, False) for i in range(100))
+        self.assertEqual((calibration.heat_rate, calibration.cool_rate), (None, None))
+
+    @skipUnless(tub_calibration.numpy, "NumPy not installed")
+    def test_numpy_matches_python(self):
+        found = [segment for segment in segments(simulate()) if segment.kind == COOL]
+        numpy_slope = fit_slope(found)
+        numpy = tub_calibration.numpy
+        try:
+            tub_calibration.numpy = None
+            self.assertAlmostEqual(fit_slope(found), numpy_slope)
+        finally:
+            tub_calibration.numpy = numpy
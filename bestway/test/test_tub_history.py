@@ -0,0 +1,218 @@
+import json
+import logging
+import os
+import tempfile
+from unittest import TestCase
+
+import tub_history
+from tub_history import TubSample
+from tub_history_binary import BinaryHistory, BinaryHistoryWriter, HEADER, RECORD
+from tub_history_index import CsvHistoryReader, open_reader
+from tub_history_sqlite import SqliteHistory, SqliteHistoryWriter
+
+SAMPLES = [TubSample(1700000000 + 60 * i, 30 + i % 5, i % 2 == 0, i % 3 == 0) for i in range(100)]
+
+
+class TestTubHistory(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def filename(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_csv_round_trip(self):
+        filename = self.filename("log.csv")
+        with tub_history.open_writer(filename, tub_history.CSV) as writer:
+            for sample in SAMPLES: writer.append(sample)
+        with tub_history.open_writer(filename, tub_history.CSV) as writer:  # append, header kept
+            writer.append(SAMPLES[0])
+        self.assertEqual(list(tub_history.read_csv(filename)), SAMPLES + SAMPLES[:1])
+
+    def test_binary_round_trip(self):
+        filename = self.filename("log.bin")
+        with tub_history.open_writer(filename, tub_history.BINARY) as writer:
+            writer.extend(SAMPLES[:50])
+        with BinaryHistoryWriter(filename) as writer:
+            for sample in SAMPLES[50:]: writer.append(sample)
+            writer.append(TubSample(1800000000, None, False, True))
+        self.assertEqual(os.path.getsize(filename), HEADER.size + 101 * RECORD.size)
+        with BinaryHistory(filename) as history:
+            self.assertEqual(len(history), 101)
+            self.assertEqual(list(history)[:100], SAMPLES)
+            self.assertEqual(history[-1], TubSample(1800000000, None, False, True))
+            self.assertEqual(history[10:13], SAMPLES[10:13])
+            self.assertEqual(len(history.records(10, 13)), 3 * RECORD.size)
+            self.assertEqual(history.time_at(5), SAMPLES[5].time)
+
+    def test_incomplete_record(self):
+        filename = self.filename("log.bin")
+        with BinaryHistoryWriter(filename) as writer:
+            writer.extend(SAMPLES[:3])
+        with open(filename, 'ab') as history_file:
+            history_file.write(b'\x01\x02')  # interrupted write
+        with BinaryHistory(filename) as history:
+            self.assertEqual(len(history), 3)
+        with BinaryHistoryWriter(filename) as writer:
+            writer.append(SAMPLES[3])
+        with BinaryHistory(filename) as history:
+            self.assertEqual(list(history), SAMPLES[:4])
+
+    def test_empty_file(self):
+        filename = self.filename("log.bin")
+        open(filename, 'wb').close()  # created, header not yet written
+        with BinaryHistory(filename) as history:
+            self.assertEqual(len(history), 0)
+            self.assertEqual(list(history.between(0, float('inf'))), [])
+            self.assertIsNone(history.latest_before(SAMPLES[0].time))
+        with BinaryHistoryWriter(filename) as writer:
+            writer.append(SAMPLES[0])
+        with BinaryHistory(filename) as history:
+            self.assertEqual(list(history), SAMPLES[:1])
+
+    def test_not_history(self):
+        filename = self.filename("log.csv")
+        with open(filename, 'w') as text_file:
+            text_file.write("TIME,TEMP_C,FILTER,HEAT\n")
+        with self.assertRaises(ValueError):
+            BinaryHistory(filename)
+
+
+class TestHistoryIndex(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.csv_filename = os.path.join(self.directory.name, "log.csv")
+        self.bin_filename = os.path.join(self.directory.name, "log.bin")
+        with tub_history.open_writer(self.csv_filename, tub_history.CSV) as writer:
+            for sample in SAMPLES: writer.append(sample)
+        with BinaryHistoryWriter(self.bin_filename) as writer:
+            writer.extend(SAMPLES)
+        self.db_filename = os.path.join(self.directory.name, "log.db")
+        with tub_history.open_writer(self.db_filename, tub_history.SQLITE, "tub1") as writer:
+            writer.extend(SAMPLES)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def check_queries(self, reader):
+        start = SAMPLES[0].time
+        self.assertEqual(list(reader.between(start + 60 * 20 - 1, start + 60 * 30)), SAMPLES[20:30])
+        self.assertEqual(list(reader.between(start - 600, start + 60)), SAMPLES[:1])
+        self.assertEqual(list(reader.between(start + 60 * 200, start + 60 * 300)), [])
+        self.assertEqual(reader.latest_before(start + 60 * 40 + 30), SAMPLES[40])
+        self.assertEqual(reader.latest_before(start + 60 * 41), SAMPLES[41])
+        self.assertEqual(reader.latest_before(start + 60 * 1000), SAMPLES[-1])
+        self.assertIsNone(reader.latest_before(start - 1))
+
+    def test_csv(self):
+        with CsvHistoryReader(self.csv_filename, every=8) as reader:
+            self.check_queries(reader)
+
+    def test_binary(self):
+        with open_reader(self.bin_filename) as reader:
+            self.check_queries(reader)
+
+    def test_sqlite(self):
+        with open_reader(self.db_filename) as reader:
+            self.assertEqual(reader.device, "tub1")
+            self.assertEqual(len(reader), 100)
+            self.check_queries(reader)
+
+    def read_index(self):
+        with open(f"{self.csv_filename}.idx") as json_data:
+            return json.load(json_data)
+
+    def test_incremental(self):
+        CsvHistoryReader(self.csv_filename, every=8)
+        saved = self.read_index()
+        self.assertEqual(saved['count'], 100)
+        later = TubSample(SAMPLES[-1].time + 60, 40, True, True)
+        with tub_history.open_writer(self.csv_filename, tub_history.CSV) as writer:
+            writer.append(later)
+        with self.assertLogs(level=logging.DEBUG) as logs:
+            with CsvHistoryReader(self.csv_filename, every=8) as reader:
+                self.assertEqual(len(reader), 101)
+                self.assertEqual(reader.latest_before(later.time), later)
+                self.assertEqual(list(reader.between(SAMPLES[20].time, SAMPLES[30].time)), SAMPLES[20:30])
+        # the saved index is extended by the one new record, not rebuilt
+        self.assertIn("indexed 1 new records", "\n".join(logs.output))
+        self.assertNotIn("rebuilding", "\n".join(logs.output))
+        extended = self.read_index()
+        self.assertEqual(extended['count'], 101)
+        self.assertEqual(extended['size'], os.path.getsize(self.csv_filename))
+        self.assertGreater(extended['size'], saved['size'])
+        self.assertEqual(extended['offsets'][:len(saved['offsets'])], saved['offsets'])
+
+    def test_partial_record(self):
+        with open(self.csv_filename, 'a') as csvfile:
+            csvfile.write("2023-11-14T2")  # being written
+        with CsvHistoryReader(self.csv_filename, every=8) as reader:
+            self.assertEqual(len(reader), 100)
+            self.assertEqual(list(reader.between(0, float('inf'))), SAMPLES)
+            self.assertEqual(reader.latest_before(SAMPLES[-1].time + 120), SAMPLES[-1])
+            self.assertEqual(reader.offset_of(SAMPLES[-1].time + 60), self.read_index()['size'])
+
+    def rewrite_csv(self, samples):
+        os.remove(self.csv_filename)
+        with tub_history.open_writer(self.csv_filename, tub_history.CSV) as writer:
+            for sample in samples: writer.append(sample)
+
+    def test_truncated(self):
+        CsvHistoryReader(self.csv_filename, every=8)
+        self.rewrite_csv(SAMPLES[50:])  # e.g. compacted
+        with self.assertLogs(level=logging.INFO) as logs:
+            with CsvHistoryReader(self.csv_filename, every=8) as reader:
+                self.assertEqual(len(reader), 50)
+                self.assertEqual(list(reader.between(0, float('inf'))), SAMPLES[50:])
+        self.assertIn("rebuilding index", "\n".join(logs.output))
+        self.assertEqual(self.read_index()['count'], 50)
+
+    def test_replaced(self):
+        CsvHistoryReader(self.csv_filename, every=8)
+        replacement = [sample._replace(time=sample.time + 30) for sample in SAMPLES] + SAMPLES[-1:]
+        self.rewrite_csv(replacement)  # no smaller than before, but the indexed records have moved
+        with self.assertLogs(level=logging.INFO) as logs:
+            with CsvHistoryReader(self.csv_filename, every=8) as reader:
+                self.assertEqual(len(reader), 101)
+                self.assertEqual(list(reader.between(SAMPLES[10].time, SAMPLES[12].time)), replacement[10:12])
+        self.assertIn("rebuilding index", "\n".join(logs.output))
+
+
+class TestSqliteHistory(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "log.db")
+        self.now = 0
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_batches(self):
+        with SqliteHistoryWriter(self.filename, "tub1", batch_size=10, batch_age=60, clock=lambda: self.now) as writer:
+            writer.extend(SAMPLES[:9])
+            with SqliteHistory(self.filename, "tub1") as history:
+                self.assertEqual(len(history), 0)  # not yet committed
+                writer.append(SAMPLES[9])
+                self.assertEqual(len(history), 10)
+                writer.append(SAMPLES[10])
+                self.now = 60  # the oldest buffered sample has waited long enough
+                writer.append(SAMPLES[11])
+                self.assertEqual(len(history), 12)
+                writer.append(SAMPLES[12])
+        with SqliteHistory(self.filename) as history:
+            self.assertEqual(list(history), SAMPLES[:13])
+
+    def test_devices(self):
+        with SqliteHistoryWriter(self.filename, "tub1") as writer1, SqliteHistoryWriter(self.filename, "tub2") as writer2:
+            writer1.extend(SAMPLES)
+            writer2.extend(SAMPLES[:10])
+            writer2.append(SAMPLES[0])  # logged twice: stored once
+            writer1.append(SAMPLES[0], "tub3")
+        with self.assertRaises(ValueError):
+            SqliteHistory(self.filename)
+        with SqliteHistory(self.filename, "tub2") as history:
+            self.assertEqual(history.get_devices(), ["tub1", "tub2", "tub3"])
+            self.assertEqual(list(history), SAMPLES[:10])
+            self.assertEqual(history.latest_before(float('inf')), SAMPLES[9])
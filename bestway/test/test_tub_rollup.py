@@ -0,0 +1,122 @@
+import datetime
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import tub_history
+from tub_history import TubSample
+from tub_history_binary import BinaryHistory
+from tub_history_index import open_reader
+from tub_rollup import TubRollups, HOUR, DAY, period_start
+
+START = int(datetime.datetime(2024, 1, 1).timestamp())  # local midnight
+DAY_SECONDS = 24 * 60 * 60
+# three days, one sample a minute: heater on for the first 30 minutes of each hour, pump always on
+SAMPLES = [TubSample(START + 60 * i, 30 + (i // 60) % 3, True, i % 60 < 30) for i in range(3 * 24 * 60)]
+
+
+class TestTubRollup(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_log(self, format, samples):
+        filename = os.path.join(self.directory.name, "tub_log" + tub_history.EXTENSIONS[format])
+        with tub_history.open_writer(filename, format) as writer:
+            for sample in samples: writer.append(sample)
+        return filename
+
+    def test_period_start(self):
+        self.assertEqual(period_start(START + 3 * 3600 + 59, HOUR), START + 3 * 3600)
+        self.assertEqual(period_start(START + DAY_SECONDS - 1, DAY), START)
+
+    def check_compact(self, format):
+        filename = self.write_log(format, SAMPLES)
+        rollups = TubRollups(filename, raw_days=1)
+        rollups.compact(now=SAMPLES[-1].time)
+
+        hourly = list(rollups.read(HOUR))
+        self.assertEqual(len(hourly), 3 * 24 - 1)  # the last hour is still open
+        self.assertEqual(hourly[0].start, START)
+        self.assertEqual(hourly[0].samples, 60)
+        self.assertEqual((hourly[0].temp_min, hourly[0].temp_max, hourly[0].temp_mean), (30, 30, 30))
+        self.assertEqual((hourly[0].heat_minutes, hourly[0].pump_minutes), (30, 60))
+        daily = list(rollups.read(DAY))
+        self.assertEqual([rollup.start for rollup in daily], [START, START + DAY_SECONDS])
+        self.assertEqual((daily[0].samples, daily[0].heat_minutes, daily[0].pump_minutes), (1440, 720, 1440))
+
+        # only the last day of raw samples is kept
+        with open_reader(filename) as reader:
+            kept = list(reader.between(0, float('inf')))
+        self.assertEqual(kept, [sample for sample in SAMPLES if sample.time >= SAMPLES[-1].time - DAY_SECONDS])
+
+        # appends after compaction still land in the rewritten log, and are rolled up next time
+        more = [TubSample(SAMPLES[-1].time + 60 * i, 33, False, False) for i in range(1, 121)]
+        with tub_history.open_writer(filename, format) as writer:
+            for sample in more: writer.append(sample)
+        rollups.compact(now=more[-1].time)
+        hourly = list(rollups.read(HOUR))
+        self.assertEqual(len(hourly), 3 * 24 + 1)
+        self.assertEqual(hourly[-1].pump_minutes, 0)
+        self.assertEqual(len(list(rollups.read(DAY))), 3)
+
+        tier, records = rollups.query(START, START + 3600, now=more[-1].time)
+        self.assertEqual((tier, len(records)), (HOUR, 1))
+        tier, records = rollups.query(more[0].time, more[-1].time + 1, now=more[-1].time)
+        self.assertEqual((tier, records), ('raw', more))
+
+    def test_compact_csv(self):
+        self.check_compact(tub_history.CSV)
+
+    def test_compact_binary(self):
+        self.check_compact(tub_history.BINARY)
+
+    def test_writer_follows_compaction(self):
+        filename = self.write_log(tub_history.BINARY, [])
+        with tub_history.open_writer(filename, tub_history.BINARY) as writer:
+            for sample in SAMPLES[:1440]: writer.append(sample)
+            TubRollups(filename, raw_days=0).compact(now=SAMPLES[1439].time)
+            writer.append(SAMPLES[1440])
+        with BinaryHistory(filename) as history:
+            self.assertEqual(list(history), SAMPLES[1439:1441])
+
+    def test_hourly_trimmed(self):
+        filename = self.write_log(tub_history.CSV, SAMPLES)
+        rollups = TubRollups(filename, hourly_days=1)
+        rollups.compact(now=SAMPLES[-1].time)
+        hourly = list(rollups.read(HOUR))
+        self.assertTrue(hourly and hourly[0].start >= SAMPLES[-1].time - DAY_SECONDS)
+        self.assertEqual(len(list(rollups.read(DAY))), 2)  # daily rollups are kept
+
+    def test_crash_before_state_saved(self):
+        filename = self.write_log(tub_history.CSV, SAMPLES[:1440])
+        rollups = TubRollups(filename, raw_days=10)
+        rollups.compact(now=SAMPLES[1439].time)
+        shutil.copy(f"{filename}.rollup.json", f"{filename}.saved")
+        with tub_history.open_writer(filename, tub_history.CSV) as writer:
+            for sample in SAMPLES[1440:]: writer.append(sample)
+        rollups.compact(now=SAMPLES[-1].time)
+        expected = {period: list(rollups.read(period)) for period in (HOUR, DAY)}
+
+        # as if the second compaction had appended its rollups, then died before saving its progress
+        os.replace(f"{filename}.saved", f"{filename}.rollup.json")
+        with open(rollups.get_filename(HOUR), 'a') as csvfile:
+            csvfile.write("2024-01-03T23:00:00,6")  # and part of a row
+        rollups.compact(now=SAMPLES[-1].time)
+        for period in (HOUR, DAY):
+            self.assertEqual(list(rollups.read(period)), expected[period])
+
+    def test_separate_sidecars(self):
+        csv_rollups = TubRollups(self.write_log(tub_history.CSV, SAMPLES[:1440]))
+        bin_rollups = TubRollups(self.write_log(tub_history.BINARY, SAMPLES[1440:]))
+        for period in (HOUR, DAY):
+            self.assertNotEqual(csv_rollups.get_filename(period), bin_rollups.get_filename(period))
+        csv_rollups.compact(now=SAMPLES[1439].time)
+        bin_rollups.compact(now=SAMPLES[-1].time)
+        self.assertEqual([rollup.start for rollup in csv_rollups.read(DAY)], [])  # the first day is still open
+        self.assertEqual([rollup.start for rollup in bin_rollups.read(DAY)], [START + DAY_SECONDS])
+        self.assertEqual(len(list(csv_rollups.read(HOUR))), 23)
+        self.assertTrue(all(rollup.start >= START + DAY_SECONDS for rollup in bin_rollups.read(HOUR)))
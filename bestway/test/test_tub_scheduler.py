@@ -0,0 +1,56 @@
+import datetime
+from unittest import TestCase
+
+from tub_scheduler import TubScheduler, next_daily
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestTubScheduler(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = TubScheduler(self.clock)
+        self.ran = []
+
+    def job(self, name):
+        return lambda: self.ran.append(name)
+
+    def test_order(self):
+        self.scheduler.after(20, self.job("b"))
+        self.scheduler.after(10, self.job("a"))
+        self.scheduler.after(20, self.job("c"))
+        self.clock.now += 30
+        self.assertEqual(self.scheduler.run_pending(), 3)
+        self.assertEqual(self.ran, ["a", "b", "c"])
+        self.assertIsNone(self.scheduler.next_time())
+
+    def test_every(self):
+        self.scheduler.every(60, self.job("log"))
+        self.scheduler.run_pending()
+        self.clock.now += 150  # ran late: the missed run is skipped, cadence kept
+        self.scheduler.run_pending()
+        self.assertEqual(self.ran, ["log", "log"])
+        self.assertEqual(self.scheduler.next_time(), 1_000_000.0 + 180)
+
+    def test_cancel(self):
+        job = self.scheduler.after(10, self.job("cancelled"))
+        self.scheduler.cancel(job)
+        self.clock.now += 10
+        self.assertEqual(self.scheduler.run_pending(), 0)
+
+    def test_failing_job_rescheduled(self):
+        def fail(): raise RuntimeError("boom")
+        self.scheduler.every(10, fail)
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(len(self.scheduler.get_jobs()), 1)
+
+    def test_next_daily(self):
+        now = datetime.datetime(2024, 1, 1, 23, 0).timestamp()
+        self.assertEqual(datetime.datetime.fromtimestamp(next_daily("07:30", now)), datetime.datetime(2024, 1, 2, 7, 30))
+        self.assertEqual(datetime.datetime.fromtimestamp(next_daily("23:30", now)), datetime.datetime(2024, 1, 1, 23, 30))
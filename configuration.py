@@ -1,4 +1,10 @@
 import json
+import os
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows: updates are then not serialised
+    fcntl = None
 
 DEFAULT_CONFIG = {
     "username": "unset",
@@ -25,15 +31,46 @@ class Configuration:
                 return Configuration(json.load(json_data))
         except FileNotFoundError:
             # default configuration
-            return Configuration(DEFAULT_CONFIG)
+            return Configuration(dict(DEFAULT_CONFIG))
 
 
     def toFile(self, filename):
         with open(filename, 'w') as json_data:
             json.dump(self.__dict__, json_data, indent=2)
 
+    @classmethod
+    def update(self, filename, changes):
+        """set the keys in changes in the configuration file, keeping the rest as it is now on disk
+           (rather than as it was read), so that scripts saving at the same time keep each other's changes"""
+        with ConfigurationLock(filename):
+            cfg = Configuration.fromFile(filename)
+            cfg.__dict__.update(changes)
+            temp_filename = f"{filename}.{os.getpid()}.tmp"
+            cfg.toFile(temp_filename)
+            os.replace(temp_filename, filename)  # atomic, so readers never see half a file
+
     def __getitem__(self, item):
         return self.__dict__.get(item)
 
     def getConfiguration(self):
         return self.__dict__
+
+
+class ConfigurationLock:
+    """exclusive advisory lock on <configuration>.lock, serialising Configuration.update()"""
+
+    def __init__(self, filename):
+        self.__filename = f"{filename}.lock"
+        self.__file = None
+
+    def __enter__(self):
+        if fcntl is None: return self
+        self.__file = open(self.__filename, 'a')
+        fcntl.flock(self.__file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.__file:
+            fcntl.flock(self.__file, fcntl.LOCK_UN)
+            self.__file.close()
+            self.__file = None
@@ -0,0 +1,164 @@
+#
+# tub_analytics - streaming analysis of the Hot Tub history
+#
+# readings() yields typed samples one at a time from a log of any format,
+# and the stages below each take and return an iterator, so they compose
+# into a pipeline that holds only a window's worth of samples however
+# many years the log covers, e.g.:
+#   for episode in heater_episodes(resample(readings("tub_log.csv", start), 300)): ...
+#
+# usage: python tub_analytics.py tub_log.csv [DAYS]  - list heater episodes (of the last DAYS)
+#
+
+import collections
+import datetime
+import os
+import sys
+from typing import NamedTuple, Optional
+
+import tub_history
+
+# ---------------------------------------------------------------------------
+
+MAX_GAP = 15 * 60  # seconds without a sample that end a heater episode
+
+# ---------------------------------------------------------------------------
+
+class Reading(NamedTuple):
+    time: datetime.datetime  # local time, as logged
+    temp: Optional[float]
+    pump: bool
+    heat: bool
+
+
+class HeatEpisode(NamedTuple):
+    start: datetime.datetime
+    end: datetime.datetime
+    start_temp: Optional[float]
+    end_temp: Optional[float]
+    samples: int
+
+    def get_minutes(self):
+        return (self.end - self.start).total_seconds() / 60
+
+    def get_rate(self):
+        """degrees per hour, or None if unknown"""
+        minutes = self.get_minutes()
+        if self.start_temp is None or self.end_temp is None or minutes <= 0: return None
+        return (self.end_temp - self.start_temp) * 60 / minutes
+
+
+def _seconds(interval):
+    return interval.total_seconds() if isinstance(interval, datetime.timedelta) else interval
+
+
+def _epoch(when):
+    return when.timestamp() if isinstance(when, datetime.datetime) else when
+
+# ---------------------------------------------------------------------------
+
+def readings(filename, start=None, end=None):
+    """Readings from a history log of any format, read lazily
+       a start and/or end (datetime or epoch seconds) is found through the log's index"""
+    if start is None and end is None:
+        with open(filename, 'rb') as history_file:
+            text = history_file.read(4).startswith(b'TIME')
+        if text:  # the whole of a CSV log: straight through, without building an index
+            samples = tub_history.read_csv(filename)
+            yield from (_reading(sample) for sample in samples)
+            return
+    from tub_history_index import open_reader
+    with open_reader(filename) as reader:
+        samples = reader.between(0 if start is None else _epoch(start),
+                                 float('inf') if end is None else _epoch(end))
+        yield from (_reading(sample) for sample in samples)
+
+
+def _reading(sample):
+    return Reading(datetime.datetime.fromtimestamp(sample.time),
+                   None if sample.temp is None else float(sample.temp),
+                   sample.pump, sample.heat)
+
+# ---------------------------------------------------------------------------
+
+def time_filter(readings, start=None, end=None):
+    """readings with start <= time < end; stops reading at end, as logs are in time order"""
+    for reading in readings:
+        if end is not None and reading.time >= end: return
+        if start is None or reading.time >= start: yield reading
+
+
+def resample(readings, interval):
+    """one Reading per interval (timedelta or seconds) that has any samples: its start time,
+       the mean temperature, and pump/heater on if on in any sample; empty intervals are skipped"""
+    interval = _seconds(interval)
+    bucket = None
+    count = temp_count = 0
+    temp_sum = 0.0
+    pump = heat = False
+    for reading in readings:
+        start = reading.time.timestamp() // interval * interval
+        if start != bucket:
+            if count:
+                yield Reading(datetime.datetime.fromtimestamp(bucket),
+                              temp_sum / temp_count if temp_count else None, pump, heat)
+            bucket, count, temp_count, temp_sum, pump, heat = start, 0, 0, 0.0, False, False
+        count += 1
+        if reading.temp is not None:
+            temp_count += 1
+            temp_sum += reading.temp
+        pump = pump or reading.pump
+        heat = heat or reading.heat
+    if count:
+        yield Reading(datetime.datetime.fromtimestamp(bucket), temp_sum / temp_count if temp_count else None, pump, heat)
+
+
+def moving_average(readings, window):
+    """readings with temp replaced by the mean of the last window (count) temperatures"""
+    temps = collections.deque()
+    total = 0.0
+    for reading in readings:
+        if reading.temp is not None:
+            temps.append(reading.temp)
+            total += reading.temp
+            if len(temps) > window: total -= temps.popleft()
+        yield reading._replace(temp=total / len(temps) if temps else None)
+
+
+def heater_episodes(readings, max_gap=MAX_GAP):
+    """HeatEpisode for each run of readings with the heater on; a run ends at the first
+       heater-off reading, or at a gap of more than max_gap (timedelta or seconds) in the log"""
+    max_gap = datetime.timedelta(seconds=_seconds(max_gap))
+    first = last = None
+    count = 0
+    for reading in readings:
+        if first is not None:
+            if reading.time - last.time > max_gap:  # logging stopped: the episode ended unobserved
+                yield _episode(first, last, count)
+                first = None
+            elif not reading.heat:
+                yield _episode(first, reading, count)
+                first = None
+        if reading.heat:
+            if first is None:
+                first, count = reading, 0
+            last = reading
+            count += 1
+    if first is not None:
+        yield _episode(first, last, count)
+
+
+def _episode(first, last, count):
+    return HeatEpisode(first.time, last.time, first.temp, last.temp, count)
+
+# ---------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        sys.exit(f"usage: {os.path.basename(sys.argv[0])} LOGFILE [DAYS]")
+    since = datetime.datetime.now() - datetime.timedelta(days=float(sys.argv[2])) if len(sys.argv) == 3 else None
+    print("START,MINUTES,START_TEMP,END_TEMP,DEGREES_PER_HOUR")
+    for episode in heater_episodes(readings(sys.argv[1], since)):
+        rate = episode.get_rate()
+        print(f"{episode.start.isoformat(timespec='seconds')},{episode.get_minutes():.0f},"
+              f"{episode.start_temp},{episode.end_temp},{'' if rate is None else f'{rate:.2f}'}")
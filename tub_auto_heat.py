@@ -5,6 +5,7 @@
 #
 
 import argparse
+import functools
 import logging
 import log_config
 import os
@@ -14,12 +15,16 @@ import time
 
 from configuration import Configuration
 from bestway.bestwayapi import BestwayAPI
-from bestway.bestway_user_token import BestwayUserToken
+from bestway.bestway_token_store import BestwayTokenStore
+from bestway.bestway_bindings_cache import BestwayBindingsCache
 import bestway.bestway_device as bestway_device
+from bestway.bestway_throttle import RetryPolicy
 import tub_utils
 
 # CONSTANTS
 CFGFILENAME = 'configuration.json'
+BINDINGSFILENAME = 'bindings_cache.json'
+TOKENFILENAME = 'token.json'
 GIZWITS_URL = 'https://euapi.gizwits.com'
 STATES      = ['on', 'off']
 STEP_RATE   = 10  # minutes per iteration for calculating heat time
@@ -27,14 +32,18 @@ HEAT_RATE   = 45  # minutes per degree
 COOL_RATE   = 300 # minutes per degree
 ECO_MINS    = 7 * 60
 ECO_END     = "07:30"
+SETTLE_DELAY = 5  # seconds to let the tub take a schedule when the model cannot confirm it
+PROGRAM_RETRY = RetryPolicy(attempts=7, base_delay=5, max_delay=60, equal_jitter=True)  # backoff-and-retry for tub programming
 
 # parse arguments
 argparser = argparse.ArgumentParser(prog="tub_control.py", description="Hot Tub auto heat control", epilog="with no control arguments [-P, -H, -T] prints current status")
 argparser.add_argument('-c', '--cfgfile', help="location of configuration file; default='configuration.json'")
 argparser.add_argument('-l', '--loglevel', help="logging level: INFO, DEBUG, WARNING, ERROR, CRITICAL")
+argparser.add_argument('-m', '--metrics', help="write API request metrics (JSON) to this file on exit")
 argparser.add_argument('-P', '--pump', choices=STATES, default='off', help="set pump 'on' or 'off' before scheduling, default 'off'")
 argparser.add_argument('-T', '--temp', type=int, help="override target temperature")
 argparser.add_argument('-7', '--economyseven', default=ECO_END, help="time on day when Economy 7 ends, default = '07:30'")
+argparser.add_argument('-a', '--ambient', type=float, help="air temperature overnight: plan with Newton's law of cooling (default: thermal 'ambient' in the configuration, if set)")
 argparser.add_argument('-d', '--display', action='store_true', help="ONLY display current schedule settings")
 args = argparser.parse_args()
 
@@ -54,14 +63,16 @@ if not cfg['gizwits_url']:
     logging.debug(f"Using {cfg.gizwits_url}")
 
 # open API
-api = BestwayAPI(cfg.gizwits_url)
+bindings = BestwayBindingsCache(os.path.join(os.path.dirname(args.cfgfile), BINDINGSFILENAME))
+api = BestwayAPI(cfg.gizwits_url, bindings)
+if args.metrics: api.get_metrics().dump_at_exit(args.metrics)
 
 logging.info("Logging in")
-token = BestwayUserToken(cfg.token)
-token = api.check_login(token, cfg.username, cfg.password)
-cfg.token = dict(token)
+tokens = BestwayTokenStore(os.path.join(os.path.dirname(args.cfgfile), TOKENFILENAME))
+token = tokens.get_token(api, cfg.username, cfg.password, cfg['token'])
 
-# check thermal coefficients
+# check thermal coefficients (defaults are saved, for editing)
+thermal = dict(cfg['thermal']) if type(cfg['thermal']) == dict else None
 if not cfg['thermal'] or type(cfg['thermal']) != dict:
     cfg.thermal = {}
     heat_rate = cfg.thermal['heat_rate'] = HEAT_RATE
@@ -73,6 +84,12 @@ if heat_rate is None:
     cfg.thermal['heat_rate'] = heat_rate = HEAT_RATE
 if cool_rate is None:
     cfg.thermal['cool_rate'] = cool_rate = COOL_RATE
+ambient = args.ambient if args.ambient is not None else cfg.thermal.get('ambient')
+if ambient is None:
+    calc_heat_time = tub_utils.CalcHeatTime
+else:
+    logging.info(f"Planning for {ambient} degrees ambient")
+    calc_heat_time = functools.partial(tub_utils.CalcHeatTime_newton, ambient_temp=ambient)
 
 controlling = False
 pump = None
@@ -105,14 +122,15 @@ def send_to_tub(set_pump, set_target_temp, set_start_time, set_time_to_heat):
     if set_pump is not None: commands.set_pump(set_pump)
     if args.temp: commands.set_target_temp(int(set_target_temp))
     if set_start_time and set_time_to_heat: commands.set_schedule(set_start_time, set_time_to_heat)
-    device.send_controls(token, commands)
+    return device.send_controls(token, commands)
 
 
 # ---------------------------------------------------------------------------
 
 TOLERANCE = 1 # minutes grace
 def nearly_equal(base, comparison):
-    return abs(base - comparison) <= TOLERANCE
+    # a timer field the API does not report (None) is taken as not programmed
+    return comparison is not None and abs(base - comparison) <= TOLERANCE
 
 
 # ---------------------------------------------------------------------------
@@ -146,7 +164,7 @@ temp_now = device_status.get_temp()
 if not temp_target: temp_target = device_status.get_target_temp()
 
 if controlling:
-    retries = [5, 8, 13, 21, 34, 55] # fibonacci delays for backoff-and-retry
+    retries = list(PROGRAM_RETRY.delays())
     attempts = len(retries) + 1
     for retry_delay in retries: # while attempts:
         logging.debug("calculating start and duration")
@@ -158,18 +176,21 @@ if controlling:
         logging.debug(f"target temperature {target_temp} in {minutes_to_go} minutes")
 
         # calculate heating delay and duration
-        heating = tub_utils.CalcHeatTime(tracked_temp, target_temp, cool_rate, heat_rate, minutes_to_go)
+        heating = calc_heat_time(tracked_temp, target_temp, cool_rate, heat_rate, minutes_to_go)
         start_time = heating.start_time
         time_to_heat = heating.time_to_heat
         logging.info(f"Programming heat cycle for {time_to_heat} minutes after {start_time} minutes")
 
         # orchestrate Tub commands
         if not args.temp: target_temp = None  # skip (re)setting target temp
-        send_to_tub(pump, target_temp, start_time, time_to_heat)
-        # check commands
-        time.sleep(5) # wait 5 seconds, then check status
-        device_status = device.get_status(token)
-        if check_heat_schedule(start_time, time_to_heat, device_status):
+        confirmed = send_to_tub(pump, target_temp, start_time, time_to_heat)
+        if confirmed is None:
+            time.sleep(SETTLE_DELAY)  # not confirmed by the model: wait, then check status
+        elif not confirmed:
+            logging.warning("Tub did not confirm the schedule")
+        # check commands: as the API reports them, not as sent
+        device_status = device.get_status(token, cached=False)
+        if confirmed is not False and check_heat_schedule(start_time, time_to_heat, device_status):
             # all done
             attempts = 0
             break
@@ -193,7 +214,8 @@ else:
     print(f"Temperature now {temp_now}")
     print(f"Programmed to heat for {timer_durn} minutes, starting in {timer_delay} minutes")
 
-logging.info("Saving configuration")
-cfg.toFile(args.cfgfile)
+if cfg.thermal != thermal:
+    logging.info("Saving configuration")
+    Configuration.update(args.cfgfile, {"thermal": cfg.thermal})
 
 logging.info("Done.")
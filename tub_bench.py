@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+# tub_bench - measure BestwayAPI client throughput and latency
+#
+# runs against the local fake Gizwits API (bestway.bestway_fake_server)
+# unless a URL is given; only the fake server is run without the client's
+# rate limits
+# logins and controls are only measured if asked for (-p login control), and
+# against a URL only with --real as well: repeated logins risk locking the
+# account out, and each control switches the real tub's pump off
+#
+
+import argparse
+import asyncio
+import logging
+import log_config
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from bestway.bestwayapi import BestwayAPI
+from bestway.bestway_async_api import BestwayAsyncAPI
+from bestway.bestway_fake_server import FakeGizwitsServer
+from bestway.bestway_throttle import BestwayThrottle, Budget, LOGIN, READ, CONTROL
+import bestway.bestway_device as bestway_device
+
+# CONSTANTS
+PATHS       = ['import', 'login', 'bindings', 'status', 'control', 'bulk', 'async']
+OPT_IN_PATHS = ['login', 'control']  # write to, or risk locking, the account
+DEFAULT_PATHS = [path for path in PATHS if path not in OPT_IN_PATHS]
+IMPORT_CODE = "import time; start = time.perf_counter(); import bestway.bestwayapi; print(time.perf_counter() - start)"
+IMPORT_RUNS = 20  # fresh interpreters timed for the import path
+UNLIMITED   = Budget(rate=1e9, burst=10 ** 9, attempts=1, base_delay=0, max_delay=0)
+
+# parse arguments
+argparser = argparse.ArgumentParser(prog="tub_bench.py", description="Bestway API client benchmark")
+argparser.add_argument('-l', '--loglevel', help="logging level: INFO, DEBUG, WARNING, ERROR, CRITICAL")
+argparser.add_argument('-u', '--url', help="API to benchmark; default: start a local fake server")
+argparser.add_argument('-U', '--username', default="bench", help="username for --url")
+argparser.add_argument('-W', '--password', default="bench", help="password for --url")
+argparser.add_argument('-p', '--paths', nargs='+', choices=PATHS, default=DEFAULT_PATHS,
+                       help=f"client paths to measure, default all but {' and '.join(OPT_IN_PATHS)}")
+argparser.add_argument('-n', '--requests', type=int, default=200, help="calls per path, default 200")
+argparser.add_argument('-i', '--import-runs', type=int, default=IMPORT_RUNS,
+                       help=f"fresh interpreters timed for the import path, default {IMPORT_RUNS}")
+argparser.add_argument('-c', '--clients', type=int, default=4, help="concurrent client threads, default 4")
+argparser.add_argument('-d', '--devices', type=int, default=4, help="simulated devices (half Airjet, half Airjet_V01)")
+argparser.add_argument('-L', '--latency', type=float, default=0.0, help="simulated server latency (seconds)")
+argparser.add_argument('-e', '--error_rate', type=float, default=0.0, help="simulated server error rate")
+argparser.add_argument('-t', '--throttle', action='store_true', help="keep the client's default rate limits against the fake server too")
+argparser.add_argument('-R', '--real', action='store_true', help=f"allow {' and '.join(OPT_IN_PATHS)} against --url (a real account and tub)")
+args = argparser.parse_args()
+opted_in = set(args.paths) & set(OPT_IN_PATHS)
+if args.url and opted_in and not args.real:
+    argparser.error(f"{', '.join(sorted(opted_in))} against --url needs --real: it would use the real account and tub")
+
+log_config.prepare_logging(args.loglevel)
+
+# ---------------------------------------------------------------------------
+
+def measure(name, call, count, clients):
+    """run call() count times over clients threads, print throughput and latency percentiles"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [count]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0: return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                call()
+            except Exception as err:
+                with lock: errors.append(err)
+                continue
+            elapsed = time.perf_counter() - start
+            with lock: latencies.append(elapsed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for i in range(clients)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    total = time.perf_counter() - start
+    report(name, latencies, len(errors), total)
+
+
+def measure_imports(count):
+    """time 'import bestway.bestwayapi' in count fresh interpreters, as a cron-run script would"""
+    latencies = []
+    start = time.perf_counter()
+    for i in range(count):
+        result = subprocess.run([sys.executable, "-c", IMPORT_CODE], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        latencies.append(float(result.stdout))
+    report('import', latencies, 0, time.perf_counter() - start)
+
+
+def report(name, latencies, errors, total):
+    if len(latencies) >= 2:
+        percentiles = statistics.quantiles(latencies, n=100)
+        p50, p99 = percentiles[49] * 1000, percentiles[98] * 1000
+    else:
+        p50 = p99 = float('nan')
+    rate = len(latencies) / total if total else 0
+    print(f"{name:10s} {rate:10.1f} {p50:10.2f} {p99:10.2f} {errors:8d}")
+
+# ---------------------------------------------------------------------------
+
+print(f"{'path':10s} {'req/s':>10s} {'p50 ms':>10s} {'p99 ms':>10s} {'errors':>8s}")
+if 'import' in args.paths:
+    measure_imports(args.import_runs)
+if not set(args.paths) - {'import'}:
+    sys.exit()
+
+fake = None
+if args.url:
+    url = args.url
+else:
+    v01 = args.devices // 2
+    fake = FakeGizwitsServer(args.devices - v01, v01, args.latency, args.error_rate).start()
+    url = fake.url
+
+throttle = None if args.throttle or not fake else BestwayThrottle({LOGIN: UNLIMITED, READ: UNLIMITED, CONTROL: UNLIMITED})
+api = BestwayAPI(url, throttle=throttle)
+token = api.get_user_token(args.username, args.password)
+device_ids = [device['did'] for device in api._get_devices(token)]
+device = api.get_device(token, device_ids[0])
+command = bestway_device.BestwayCommand()
+command.set_pump(False)
+
+if 'login' in args.paths:
+    measure('login', lambda: api.get_user_token(args.username, args.password), args.requests, args.clients)
+if 'bindings' in args.paths:
+    measure('bindings', lambda: api._get_devices(token), args.requests, args.clients)
+if 'status' in args.paths:
+    measure('status', lambda: device.get_status(token), args.requests, args.clients)
+if 'control' in args.paths:
+    measure('control', lambda: device.send_controls(token, command), args.requests, args.clients)
+if 'bulk' in args.paths:
+    measure('bulk', lambda: api.get_statuses(token, device_ids), args.requests, args.clients)
+if 'async' in args.paths:
+    async def run_async():
+        async_api = BestwayAsyncAPI(url, concurrency=args.clients)
+        latencies = []
+        errors = 0
+        start = time.perf_counter()
+        for i in range(args.requests):
+            call_start = time.perf_counter()
+            results = await async_api.get_devices_raw_info(token, device_ids)
+            latencies.append(time.perf_counter() - call_start)
+            errors += sum(1 for result in results.values() if isinstance(result, Exception))
+        report('async', latencies, errors, time.perf_counter() - start)
+        await async_api.close()
+    asyncio.run(run_async())
+
+api.close()
+if fake: fake.stop()
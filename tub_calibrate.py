@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+# tub_calibrate - fit heat_rate and cool_rate to the logged Hot Tub history
+#
+# writes the fitted coefficients to "thermal" in the configuration file,
+# where tub_auto_heat.py and tub_daemon.py read them; a coefficient the
+# history cannot support (e.g. no heating logged yet) is left as it was
+#
+
+import argparse
+import datetime
+import logging
+import log_config
+import os
+import sys
+import time
+
+import tub_history
+from configuration import Configuration
+from tub_calibration import calibrate_file
+from tub_history_index import open_reader
+from tub_rollup import TubRollups, HOUR
+
+# CONSTANTS
+CFGFILENAME = 'configuration.json'
+LOGFILENAME = 'tub_log'  # + format extension
+DAYS = 90  # recent enough to follow the seasons
+
+# parse arguments
+argparser = argparse.ArgumentParser(prog="tub_calibrate.py", description="Hot Tub thermal calibration")
+argparser.add_argument('-c', '--cfgfile', help="location of configuration file; default='configuration.json'")
+argparser.add_argument('-l', '--loglevel', help="logging level: INFO, DEBUG, WARNING, ERROR, CRITICAL")
+argparser.add_argument('-o', '--output', help=f"full pathname of the log file; default='{LOGFILENAME}.csv'")
+argparser.add_argument('-d', '--days', type=float, default=DAYS, help=f"fit to the last DAYS of history, default {DAYS}; 0 for all")
+argparser.add_argument('-n', '--dryrun', action='store_true', help="print the fit without saving it")
+args = argparser.parse_args()
+
+# setup logging
+log_config.prepare_logging(args.loglevel)
+if not args.cfgfile:
+    args.cfgfile = os.path.join(os.path.dirname(sys.argv[0]), CFGFILENAME)
+    logging.info(f"using configuration file {args.cfgfile}")
+if not args.output:
+    args.output = os.path.join(os.path.dirname(sys.argv[0]), LOGFILENAME + tub_history.EXTENSIONS[tub_history.CSV])
+
+if args.days and os.path.exists(TubRollups(args.output).get_filename(HOUR)):
+    with open_reader(args.output) as reader:
+        first = next(iter(reader.between(0, float('inf'))), None)
+    if first and first.time > time.time() - args.days * 24 * 60 * 60:
+        logging.warning(f"{args.output} was compacted: fitting to {(time.time() - first.time) / 86400:.0f} "
+                        f"days of raw samples, not {args.days:g} (see tub_compact.py -r)")
+
+logging.info(f"Fitting {args.output}...")
+calibration = calibrate_file(args.output, args.days or None)
+print(f"heat_rate {calibration.heat_rate} minutes per degree "
+      f"({calibration.heat_segments} heating segments, {calibration.heat_minutes:.0f} minutes)")
+print(f"cool_rate {calibration.cool_rate} minutes per degree "
+      f"({calibration.cool_segments} cooling segments, {calibration.cool_minutes:.0f} minutes)")
+
+if not args.dryrun and (calibration.heat_rate or calibration.cool_rate):
+    logging.info("Saving configuration")
+    cfg = Configuration.fromFile(args.cfgfile)
+    thermal = dict(cfg['thermal']) if type(cfg['thermal']) == dict else {}
+    if calibration.heat_rate: thermal['heat_rate'] = calibration.heat_rate
+    if calibration.cool_rate: thermal['cool_rate'] = calibration.cool_rate
+    thermal['calibrated'] = datetime.datetime.now().isoformat(timespec='seconds')
+    Configuration.update(args.cfgfile, {"thermal": thermal})
+
+logging.info("Done.")
@@ -0,0 +1,146 @@
+#
+# tub_calibration - learn the tub's heat_rate and cool_rate from its history
+#
+# the logged samples are split into heating segments (heater on, while the
+# temperature is still rising) and cooling segments (heater off), broken at
+# gaps in the log; one least-squares slope is fitted across all segments of
+# a kind, each segment with its own intercept, so that a long cold night
+# and a short warm afternoon both count by their length
+#   heating slope = 1 / heat_rate, cooling slope = -1 / cool_rate
+# (degrees per minute; the rates are minutes per degree, as tub_utils)
+#
+# the fit uses NumPy when it is installed and plain Python otherwise
+#
+
+import array
+import logging
+import time
+from typing import NamedTuple, Optional
+
+try:
+    import numpy
+except ImportError:  # optional: the pure Python fit gives the same answer, more slowly
+    numpy = None
+
+import tub_history
+
+# ---------------------------------------------------------------------------
+
+HEAT = 'heat'
+COOL = 'cool'
+MAX_GAP = 15 * 60  # seconds without a sample that end a segment
+MIN_MINUTES = {HEAT: 60, COOL: 3 * 60}  # shorter segments say more about the sensor than the tub
+HEAT_RATE_LIMITS = (5, 300)  # minutes per degree: anything outside is a bad fit, not a tub
+COOL_RATE_LIMITS = (30, 5000)
+
+# ---------------------------------------------------------------------------
+
+class Segment(NamedTuple):
+    kind: str  # HEAT or COOL
+    start: int  # epoch seconds
+    minutes: array.array  # since start
+    temps: array.array
+
+
+class Calibration(NamedTuple):
+    heat_rate: Optional[float]  # minutes per degree, or None if the history is insufficient
+    cool_rate: Optional[float]
+    heat_segments: int
+    cool_segments: int
+    heat_minutes: float
+    cool_minutes: float
+
+# ---------------------------------------------------------------------------
+
+def segments(samples, max_gap=MAX_GAP):
+    """heating and cooling Segments of at least MIN_MINUTES from a time ordered stream of TubSamples"""
+    kind = start = last = None
+    minutes = temps = None
+    for sample in samples:
+        if sample.temp is None: continue
+        sample_kind = HEAT if sample.heat else COOL
+        if kind != sample_kind or sample.time - last > max_gap:
+            if kind is not None:
+                segment = _finish(kind, start, minutes, temps)
+                if segment: yield segment
+            kind, start = sample_kind, sample.time
+            minutes, temps = array.array('d'), array.array('d')
+        minutes.append((sample.time - start) / 60)
+        temps.append(sample.temp)
+        last = sample.time
+    if kind is not None:
+        segment = _finish(kind, start, minutes, temps)
+        if segment: yield segment
+
+
+def _finish(kind, start, minutes, temps):
+    if kind == HEAT:
+        # once at the target, the heater holds the temperature: keep only the climb
+        peak = temps.index(max(temps))
+        del minutes[peak + 1:], temps[peak + 1:]
+    if minutes[-1] < MIN_MINUTES[kind]: return None
+    return Segment(kind, start, minutes, temps)
+
+
+def fit_slope(segments):
+    """least-squares slope (degrees per minute) common to all segments, each with its own intercept"""
+    if not segments: return None
+    if numpy is not None:
+        return _fit_slope_numpy(segments)
+    sxy = sxx = 0.0
+    for segment in segments:
+        count = len(segment.minutes)
+        mean_minutes = sum(segment.minutes) / count
+        mean_temp = sum(segment.temps) / count
+        for minutes, temp in zip(segment.minutes, segment.temps):
+            sxy += (minutes - mean_minutes) * (temp - mean_temp)
+            sxx += (minutes - mean_minutes) ** 2
+    return sxy / sxx if sxx else None
+
+
+def _fit_slope_numpy(segments):
+    minutes = numpy.concatenate([numpy.frombuffer(segment.minutes) for segment in segments])
+    temps = numpy.concatenate([numpy.frombuffer(segment.temps) for segment in segments])
+    ids = numpy.repeat(numpy.arange(len(segments)), [len(segment.minutes) for segment in segments])
+    counts = numpy.bincount(ids)
+    minutes = minutes - (numpy.bincount(ids, minutes) / counts)[ids]
+    temps = temps - (numpy.bincount(ids, temps) / counts)[ids]
+    sxx = numpy.dot(minutes, minutes)
+    return float(numpy.dot(minutes, temps) / sxx) if sxx else None
+
+
+def _rate(slope, sign, limits):
+    """minutes per degree from a fitted slope, or None if it is implausible"""
+    if slope is None or slope * sign <= 0: return None
+    rate = sign / slope
+    if not limits[0] <= rate <= limits[1]:
+        logging.warning(f"fitted rate {rate:.0f} minutes per degree is outside {limits} - ignored")
+        return None
+    return round(rate, 1)
+
+# ---------------------------------------------------------------------------
+
+def calibrate(samples):
+    """Calibration fitted to a time ordered stream of TubSamples"""
+    found = {HEAT: [], COOL: []}
+    for segment in segments(samples):
+        found[segment.kind].append(segment)
+    heat_rate = _rate(fit_slope(found[HEAT]), 1, HEAT_RATE_LIMITS)
+    cool_rate = _rate(fit_slope(found[COOL]), -1, COOL_RATE_LIMITS)
+    return Calibration(heat_rate, cool_rate, len(found[HEAT]), len(found[COOL]),
+                       sum(segment.minutes[-1] for segment in found[HEAT]),
+                       sum(segment.minutes[-1] for segment in found[COOL]))
+
+
+def calibrate_file(filename, days=None):
+    """Calibration fitted to a history log of any format, or to its last days"""
+    if days is None:
+        with open(filename, 'rb') as history_file:
+            text = history_file.read(4).startswith(b'TIME')
+        if text:  # whole CSV log: read straight through, without building an index
+            return calibrate(tub_history.read_csv(filename))
+    from tub_history_index import open_reader
+    with open_reader(filename) as reader:
+        return calibrate(reader.between(0 if days is None else time.time() - days * 24 * 60 * 60, float('inf')))
+
+# ---------------------------------------------------------------------------
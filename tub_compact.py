@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+# tub_compact - roll up and compact the Hot Tub history log
+#
+# folds newly logged samples into hourly and daily rollups, then drops raw
+# samples older than the raw window and hourly rollups older than a year
+# (see tub_rollup.py); safe to run while tub_log.py / tub_daemon.py append
+# to the log, e.g. nightly from cron
+#
+
+import argparse
+import logging
+import log_config
+import os
+import sys
+
+import tub_history
+from tub_rollup import TubRollups, RAW_DAYS, HOURLY_DAYS, HOUR, DAY
+
+# CONSTANTS
+LOGFILENAME = 'tub_log'  # + format extension
+
+# parse arguments
+argparser = argparse.ArgumentParser(prog="tub_compact.py", description="Hot Tub history rollup and compaction")
+argparser.add_argument('-l', '--loglevel', help="logging level: INFO, DEBUG, WARNING, ERROR, CRITICAL")
+argparser.add_argument('-o', '--output', help=f"full pathname of the log file; default='{LOGFILENAME}.csv'")
+argparser.add_argument('-r', '--rawdays', type=int, default=RAW_DAYS, help=f"days of raw samples to keep, default {RAW_DAYS}")
+argparser.add_argument('-H', '--hourlydays', type=int, default=HOURLY_DAYS, help=f"days of hourly rollups to keep, default {HOURLY_DAYS}")
+args = argparser.parse_args()
+
+# setup logging
+log_config.prepare_logging(args.loglevel)
+if not args.output:
+    args.output = os.path.join(os.path.dirname(sys.argv[0]), LOGFILENAME + tub_history.EXTENSIONS[tub_history.CSV])
+
+if not os.path.exists(args.output):
+    sys.exit(f"{args.output}: no such log file")
+
+rollups = TubRollups(args.output, raw_days=args.rawdays, hourly_days=args.hourlydays)
+before = os.path.getsize(args.output)
+try:
+    rollups.compact()
+except ValueError as err:
+    sys.exit(str(err))
+logging.info(f"{args.output}: {before} -> {os.path.getsize(args.output)} bytes; "
+             f"rollups in {rollups.get_filename(HOUR)}, {rollups.get_filename(DAY)}")
+
+logging.info("Done.")
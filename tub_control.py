@@ -15,16 +15,20 @@ import datetime
 
 from configuration import Configuration
 from bestway.bestwayapi import BestwayAPI
-from bestway.bestway_user_token import BestwayUserToken
+from bestway.bestway_token_store import BestwayTokenStore
+from bestway.bestway_bindings_cache import BestwayBindingsCache
 
 # CONSTANTS
 CFGFILENAME = 'configuration.json'
+BINDINGSFILENAME = 'bindings_cache.json'
+TOKENFILENAME = 'token.json'
 GIZWITS_URL = 'https://euapi.gizwits.com'
 STATES      = ['on', 'off']
 # parse arguments
 argparser = argparse.ArgumentParser(prog="tub_control.py", description="Hot Tub filter pump control", epilog="with no control arguments [-P, -H, -T] prints current status")
 argparser.add_argument('-c', '--cfgfile', help="location of configuration file; default='configuration.json'")
 argparser.add_argument('-l', '--loglevel', help="logging level: INFO, DEBUG, WARNING, ERROR, CRITICAL")
+argparser.add_argument('-m', '--metrics', help="write API request metrics (JSON) to this file on exit")
 argparser.add_argument('-P', '--pump', choices=STATES, help="set pump 'on' or 'off'")
 argparser.add_argument('-H', '--heat', choices=STATES, help="set heater 'on' or 'off'")
 argparser.add_argument('-T', '--temp', type=int, help="set target temperature")
@@ -48,9 +52,11 @@ if not cfg['gizwits_url']:
     logging.info(f"Using {cfg.gizwits_url}")
 
 logging.info("Logging in")
-token = BestwayUserToken(cfg.token)
-api = BestwayAPI(cfg.gizwits_url)
-token = api.check_login(token, cfg.username, cfg.password)
+bindings = BestwayBindingsCache(os.path.join(os.path.dirname(args.cfgfile), BINDINGSFILENAME))
+api = BestwayAPI(cfg.gizwits_url, bindings)
+if args.metrics: api.get_metrics().dump_at_exit(args.metrics)
+tokens = BestwayTokenStore(os.path.join(os.path.dirname(args.cfgfile), TOKENFILENAME))
+token = tokens.get_token(api, cfg.username, cfg.password, cfg['token'])
 
 controlling = False
 pump = None
@@ -106,8 +112,4 @@ else:
     print(f"Filter pump is {'ON' if pump_state else 'OFF'}")
     print(f"Heater is {'ON' if heat_state else 'OFF'}")
 
-logging.info("Saving configuration")
-cfg.token = dict(token)
-cfg.toFile(args.cfgfile)
-
 logging.info("Done.")
@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+# tub_daemon - resident Hot Tub logger and controller
+#
+# runs the work of tub_log.py, tub_control.py (pump on/off at set times)
+# and tub_auto_heat.py as jobs in a single long-running process, keeping
+# the API connection, token, bindings and device warm between runs
+# instead of paying the start-up cost on every cron invocation
+#
+
+import argparse
+import functools
+import logging
+import log_config
+import os
+import signal
+import sys
+import time
+
+from configuration import Configuration
+from bestway.bestwayapi import BestwayAPI
+from bestway.bestway_token_store import BestwayTokenStore
+from bestway.bestway_bindings_cache import BestwayBindingsCache
+from bestway.bestway_throttle import RetryPolicy
+import bestway.bestway_device as bestway_device
+import bestway.bestway_exceptions as bestway_exceptions
+import tub_history
+import tub_utils
+from tub_history_sqlite import BATCH_AGE
+from tub_rollup import TubRollups
+from tub_scheduler import TubScheduler, next_daily
+
+# CONSTANTS
+CFGFILENAME = 'configuration.json'
+BINDINGSFILENAME = 'bindings_cache.json'
+TOKENFILENAME = 'token.json'
+LOGFILENAME = 'tub_log'  # + format extension
+GIZWITS_URL = 'https://euapi.gizwits.com'
+STATES      = ['on', 'off']
+LOG_INTERVAL = 60  # seconds between status log entries
+TOKEN_CHECK = 60 * 60  # seconds between token expiry checks
+HEAT_RATE   = 45  # minutes per degree
+COOL_RATE   = 300 # minutes per degree
+ECO_END     = "07:30"
+TOLERANCE   = 1  # minutes grace when checking a programmed schedule
+SETTLE_DELAY = 5  # seconds to let the tub take a schedule when the model cannot confirm it
+PROGRAM_RETRY = RetryPolicy(attempts=7, base_delay=5, max_delay=60, equal_jitter=True)  # backoff-and-retry for tub programming
+
+# parse arguments
+argparser = argparse.ArgumentParser(prog="tub_daemon.py", description="Hot Tub daemon: logging, pump schedule and auto heat",
+                                    epilog="e.g. tub_daemon.py -P 08:00 on -P 20:00 off -A 23:00")
+argparser.add_argument('-c', '--cfgfile', help="location of configuration file; default='configuration.json'")
+argparser.add_argument('-l', '--loglevel', help="logging level: INFO, DEBUG, WARNING, ERROR, CRITICAL")
+argparser.add_argument('-m', '--metrics', help="write API request metrics (JSON) to this file on exit")
+argparser.add_argument('-o', '--output', help=f"full pathname of output file; default='{LOGFILENAME}.csv' (or .bin, .db)")
+argparser.add_argument('-f', '--format', choices=tub_history.FORMATS, default=tub_history.CSV, help="log file format, default 'csv'")
+argparser.add_argument('-i', '--interval', type=int, default=LOG_INTERVAL, help=f"seconds between log entries, default {LOG_INTERVAL}; 0 disables logging")
+argparser.add_argument('-u', '--changed', action='store_true', help="only log when the tub has reported new data")
+argparser.add_argument('-P', '--pump', nargs=2, action='append', metavar=('HH:MM', 'STATE'), help="turn the filter pump 'on' or 'off' daily at HH:MM (repeatable)")
+argparser.add_argument('-A', '--autoheat', metavar='HH:MM', help="program heating daily at HH:MM, to reach target temperature by the end of Economy 7")
+argparser.add_argument('-C', '--compact', metavar='HH:MM', help="roll up and compact the log daily at HH:MM (see tub_compact.py)")
+argparser.add_argument('-T', '--temp', type=int, help="auto heat: override target temperature")
+argparser.add_argument('-a', '--ambient', type=float, help="auto heat: air temperature overnight, for Newton's law of cooling (default: thermal 'ambient', if set)")
+argparser.add_argument('-7', '--economyseven', default=ECO_END, help="auto heat: time of day when Economy 7 ends, default = '07:30'")
+args = argparser.parse_args()
+
+# setup logging
+log_config.prepare_logging(args.loglevel)
+# setup logfile filename
+if not args.cfgfile:
+    args.cfgfile = os.path.join(os.path.dirname(sys.argv[0]), CFGFILENAME)
+    logging.info(f"using configuration file {args.cfgfile}")
+if not args.output:
+    args.output = os.path.join(os.path.dirname(sys.argv[0]), LOGFILENAME + tub_history.EXTENSIONS[args.format])
+for clock_time, state in args.pump or []:
+    if state not in STATES:
+        argparser.error(f"pump state must be one of {STATES}, not '{state}'")
+if args.compact and args.format == tub_history.SQLITE:
+    argparser.error("--compact applies to csv and binary logs only")
+if args.compact and not args.interval:
+    argparser.error("--compact needs logging (--interval above 0)")
+
+logging.info("Load configuration from file...")
+cfg = Configuration.fromFile(args.cfgfile)
+
+# check Gizwits URL
+if not cfg['gizwits_url']:
+    cfg.gizwits_url = GIZWITS_URL
+    logging.info(f"Using {cfg.gizwits_url}")
+
+# thermal coefficients, as tub_auto_heat.py
+thermal = cfg['thermal'] if type(cfg['thermal']) == dict else {}
+heat_rate = thermal.get('heat_rate') or HEAT_RATE
+cool_rate = thermal.get('cool_rate') or COOL_RATE
+ambient = args.ambient if args.ambient is not None else thermal.get('ambient')
+if ambient is None:
+    calc_heat_time = tub_utils.CalcHeatTime
+else:
+    calc_heat_time = functools.partial(tub_utils.CalcHeatTime_newton, ambient_temp=ambient)
+
+logging.info("Logging in")
+bindings = BestwayBindingsCache(os.path.join(os.path.dirname(args.cfgfile), BINDINGSFILENAME))
+api = BestwayAPI(cfg.gizwits_url, bindings)
+if args.metrics: api.get_metrics().dump_at_exit(args.metrics)
+tokens = BestwayTokenStore(os.path.join(os.path.dirname(args.cfgfile), TOKENFILENAME))
+token = tokens.get_token(api, cfg.username, cfg.password, cfg['token'])
+
+device = api.get_device(token, cfg.did)
+logging.info(f"Got device: {device}")
+
+scheduler = TubScheduler()
+
+# ---------------------------------------------------------------------------
+
+def refresh_token():
+    """re-read the shared token, logging in again if it is close to expiry"""
+    global token
+    token = tokens.get_token(api, cfg.username, cfg.password)
+
+
+def with_token(function):
+    """wrap a job so that a rejected token leads to a fresh login and one retry"""
+    def job():
+        global token
+        try:
+            function()
+        except bestway_exceptions.InvalidToken:
+            logging.info("token rejected - logging in again")
+            token = tokens.get_token(api, cfg.username, cfg.password, stale=token)
+            function()
+    job.__name__ = function.__name__
+    return job
+
+# ---------------------------------------------------------------------------
+
+def log_status():
+    snapshot = device.poll(token) if args.changed else device.get_snapshot(token)
+    if args.changed and snapshot.updated_at == cfg['log_updated_at']:
+        logging.debug("no new data - skipping")
+        return
+    writer.append(tub_history.TubSample(int(time.time()), snapshot.temp, snapshot.pump, snapshot.heat))  # sqlite: committed in batches
+    cfg.log_updated_at = snapshot.updated_at  # saved by flush_log, once the sample is committed
+
+
+def flush_log():
+    """commit any buffered samples, then save how far the log has got"""
+    global saved_updated_at
+    writer.flush()
+    if cfg['log_updated_at'] != saved_updated_at:
+        Configuration.update(args.cfgfile, {"log_updated_at": cfg.log_updated_at})
+        saved_updated_at = cfg.log_updated_at
+
+
+def set_pump(on):
+    def pump_job():
+        logging.info(f"Setting filter pump {'ON' if on else 'OFF'}")
+        commands = bestway_device.BestwayCommand()
+        commands.set_pump(on)
+        device.send_controls(token, commands)
+    return pump_job
+
+
+def nearly_equal(base, comparison):
+    """a timer field the API does not report (None) is taken as not programmed"""
+    return comparison is not None and abs(base - comparison) <= TOLERANCE
+
+
+def auto_heat(retries=None):
+    """plan and program tonight's heating; re-scheduled with backoff if the tub does not take the program"""
+    if retries is None: retries = iter(PROGRAM_RETRY.delays())
+    snapshot = device.get_snapshot(token)
+    target_temp = args.temp or snapshot.target_temp
+    now = time.time()
+    minutes_to_go = int((next_daily(args.economyseven, now) - now) / 60)
+    logging.debug(f"Economy 7 ends in {minutes_to_go} minutes")
+    heating = calc_heat_time(snapshot.temp, target_temp, cool_rate, heat_rate, minutes_to_go)
+    if heating.start_time is None:
+        logging.info(f"{snapshot.temp} will stay above {target_temp} - no heating needed")
+        return
+
+    logging.info(f"Programming heat cycle for {heating.time_to_heat} minutes after {heating.start_time} minutes")
+    commands = bestway_device.BestwayCommand()
+    if args.temp: commands.set_target_temp(args.temp)
+    commands.set_schedule(heating.start_time, heating.time_to_heat)
+    confirmed = device.send_controls(token, commands)
+    if confirmed is None:
+        time.sleep(SETTLE_DELAY)  # not confirmed by the model: wait, then check status
+    elif not confirmed:
+        logging.warning("Tub did not confirm the schedule")
+
+    snapshot = device.get_snapshot(token, cached=False)  # as the API reports it, not as sent
+    if (confirmed is not False and nearly_equal(heating.start_time, snapshot.timer_delay)
+            and nearly_equal(heating.time_to_heat, snapshot.timer_duration)):
+        return
+    retry_delay = next(retries, None)
+    if retry_delay is None:
+        logging.error(f"Tub programming failed ({snapshot.timer_delay}/{snapshot.timer_duration}). Time schedule not set")
+    else:
+        logging.info(f"Tub programming failed ({snapshot.timer_delay}/{snapshot.timer_duration}). Trying again")
+        scheduler.after(retry_delay, with_token(lambda: auto_heat(retries)), "auto_heat")
+
+
+def compact():
+    TubRollups(args.output).compact()
+
+# ---------------------------------------------------------------------------
+
+scheduler.every(TOKEN_CHECK, refresh_token, delay=TOKEN_CHECK)
+if args.interval:
+    writer = tub_history.open_writer(args.output, args.format, cfg.did)
+    saved_updated_at = cfg['log_updated_at']
+    scheduler.every(args.interval, with_token(log_status))
+    scheduler.every(BATCH_AGE, flush_log, delay=BATCH_AGE)  # with -u, appends (and so commits) may stop for hours
+for clock_time, state in args.pump or []:
+    scheduler.daily(clock_time, with_token(set_pump(state == 'on')), f"pump {state}")
+if args.autoheat:
+    scheduler.daily(args.autoheat, with_token(auto_heat))
+if args.compact:
+    scheduler.daily(args.compact, compact)
+
+def shutdown(signum, frame):
+    logging.info(f"signal {signum} - stopping")
+    scheduler.stop()
+
+signal.signal(signal.SIGTERM, shutdown)
+signal.signal(signal.SIGINT, shutdown)
+
+for job in scheduler.get_jobs():
+    logging.info(f"{job}")
+scheduler.run()
+
+if args.interval:
+    logging.info("Saving configuration")
+    flush_log()
+    writer.close()
+api.close()
+
+logging.info("Done.")
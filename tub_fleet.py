@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+# tub_fleet - log the status of many Hot Tubs, across several accounts
+#
+# the fleet is configured in configuration.json as, e.g.:
+#   "fleet": [{"name": "site1", "username": "...", "password": "...", "devices": ["did1", "did2"]}, ...]
+# (optionally with "gizwits_url" per account); without "fleet" the single
+# configured username/did is used
+# each account's token and device bindings are kept beside the configuration
+# file (token_NAME.json, bindings_cache_NAME.json), so that runs from cron
+# (-1) re-use them rather than logging in every time; NAME is therefore
+# limited to letters, digits, '_', '-' and '.' (not first)
+# with -f sqlite, samples from every tub go to one database (-o), keyed by
+# device id (see tub_history_sqlite.py)
+#
+
+import argparse
+import csv
+import datetime
+import logging
+import log_config
+import os
+import re
+import signal
+import sys
+
+import tub_history
+from configuration import Configuration
+from bestway.bestway_bindings_cache import BestwayBindingsCache
+from bestway.bestway_token_store import BestwayTokenStore
+from bestway.bestway_fleet import BestwayFleet, FleetAccount, WORKERS, INTERVAL
+
+# CONSTANTS
+CFGFILENAME = 'configuration.json'
+BINDINGSFILENAME = 'bindings_cache.json'  # the single configured account, shared with the other scripts
+TOKENFILENAME = 'token.json'
+FLEET_BINDINGSFILENAME = 'bindings_cache_{}.json'  # per fleet account name
+FLEET_TOKENFILENAME = 'token_{}.json'
+ACCOUNT_NAME = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]*$")  # safe in those file names: no '/', no leading '.'
+GIZWITS_URL = 'https://euapi.gizwits.com'
+
+# parse arguments
+argparser = argparse.ArgumentParser(prog="tub_fleet.py", description="Hot Tub fleet logger")
+argparser.add_argument('-c', '--cfgfile', help="location of configuration file; default='configuration.json'")
+argparser.add_argument('-l', '--loglevel', help="logging level: INFO, DEBUG, WARNING, ERROR, CRITICAL")
+argparser.add_argument('-o', '--output', help="append CSV to this file; default: standard output")
+argparser.add_argument('-f', '--format', choices=[tub_history.CSV, tub_history.SQLITE], default=tub_history.CSV,
+                       help="output format, default 'csv'; 'sqlite' needs -o")
+argparser.add_argument('-w', '--workers', type=int, default=WORKERS, help=f"polling worker threads, default {WORKERS}")
+argparser.add_argument('-i', '--interval', type=int, default=INTERVAL, help=f"seconds between polls of each tub, default {INTERVAL}")
+argparser.add_argument('-1', '--once', action='store_true', help="poll every tub once, then exit")
+argparser.add_argument('-m', '--metrics', help="write each account's API request metrics (JSON) to this file on exit")
+args = argparser.parse_args()
+if args.format == tub_history.SQLITE and not args.output:
+    argparser.error("sqlite output needs a database file (-o)")
+
+# setup logging
+log_config.prepare_logging(args.loglevel)
+if not args.cfgfile:
+    args.cfgfile = os.path.join(os.path.dirname(sys.argv[0]), CFGFILENAME)
+    logging.info(f"using configuration file {args.cfgfile}")
+
+logging.info("Load configuration from file...")
+cfg = Configuration.fromFile(args.cfgfile)
+gizwits_url = cfg['gizwits_url'] or GIZWITS_URL
+if cfg['fleet']:
+    accounts = [FleetAccount(account['name'], account['username'], account['password'], tuple(account['devices']),
+                             account.get('gizwits_url', gizwits_url))
+                for account in cfg.fleet]
+else:
+    accounts = [FleetAccount(cfg.username, cfg.username, cfg.password, (cfg.did,), gizwits_url)]
+
+if cfg['fleet']:
+    for account in accounts:
+        if not ACCOUNT_NAME.match(account.name):
+            sys.exit(f"fleet account name {account.name!r} may only use letters, digits, '_', '-' and '.' (not first)")
+    if len({account.name for account in accounts}) < len(accounts):
+        sys.exit("fleet account names must be unique")
+
+cfgdir = os.path.dirname(args.cfgfile)
+if cfg['fleet']:
+    token_stores = {account.name: BestwayTokenStore(os.path.join(cfgdir, FLEET_TOKENFILENAME.format(account.name)))
+                    for account in accounts}
+    bindings_caches = {account.name: BestwayBindingsCache(os.path.join(cfgdir, FLEET_BINDINGSFILENAME.format(account.name)))
+                       for account in accounts}
+else:
+    token_stores = {accounts[0].name: BestwayTokenStore(os.path.join(cfgdir, TOKENFILENAME))}
+    bindings_caches = {accounts[0].name: BestwayBindingsCache(os.path.join(cfgdir, BINDINGSFILENAME))}
+
+if args.format == tub_history.SQLITE:
+    history = tub_history.open_writer(args.output, tub_history.SQLITE)
+elif args.output:
+    newfile = not os.path.exists(args.output) or os.path.getsize(args.output) == 0
+    outfile = open(args.output, 'a', newline='')
+else:
+    newfile = True
+    outfile = sys.stdout
+if args.format == tub_history.CSV:
+    writer = csv.writer(outfile, delimiter=',', quotechar='"', lineterminator="\n")
+    if newfile:
+        writer.writerow(['TIME', 'ACCOUNT', 'DID', 'TEMP_C', 'FILTER', 'HEAT', 'ERROR'])
+
+# ---------------------------------------------------------------------------
+
+def write_status(status):
+    if args.format == tub_history.SQLITE:
+        if status.snapshot is None:
+            logging.warning(f"{status.account}/{status.device_id}: {status.error!r}")
+        else:
+            history.append(tub_history.TubSample(int(status.time), status.snapshot.temp, status.snapshot.pump,
+                                                 status.snapshot.heat), status.device_id)
+        return
+    timestamp = datetime.datetime.fromtimestamp(status.time).isoformat(timespec='seconds')
+    snapshot = status.snapshot
+    if snapshot is None:
+        writer.writerow([timestamp, status.account, status.device_id, '', '', '', repr(status.error)])
+    else:
+        writer.writerow([timestamp, status.account, status.device_id, snapshot.temp,
+                         'ON' if snapshot.pump else 'OFF',
+                         'ON' if snapshot.heat else 'OFF',
+                         ''])
+    outfile.flush()
+
+# ---------------------------------------------------------------------------
+
+fleet = BestwayFleet(accounts, workers=args.workers, interval=args.interval, token_stores=token_stores,
+                     bindings_caches=bindings_caches)
+if args.metrics: fleet.dump_metrics_at_exit(args.metrics)
+if args.once:
+    for status in fleet.poll_once().values():
+        write_status(status)
+    fleet.stop()
+else:
+    signal.signal(signal.SIGTERM, lambda signum, frame: fleet.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: fleet.stop())
+    fleet.start()
+    for status in fleet.statuses():
+        write_status(status)
+if args.format == tub_history.SQLITE:
+    history.close()
+
+logging.info("Done.")
@@ -16,18 +16,25 @@ import datetime
 
 from configuration import Configuration
 from bestway.bestwayapi import BestwayAPI
-from bestway.bestway_user_token import BestwayUserToken
+from bestway.bestway_token_store import BestwayTokenStore
+from bestway.bestway_bindings_cache import BestwayBindingsCache
+import tub_utils
 
 # CONSTANTS
 CFGFILENAME = 'configuration.json'
+BINDINGSFILENAME = 'bindings_cache.json'
+TOKENFILENAME = 'token.json'
 GIZWITS_URL = 'https://euapi.gizwits.com'
 STATES      = ['on', 'off']
+HEAT_RATE   = 45  # minutes per degree, unless configured in cfg.thermal
 # parse arguments
 argparser = argparse.ArgumentParser(prog="tub_control.py", description="Hot Tub filter heat control", epilog="with no control arguments [-P, -H, -T] prints current status")
 argparser.add_argument('-c', '--cfgfile', help="location of configuration file; default='configuration.json'")
 argparser.add_argument('-l', '--loglevel', help="logging level: INFO, DEBUG, WARNING, ERROR, CRITICAL")
+argparser.add_argument('-m', '--metrics', help="write API request metrics (JSON) to this file on exit")
 argparser.add_argument('-D', '--duration', type=int, help="heat for specified duration (in minutes)")
 argparser.add_argument('-T', '--temp', type=int, help="heat to target temperature")
+argparser.add_argument('-W', '--timeout', type=int, help="with -T: give up after this many minutes; default twice the predicted heating time")
 args = argparser.parse_args()
 
 # setup logging
@@ -46,9 +53,11 @@ if not cfg['gizwits_url']:
     logging.info(f"Using {cfg.gizwits_url}")
 
 logging.info("Logging in")
-token = BestwayUserToken(cfg.token)
-api = BestwayAPI(cfg.gizwits_url)
-token = api.check_login(token, cfg.username, cfg.password)
+bindings = BestwayBindingsCache(os.path.join(os.path.dirname(args.cfgfile), BINDINGSFILENAME))
+api = BestwayAPI(cfg.gizwits_url, bindings)
+if args.metrics: api.get_metrics().dump_at_exit(args.metrics)
+tokens = BestwayTokenStore(os.path.join(os.path.dirname(args.cfgfile), TOKENFILENAME))
+token = tokens.get_token(api, cfg.username, cfg.password, cfg['token'])
 
 controlling = False
 duration = None
@@ -78,16 +87,17 @@ if controlling:
     device.send_controls(token, commands)
 
     if duration:
-      end_time = time.time() + duration * 60  # loop until duration seconds
-      while time.time() < end_time:
-        time.sleep(2)
+      time.sleep(duration * 60)  # a timed heat needs no polling
     elif temp:
-      device_status = device.get_status(token)
-      temp_now = device_status.get_temp()
-      while temp_now < temp:
-        time.sleep(60)
-        device_status = device.get_status(token)
-        temp_now = device_status.get_temp()
+      events = device.get_events()
+      events.on_delta('temp', lambda event: logging.info(f"Temperature now {event.new}{temp_unit}"), 1)
+      events.on_transition('heat', lambda event: logging.warning("Heater switched off"), to=False)
+      heat_rate = cfg.thermal.get('heat_rate', HEAT_RATE) if type(cfg['thermal']) == dict else HEAT_RATE
+      timeout = args.timeout * 60 if args.timeout else max(2 * (temp - start_temp) * heat_rate, 60) * 60
+      snapshot = device.wait_for(token, lambda snapshot: snapshot.temp >= temp,
+                                 tub_utils.HeatPredictor(temp, heat_rate), timeout=timeout)
+      if snapshot is None:
+        logging.warning(f"{temp}{temp_unit} not reached after {timeout / 60:.0f} minutes - giving up")
       
     commands = bestway.bestway_device.BestwayCommand()
     commands.set_heat(False)
@@ -108,8 +118,4 @@ else:
     print(f"Filter pump is {'ON' if pump_state else 'OFF'}")
     print(f"Heater is {'ON' if heat_state else 'OFF'}")
 
-logging.info("Saving configuration")
-cfg.token = dict(token)
-cfg.toFile(args.cfgfile)
-
 logging.info("Done.")
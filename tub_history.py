@@ -0,0 +1,159 @@
+#
+# tub_history - recorded Hot Tub status samples
+#
+# TubSample is the common record for every history format; writers for each
+# format share append(sample) / close(), so tub_log.py need not care which
+# one it is writing
+#
+
+import csv
+import datetime
+import logging
+import os
+from typing import NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows: no locking between processes
+    fcntl = None
+
+# ---------------------------------------------------------------------------
+
+CSV = 'csv'
+BINARY = 'binary'
+SQLITE = 'sqlite'
+FORMATS = [CSV, BINARY, SQLITE]
+EXTENSIONS = {CSV: '.csv', BINARY: '.bin', SQLITE: '.db'}
+CSV_HEADER = ['TIME', 'TEMP_C', 'FILTER', 'HEAT']
+
+# ---------------------------------------------------------------------------
+
+class TubSample(NamedTuple):
+    time: int  # epoch seconds
+    temp: Optional[int]
+    pump: bool
+    heat: bool
+
+# ---------------------------------------------------------------------------
+
+class HistoryLock:
+    """exclusive advisory lock on <log>.lock, serialising appends with compaction (see tub_rollup.py)"""
+
+    def __init__(self, filename):
+        self.__filename = f"{filename}.lock"
+        self.__file = None
+
+    def __enter__(self):
+        if fcntl is None: return self
+        self.__file = open(self.__filename, 'a')
+        fcntl.flock(self.__file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.__file:
+            fcntl.flock(self.__file, fcntl.LOCK_UN)
+            self.__file.close()
+            self.__file = None
+
+
+def is_replaced(filename, open_file):
+    """True if filename no longer names open_file (e.g. compaction has rewritten the log)"""
+    try:
+        return os.stat(filename).st_ino != os.fstat(open_file.fileno()).st_ino
+    except FileNotFoundError:
+        return True
+
+# ---------------------------------------------------------------------------
+
+class CsvHistoryWriter:
+    """appends samples to a CSV log, as written by tub_log.py since the start"""
+
+    def __init__(self, filename):
+        self.__filename = filename
+        newfile = True
+        try:
+            with open(filename, newline='') as csvfile:
+                firstline = csvfile.readline(256)
+            newfile = not csv.Sniffer().has_header(firstline)
+            if newfile: logging.warning("CSV badly formatted? Overwriting...")
+        except FileNotFoundError:
+            logging.warning("Log file not found. Starting a new file")
+        except csv.Error:
+            logging.warning("Log file empty? Starting a new file")
+
+        if newfile:
+            logging.info("Starting new log file")
+            self.__file = open(filename, 'w', newline='')
+        else:
+            logging.info("Preparing to append to log file")
+            self.__file = open(filename, 'a', newline='')
+        self.__writer = csv.writer(self.__file, delimiter=',', quotechar='"', lineterminator="\n")
+        if newfile:
+            self.__writer.writerow(CSV_HEADER)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, sample):
+        with HistoryLock(self.__filename):
+            if is_replaced(self.__filename, self.__file):
+                self.__file.close()
+                self.__file = open(self.__filename, 'a', newline='')
+                self.__writer = csv.writer(self.__file, delimiter=',', quotechar='"', lineterminator="\n")
+            # ['TIME', 'TEMP_C', 'FILTER', 'HEAT']
+            self.__writer.writerow([datetime.datetime.fromtimestamp(sample.time).isoformat(timespec='seconds'),
+                                    sample.temp,
+                                    'ON' if sample.pump else 'OFF',
+                                    'ON' if sample.heat else 'OFF'
+                                   ])
+            self.__file.flush()
+
+    def flush(self):
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+
+def parse_time(text):
+    """epoch seconds from a CSV TIME column (local time, as logged)"""
+    return int(datetime.datetime.fromisoformat(text).timestamp())
+
+
+def parse_row(row):
+    """TubSample from a CSV row, or None if the row is incomplete"""
+    if len(row) < 4: return None
+    return TubSample(parse_time(row[0]),
+                     int(row[1]) if row[1] else None,
+                     row[2] == 'ON',
+                     row[3] == 'ON')
+
+
+def read_csv(filename):
+    """TubSamples from a tub_log.py CSV file"""
+    with open(filename, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader, None)  # header
+        for row in reader:
+            sample = parse_row(row)
+            if sample is not None: yield sample
+
+# ---------------------------------------------------------------------------
+
+def open_writer(filename, format=CSV, device=None):
+    """history writer for format (see FORMATS)
+       device identifies the tub, in formats that can hold several"""
+    if format == CSV:
+        return CsvHistoryWriter(filename)
+    if format == BINARY:
+        from tub_history_binary import BinaryHistoryWriter
+        return BinaryHistoryWriter(filename)
+    if format == SQLITE:
+        from tub_history_sqlite import SqliteHistoryWriter
+        return SqliteHistoryWriter(filename, device)
+    raise ValueError(f"unknown history format '{format}'")
+
+# ---------------------------------------------------------------------------
@@ -0,0 +1,199 @@
+#
+# tub_history_binary - compact, fixed-width, append-only Hot Tub history
+#
+# file layout: a 16 byte header, then one 6 byte record per sample:
+#   header: magic b'HTTM', version (u16), record size (u16), 8 bytes reserved
+#   record: epoch seconds (u32), temperature (i8, whole degrees as reported),
+#           flags (u8: bit 0 filter pump on, bit 1 heater on)
+# about a fifth of the size of the equivalent CSV; read back through mmap
+# so that slicing a range of records copies nothing until it is decoded
+#
+# usage: python tub_history_binary.py tub_log.csv tub_log.bin  - convert a CSV log
+#
+
+import bisect
+import logging
+import mmap
+import os
+import struct
+import sys
+
+from tub_history import TubSample, HistoryLock, is_replaced, read_csv
+
+# ---------------------------------------------------------------------------
+
+MAGIC = b'HTTM'
+VERSION = 1
+HEADER = struct.Struct('<4sHH8x')
+RECORD = struct.Struct('<IbB')
+NO_TEMP = -128  # temperature not reported
+PUMP_ON = 0x01
+HEAT_ON = 0x02
+
+# ---------------------------------------------------------------------------
+
+def pack(sample):
+    flags = (PUMP_ON if sample.pump else 0) | (HEAT_ON if sample.heat else 0)
+    return RECORD.pack(int(sample.time), NO_TEMP if sample.temp is None else sample.temp, flags)
+
+
+def unpack(time, temp, flags):
+    return TubSample(time, None if temp == NO_TEMP else temp, bool(flags & PUMP_ON), bool(flags & HEAT_ON))
+
+
+def check_header(data, filename):
+    if len(data) < HEADER.size:
+        raise ValueError(f"{filename}: not a tub history file (too short)")
+    magic, version, record_size = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{filename}: not a tub history file")
+    if version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"{filename}: unsupported tub history version {version}")
+
+# ---------------------------------------------------------------------------
+
+class BinaryHistoryWriter:
+    """appends samples to a binary history file, creating it if need be"""
+
+    def __init__(self, filename):
+        self.__filename = filename
+        with HistoryLock(filename):  # so no other writer is part way through a record (or the header)
+            self.__file = open(filename, 'ab')
+            size = self.__file.tell()
+            if size == 0:
+                logging.info(f"Starting new history file {filename}")
+                self.__file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+                self.__file.flush()
+            else:
+                with open(filename, 'rb') as existing:
+                    check_header(existing.read(HEADER.size), filename)
+                partial = (size - HEADER.size) % RECORD.size
+                if partial:
+                    # a write was cut short: drop the fragment so records stay aligned
+                    logging.warning(f"{filename}: discarding {partial} bytes of incomplete record")
+                    self.__file.truncate(size - partial)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, sample):
+        self.__write(pack(sample))
+
+    def extend(self, samples):
+        self.__write(b''.join(pack(sample) for sample in samples))
+
+    def flush(self):
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+    # internal methods
+
+    def __write(self, records):
+        with HistoryLock(self.__filename):
+            if is_replaced(self.__filename, self.__file):
+                self.__file.close()
+                self.__file = open(self.__filename, 'ab')
+            self.__file.write(records)
+            self.__file.flush()
+
+# ---------------------------------------------------------------------------
+
+class BinaryHistory:
+    """read-only, memory-mapped view of a binary history file
+       indexing and slicing decode only the records asked for"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as history_file:
+            if os.fstat(history_file.fileno()).st_size == 0:
+                # just created, header not yet written (an empty file cannot be mapped): no samples
+                self.__mmap = None
+                self.__view = memoryview(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            else:
+                self.__mmap = mmap.mmap(history_file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.__view = memoryview(self.__mmap)
+        check_header(self.__view, filename)
+        self.__count = (len(self.__view) - HEADER.size) // RECORD.size  # ignoring any incomplete record
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.__count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.__count)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return list(self.iter(start, stop))
+        if index < 0: index += self.__count
+        if not 0 <= index < self.__count:
+            raise IndexError("history index out of range")
+        return unpack(*RECORD.unpack_from(self.__view, HEADER.size + index * RECORD.size))
+
+    def __iter__(self):
+        return self.iter()
+
+    def records(self, start=0, stop=None):
+        """raw records start:stop as a memoryview into the file - no copy; release before close()
+           decode with RECORD.iter_unpack() for the fastest scans"""
+        stop = self.__count if stop is None else min(stop, self.__count)
+        return self.__view[HEADER.size + start * RECORD.size:HEADER.size + stop * RECORD.size]
+
+    def iter(self, start=0, stop=None):
+        """decode records start:stop as TubSamples"""
+        make = TubSample._make
+        for time, temp, flags in RECORD.iter_unpack(self.records(start, stop)):
+            yield make((time, None if temp == NO_TEMP else temp, flags & PUMP_ON != 0, flags & HEAT_ON != 0))
+
+    def time_at(self, index):
+        """epoch seconds of record index, without decoding the rest of it"""
+        return struct.unpack_from('<I', self.__view, HEADER.size + index * RECORD.size)[0]
+
+    def between(self, start_time, end_time):
+        """samples with start_time <= time < end_time - located by bisection, as records are in time order"""
+        times = _Times(self)
+        return self.iter(bisect.bisect_left(times, start_time), bisect.bisect_left(times, end_time))
+
+    def index_of(self, when):
+        """index of the first record at or after when (len() if there is none)"""
+        return bisect.bisect_left(_Times(self), when)
+
+    def latest_before(self, when):
+        """most recent sample at or before when, or None"""
+        index = bisect.bisect_right(_Times(self), when)
+        return self[index - 1] if index else None
+
+    def close(self):
+        self.__view.release()
+        if self.__mmap is not None: self.__mmap.close()
+
+
+class _Times:
+    """record times as a sequence, for bisect"""
+
+    def __init__(self, history):
+        self.__history = history
+
+    def __len__(self):
+        return len(self.__history)
+
+    def __getitem__(self, index):
+        return self.__history.time_at(index)
+
+# ---------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(f"usage: {os.path.basename(sys.argv[0])} CSVFILE BINFILE")
+    with BinaryHistoryWriter(sys.argv[2]) as writer:
+        writer.extend(read_csv(sys.argv[1]))
@@ -0,0 +1,185 @@
+#
+# tub_history_index - time range queries over Hot Tub history logs
+#
+# a CSV log is indexed sparsely: the time and byte offset of every Nth
+# record, kept in a JSON sidecar file (<log>.idx) and extended incrementally
+# as the log grows; a query bisects the index and then reads at most a
+# block or so beyond the samples it returns
+# binary logs need no separate index: their fixed-width records are
+# bisected directly (see tub_history_binary.BinaryHistory); nor do SQLite
+# ones, which are indexed by the database (tub_history_sqlite.SqliteHistory)
+#
+# records are assumed to be in time order; CSV times are local, so samples
+# logged in the hour repeated when clocks go back may be missed
+#
+
+import bisect
+import csv
+import json
+import logging
+import os
+
+import tub_history
+from tub_history_binary import MAGIC
+
+# ---------------------------------------------------------------------------
+
+INDEX_EVERY = 1024  # records between index entries
+INDEX_VERSION = 1
+SQLITE_MAGIC = b'SQLite format 3\x00'  # as tub_history_sqlite.MAGIC, without importing sqlite3
+
+# ---------------------------------------------------------------------------
+
+class CsvHistoryReader:
+    """range queries over a tub_log.py CSV file, using a sparse time index"""
+
+    def __init__(self, filename, every=INDEX_EVERY, index_filename=None):
+        self.filename = filename
+        self.__index_filename = index_filename or f"{filename}.idx"
+        self.__every = every
+        self.__times = []  # time of every Nth record...
+        self.__offsets = []  # ...and its byte offset
+        self.__size = 0  # bytes indexed so far
+        self.__count = 0  # records indexed so far
+        self.__load_index()
+        self.update_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.__count
+
+    def update_index(self):
+        """index any records appended since the index was last brought up to date"""
+        size = os.path.getsize(self.filename)
+        if size < self.__size or not self.__index_matches():
+            logging.info(f"{self.filename} has been rewritten - rebuilding index")
+            self.__reset()
+        if size == self.__size:
+            return
+        times, offsets, count = self.__times, self.__offsets, self.__count
+        with open(self.filename, 'rb') as csvfile:
+            csvfile.seek(self.__size)
+            if self.__size == 0:
+                csvfile.readline()  # header
+            offset = csvfile.tell()
+            for line in iter(csvfile.readline, b''):
+                if not line.endswith(b'\n'): break  # being written: index it next time
+                if count % self.__every == 0:
+                    times.append(tub_history.parse_time(line.split(b',', 1)[0].decode()))
+                    offsets.append(offset)
+                count += 1
+                offset += len(line)
+        logging.debug(f"indexed {count - self.__count} new records of {self.filename}")
+        self.__size, self.__count = offset, count
+        self.__save_index()
+
+    def between(self, start_time, end_time):
+        """samples with start_time <= time < end_time"""
+        block = max(bisect.bisect_right(self.__times, start_time) - 1, 0)
+        for sample in self.__read_from(block):
+            if sample.time >= end_time: return
+            if sample.time >= start_time: yield sample
+
+    def latest_before(self, when):
+        """most recent sample at or before when, or None"""
+        block = bisect.bisect_right(self.__times, when) - 1
+        if block < 0: return None
+        latest = None
+        for sample in self.__read_from(block):
+            if sample.time > when: break
+            latest = sample
+        return latest
+
+    def offset_of(self, when):
+        """byte offset of the first record at or after when (the file size if there is none)"""
+        block = max(bisect.bisect_right(self.__times, when) - 1, 0)
+        if block >= len(self.__offsets): return self.__size
+        with open(self.filename, 'rb') as csvfile:
+            for offset, line in self.__indexed_lines(csvfile, self.__offsets[block]):
+                if tub_history.parse_time(line.split(b',', 1)[0].decode()) >= when: return offset
+        return self.__size
+
+    def close(self):
+        pass
+
+    # internal methods
+
+    def __index_matches(self):
+        """check the last index entry against the file, in case it has been replaced"""
+        if not self.__offsets: return True
+        with open(self.filename, 'rb') as csvfile:
+            csvfile.seek(self.__offsets[-1])
+            line = csvfile.readline()
+        try:
+            return tub_history.parse_time(line.split(b',', 1)[0].decode()) == self.__times[-1]
+        except ValueError:
+            return False
+
+    def __read_from(self, block):
+        if block >= len(self.__offsets): return
+        with open(self.filename, 'rb') as csvfile:
+            lines = self.__indexed_lines(csvfile, self.__offsets[block])
+            for row in csv.reader(line.decode() for offset, line in lines):
+                sample = tub_history.parse_row(row)
+                if sample is not None: yield sample
+
+    def __indexed_lines(self, csvfile, offset):
+        """(offset, line) from offset up to the indexed size, so never a record still being written"""
+        csvfile.seek(offset)
+        while offset < self.__size:
+            line = csvfile.readline(self.__size - offset)
+            if not line: return
+            yield offset, line
+            offset += len(line)
+
+    def __reset(self):
+        self.__times, self.__offsets = [], []
+        self.__size = self.__count = 0
+
+    def __load_index(self):
+        try:
+            with open(self.__index_filename) as json_data:
+                data = json.load(json_data)
+            if data['version'] != INDEX_VERSION or data['every'] != self.__every:
+                logging.info(f"{self.__index_filename} out of date - rebuilding")
+                return
+            self.__times, self.__offsets = data['times'], data['offsets']
+            self.__size, self.__count = data['size'], data['count']
+        except FileNotFoundError:
+            logging.debug(f"no index for {self.filename} - building one")
+        except (ValueError, KeyError, TypeError) as err:
+            logging.warning(f"ignoring corrupt index {self.__index_filename}: {err}")
+            self.__reset()
+
+    def __save_index(self):
+        data = {'version': INDEX_VERSION, 'every': self.__every, 'size': self.__size, 'count': self.__count,
+                'times': self.__times, 'offsets': self.__offsets}
+        temp_filename = f"{self.__index_filename}.{os.getpid()}.tmp"
+        try:
+            with open(temp_filename, 'w') as json_data:
+                json.dump(data, json_data)
+            os.replace(temp_filename, self.__index_filename)
+        except OSError as err:
+            logging.warning(f"could not save index {self.__index_filename}: {err}")
+
+# ---------------------------------------------------------------------------
+
+def open_reader(filename, device=None):
+    """range-queryable reader for a history file of any format
+       device selects the tub from a database holding several"""
+    with open(filename, 'rb') as history_file:
+        magic = history_file.read(len(SQLITE_MAGIC))
+    if magic.startswith(MAGIC):
+        from tub_history_binary import BinaryHistory
+        return BinaryHistory(filename)
+    if magic == SQLITE_MAGIC:
+        from tub_history_sqlite import SqliteHistory
+        return SqliteHistory(filename, device)
+    return CsvHistoryReader(filename)
+
+# ---------------------------------------------------------------------------
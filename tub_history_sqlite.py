@@ -0,0 +1,160 @@
+#
+# tub_history_sqlite - Hot Tub history in an SQLite database
+#
+# one table for any number of tubs, keyed (and so indexed) on (device, time):
+# a time range for one tub is an index range scan, however many tubs and
+# years the database holds
+# the database runs in WAL mode, so several loggers (tub_log.py from cron,
+# tub_daemon.py, tub_fleet.py) can append while others read; each writer
+# buffers samples and commits them a batch at a time, as a commit (an fsync)
+# per sample would cost more than the sample itself
+#
+# usage: python tub_history_sqlite.py tub_log.csv tub_log.db [DEVICE]  - import a CSV log
+#
+
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+from tub_history import TubSample, read_csv
+
+# ---------------------------------------------------------------------------
+
+MAGIC = b'SQLite format 3\x00'
+BATCH_SIZE = 500  # samples buffered before a commit...
+BATCH_AGE = 5 * 60  # ...or seconds the oldest has waited
+BUSY_TIMEOUT = 30  # seconds to wait for another writer's lock
+DEFAULT_DEVICE = ''
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    device TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    temp INTEGER,
+    pump INTEGER NOT NULL,
+    heat INTEGER NOT NULL,
+    PRIMARY KEY (device, time)
+) WITHOUT ROWID
+"""
+
+# ---------------------------------------------------------------------------
+
+def connect(filename):
+    """connection to the history database, creating the schema if need be"""
+    connection = sqlite3.connect(filename, timeout=BUSY_TIMEOUT)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")  # durable at each checkpoint; safe with WAL
+    connection.execute(SCHEMA)
+    connection.commit()
+    return connection
+
+
+def _make(row):
+    time, temp, pump, heat = row
+    return TubSample(time, temp, bool(pump), bool(heat))
+
+# ---------------------------------------------------------------------------
+
+class SqliteHistoryWriter:
+    """buffers samples for one tub (device) and inserts them a batch at a time"""
+
+    def __init__(self, filename, device=None, batch_size=BATCH_SIZE, batch_age=BATCH_AGE, clock=time.monotonic):
+        self.filename = filename
+        self.__device = device or DEFAULT_DEVICE
+        self.__batch_size = batch_size
+        self.__batch_age = batch_age
+        self.__clock = clock
+        self.__connection = connect(filename)
+        self.__pending = []
+        self.__pending_since = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, sample, device=None):
+        """buffer sample, for this writer's device unless another is given"""
+        if not self.__pending: self.__pending_since = self.__clock()
+        self.__pending.append((device or self.__device, int(sample.time), sample.temp, int(sample.pump), int(sample.heat)))
+        if (len(self.__pending) >= self.__batch_size
+                or self.__clock() - self.__pending_since >= self.__batch_age):
+            self.flush()
+
+    def extend(self, samples, device=None):
+        for sample in samples:
+            self.append(sample, device)
+
+    def flush(self):
+        """commit the buffered samples"""
+        if not self.__pending: return
+        with self.__connection:  # one transaction
+            # a sample logged twice for the same second (two loggers) is stored once
+            self.__connection.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?)", self.__pending)
+        logging.debug(f"committed {len(self.__pending)} samples to {self.filename}")
+        self.__pending = []
+
+    def close(self):
+        self.flush()
+        self.__connection.close()
+
+# ---------------------------------------------------------------------------
+
+class SqliteHistory:
+    """range queries over the samples of one tub in a history database
+       device may be omitted if the database holds only one"""
+
+    def __init__(self, filename, device=None):
+        self.filename = filename
+        self.__connection = connect(filename)
+        if device is None:
+            devices = self.get_devices()
+            if len(devices) > 1:
+                self.__connection.close()
+                raise ValueError(f"{filename} holds several tubs - choose one of {devices}")
+            device = devices[0] if devices else DEFAULT_DEVICE
+        self.device = device
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.__connection.execute("SELECT COUNT(*) FROM samples WHERE device = ?", (self.device,)).fetchone()[0]
+
+    def __iter__(self):
+        return self.between(0, sys.maxsize)
+
+    def get_devices(self):
+        return [row[0] for row in self.__connection.execute("SELECT DISTINCT device FROM samples ORDER BY device")]
+
+    def between(self, start_time, end_time):
+        """samples with start_time <= time < end_time"""
+        end_time = min(end_time, sys.maxsize)  # float('inf') does not bind as an integer
+        cursor = self.__connection.execute(
+            "SELECT time, temp, pump, heat FROM samples WHERE device = ? AND time >= ? AND time < ? ORDER BY time",
+            (self.device, start_time, end_time))
+        return map(_make, cursor)
+
+    def latest_before(self, when):
+        """most recent sample at or before when, or None"""
+        row = self.__connection.execute(
+            "SELECT time, temp, pump, heat FROM samples WHERE device = ? AND time <= ? ORDER BY time DESC LIMIT 1",
+            (self.device, min(when, sys.maxsize))).fetchone()
+        return _make(row) if row else None
+
+    def close(self):
+        self.__connection.close()
+
+# ---------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (3, 4):
+        sys.exit(f"usage: {os.path.basename(sys.argv[0])} CSVFILE DBFILE [DEVICE]")
+    with SqliteHistoryWriter(sys.argv[2], sys.argv[3] if len(sys.argv) == 4 else None) as writer:
+        writer.extend(read_csv(sys.argv[1]))
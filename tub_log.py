@@ -5,25 +5,32 @@
 import argparse
 import logging
 import log_config
-import csv
 import os
 import sys
-import datetime
+import time
+
+import tub_history
 
 from configuration import Configuration
 from bestway.bestwayapi import BestwayAPI
-from bestway.bestway_user_token import BestwayUserToken
+from bestway.bestway_token_store import BestwayTokenStore
+from bestway.bestway_bindings_cache import BestwayBindingsCache
 
 # CONSTANTS
 CFGFILENAME = 'configuration.json'
-LOGFILENAME = 'tub_log.csv'
+BINDINGSFILENAME = 'bindings_cache.json'
+TOKENFILENAME = 'token.json'
+LOGFILENAME = 'tub_log'  # + format extension
 GIZWITS_URL = 'https://euapi.gizwits.com'
 
 # parse arguments
 argparser = argparse.ArgumentParser(prog="tub_log.py", description="Hot Hub logger")
 argparser.add_argument('-c', '--cfgfile', help="location of configuration file; default='configuration.json'")
 argparser.add_argument('-l', '--loglevel', help="logging level: INFO, DEBUG, WARNING, ERROR, CRITICAL")
-argparser.add_argument('-o', '--output', help=f"full pathname of output CSV file; default='{LOGFILENAME}'")
+argparser.add_argument('-m', '--metrics', help="write API request metrics (JSON) to this file on exit")
+argparser.add_argument('-o', '--output', help=f"full pathname of output file; default='{LOGFILENAME}.csv' (or .bin, .db)")
+argparser.add_argument('-f', '--format', choices=tub_history.FORMATS, default=tub_history.CSV, help="log file format, default 'csv'")
+argparser.add_argument('-u', '--changed', action='store_true', help="only log when the tub has reported new data")
 args = argparser.parse_args()
 
 # setup logging
@@ -33,38 +40,13 @@ if not args.cfgfile:
     args.cfgfile = os.path.join(os.path.dirname(sys.argv[0]), CFGFILENAME)
     logging.info(f"using configuration file {args.cfgfile}")
 if not args.output:
-    args.output = os.path.join(os.path.dirname(sys.argv[0]), LOGFILENAME)
+    args.output = os.path.join(os.path.dirname(sys.argv[0]), LOGFILENAME + tub_history.EXTENSIONS[args.format])
 
 logging.info("Load configuration from file...")
 cfg = Configuration.fromFile(args.cfgfile)
 
-logging.info(f"preparing CSV file: {args.output}")
-csvfile = None
-newfile = True
-try:
-    csvfile = open(args.output, newline='')
-    newfile = False
-    firstline = csvfile.readline(256)
-    if not csv.Sniffer().has_header(firstline):
-        logging.warning("CSV badly formatted? Overwriting...")
-        csvfile.close()
-        newfile = True
-except FileNotFoundError as err:
-    logging.warning("Log file not found. Starting a new file")
-    newfile = True
-except csv.Error as err:
-    logging.warning("Log file empty? Starting a new file")
-    newfile = True
-
-if newfile:
-    logging.info("Starting new log file")
-    csvfile = open(args.output, 'w')
-    writer = csv.writer(csvfile, delimiter=',', quotechar='"', lineterminator="\n")
-    writer.writerow(['TIME', 'TEMP_C', 'FILTER', 'HEAT'])
-else:
-    logging.info("Preparing to append to log file")
-    csvfile = open(args.output, 'a')
-    writer = csv.writer(csvfile, delimiter=',', quotechar='"', lineterminator="\n")
+logging.info(f"preparing {args.format} file: {args.output}")
+writer = tub_history.open_writer(args.output, args.format, cfg.did)
 
 # check Gizwits URL
 if not cfg['gizwits_url']:
@@ -72,9 +54,11 @@ if not cfg['gizwits_url']:
     logging.info(f"Using {cfg.gizwits_url}")
 
 logging.info("Logging in")
-token = BestwayUserToken(cfg.token)
-api = BestwayAPI(cfg.gizwits_url)
-token = api.check_login(token, cfg.username, cfg.password)
+bindings = BestwayBindingsCache(os.path.join(os.path.dirname(args.cfgfile), BINDINGSFILENAME))
+api = BestwayAPI(cfg.gizwits_url, bindings)
+if args.metrics: api.get_metrics().dump_at_exit(args.metrics)
+tokens = BestwayTokenStore(os.path.join(os.path.dirname(args.cfgfile), TOKENFILENAME))
+token = tokens.get_token(api, cfg.username, cfg.password, cfg['token'])
 
 """
 logging.info("Getting device info")
@@ -83,22 +67,23 @@ info = api._get_device_info(token, cfg.did)
 device = api.get_device(token, cfg.did)
 logging.info(f"Got device: {device}")
 
-device_status = device.get_status(token)
-temp_now = device_status.get_temp()
-pump_state = device_status.get_pump_is_on()
-heat_state = device_status.get_heat_is_on()
-
-logging.info("Logging")
-logging.debug(datetime.datetime.now().isoformat(timespec='seconds'))
-# ['TIME', 'TEMP_C', 'FILTER', 'HEAT']
-writer.writerow([datetime.datetime.now().isoformat(timespec='seconds'),
-                 temp_now,
-                 'ON' if pump_state else 'OFF',
-                 'ON' if heat_state else 'OFF'
-                ])
+since = cfg['log_updated_at'] if args.changed else None
+device_status = device.get_status(token, since)
+if device_status is None:
+    logging.info(f"No new data since {since} - skipping")
+else:
+    sample = tub_history.TubSample(int(time.time()),
+                                   device_status.get_temp(),
+                                   device_status.get_pump_is_on(),
+                                   device_status.get_heat_is_on())
+    logging.info("Logging")
+    logging.debug(sample)
+    writer.append(sample)
+writer.close()
 
-logging.info("Saving configuration")
-cfg.token = dict(token)
-cfg.toFile(args.cfgfile)
+if device_status is not None:
+    # only the key this script owns: the token is in its own file, and other scripts may be saving theirs
+    logging.info("Saving configuration")
+    Configuration.update(args.cfgfile, {"log_updated_at": device_status.get_updated_at()})
 
 logging.info("Done.")
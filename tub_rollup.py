@@ -0,0 +1,296 @@
+#
+# tub_rollup - hourly and daily rollups of the Hot Tub history, and compaction
+#
+# raw samples are kept for a recent window only; older data survives as
+# per-hour and per-day aggregates (min/max/mean temperature, heater-on and
+# pump-on minutes) in small CSV files beside the log:
+#   tub_log.csv -> tub_log.csv.hourly.csv, tub_log.csv.daily.csv, tub_log.csv.rollup.json (progress)
+# (so a CSV and a binary log in the same directory keep separate rollups)
+# each compaction only reads samples logged since the previous one; hourly
+# rollups are kept for a year, daily ones indefinitely (a few KB a year)
+# rollups are appended before the progress is saved, so after a crash between
+# the two the same periods are rolled up again: appends skip any period the
+# file already holds
+#
+
+import csv
+import datetime
+import json
+import logging
+import os
+import time
+from typing import NamedTuple
+
+import tub_history
+from tub_history import HistoryLock
+from tub_history_binary import BinaryHistory, HEADER, MAGIC
+from tub_history_index import CsvHistoryReader, open_reader, SQLITE_MAGIC
+
+# ---------------------------------------------------------------------------
+
+HOUR = 'hourly'
+DAY = 'daily'
+RAW_DAYS = 90  # days of full resolution samples kept: no less than tub_calibrate.py fits to
+HOURLY_DAYS = 366  # days of hourly rollups kept
+MAX_GAP = 15 * 60  # seconds: longest time a single sample is taken to represent
+ROLLUP_HEADER = ['START', 'SAMPLES', 'TEMP_MIN', 'TEMP_MAX', 'TEMP_MEAN', 'HEAT_MINS', 'PUMP_MINS']
+STATE_VERSION = 1
+
+# ---------------------------------------------------------------------------
+
+class Rollup(NamedTuple):
+    start: int  # epoch seconds: start of the hour or (local) day
+    samples: int
+    temp_min: float
+    temp_max: float
+    temp_mean: float
+    heat_minutes: float
+    pump_minutes: float
+
+
+def period_start(when, period):
+    """start of the hour, or local day, containing epoch time when"""
+    moment = datetime.datetime.fromtimestamp(when)
+    if period == HOUR:
+        moment = moment.replace(minute=0, second=0, microsecond=0)
+    else:
+        moment = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(moment.timestamp())
+
+
+class _Bucket:
+    """running aggregate for one hour or day"""
+
+    def __init__(self, start, samples=0, temp_count=0, temp_sum=0.0, temp_min=None, temp_max=None,
+                 heat_minutes=0.0, pump_minutes=0.0):
+        self.start = start
+        self.samples = samples
+        self.temp_count = temp_count
+        self.temp_sum = temp_sum
+        self.temp_min = temp_min
+        self.temp_max = temp_max
+        self.heat_minutes = heat_minutes
+        self.pump_minutes = pump_minutes
+
+    def add(self, sample, minutes):
+        self.samples += 1
+        if sample.temp is not None:
+            self.temp_count += 1
+            self.temp_sum += sample.temp
+            self.temp_min = sample.temp if self.temp_min is None else min(self.temp_min, sample.temp)
+            self.temp_max = sample.temp if self.temp_max is None else max(self.temp_max, sample.temp)
+        if sample.heat: self.heat_minutes += minutes
+        if sample.pump: self.pump_minutes += minutes
+
+    def rollup(self):
+        mean = round(self.temp_sum / self.temp_count, 2) if self.temp_count else None
+        return Rollup(self.start, self.samples, self.temp_min, self.temp_max, mean,
+                      round(self.heat_minutes, 1), round(self.pump_minutes, 1))
+
+# ---------------------------------------------------------------------------
+
+class TubRollups:
+    """rollup tiers and compaction for one history log (CSV or binary)"""
+
+    def __init__(self, filename, raw_days=RAW_DAYS, hourly_days=HOURLY_DAYS):
+        self.filename = filename
+        self.__filenames = {HOUR: f"{filename}.hourly.csv", DAY: f"{filename}.daily.csv"}
+        self.__state_filename = f"{filename}.rollup.json"
+        self.__raw_days = raw_days
+        self.__hourly_days = hourly_days
+
+    def get_filename(self, period):
+        return self.__filenames[period]
+
+    def compact(self, now=None):
+        """roll up samples logged since the last compaction, then trim the raw log and hourly tier"""
+        now = time.time() if now is None else now
+        with open(self.filename, 'rb') as history_file:
+            if history_file.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC:
+                raise ValueError(f"{self.filename}: SQLite histories are indexed, not compacted")
+        with HistoryLock(self.filename):
+            state = self.__load_state()
+            self.__roll_up(state)
+            self.__save_state(state)
+            raw_cutoff = now - self.__raw_days * 24 * 60 * 60
+            if state['pending']:
+                raw_cutoff = min(raw_cutoff, state['pending'][0])  # keep what is not yet rolled up
+            self.__trim_raw(raw_cutoff)
+        self.__trim_rollups(HOUR, now - self.__hourly_days * 24 * 60 * 60)
+
+    def read(self, period, start_time=0, end_time=float('inf')):
+        """completed rollups for period (HOUR or DAY) starting in [start_time, end_time)"""
+        try:
+            with open(self.__filenames[period], newline='') as csvfile:
+                reader = csv.reader(csvfile)
+                next(reader, None)  # header
+                for row in reader:
+                    rollup = _parse_rollup(row)
+                    if start_time <= rollup.start < end_time: yield rollup
+        except FileNotFoundError:
+            return
+
+    def query(self, start_time, end_time, now=None):
+        """(tier, records) for [start_time, end_time) from the finest tier still holding start_time:
+           'raw' TubSamples within the raw window, else hourly, else daily Rollups"""
+        now = time.time() if now is None else now
+        if start_time >= now - self.__raw_days * 24 * 60 * 60:
+            with open_reader(self.filename) as reader:
+                return 'raw', list(reader.between(start_time, end_time))
+        if start_time >= now - self.__hourly_days * 24 * 60 * 60:
+            return HOUR, list(self.read(HOUR, period_start(start_time, HOUR), end_time))
+        return DAY, list(self.read(DAY, period_start(start_time, DAY), end_time))
+
+    # internal methods
+
+    def __roll_up(self, state):
+        """fold samples after state['last'] into the open buckets, appending buckets as they complete"""
+        pending = tub_history.TubSample(*state['pending']) if state['pending'] else None
+        buckets = {period: _Bucket(**state['buckets'][period]) if state['buckets'].get(period) else None
+                   for period in (HOUR, DAY)}
+        completed = {HOUR: [], DAY: []}
+        with open_reader(self.filename) as reader:
+            samples = reader.between(state['last'] + 1, float('inf'))
+            for sample in samples:
+                if pending is not None:
+                    self.__add(pending, min(sample.time - pending.time, MAX_GAP) / 60, buckets, completed)
+                pending = sample
+        count = sum(len(rollups) for rollups in completed.values())
+        for period, rollups in completed.items():
+            self.__append_rollups(period, rollups)
+        if pending is not None:
+            state['last'] = pending.time
+        state['pending'] = list(pending) if pending else None
+        state['buckets'] = {period: vars(bucket) if bucket else None for period, bucket in buckets.items()}
+        logging.info(f"rolled up {self.filename} to {state['last']}: {count} periods completed")
+
+    def __add(self, sample, minutes, buckets, completed):
+        for period in (HOUR, DAY):
+            start = period_start(sample.time, period)
+            bucket = buckets[period]
+            if bucket is not None and bucket.start != start:
+                completed[period].append(bucket.rollup())
+                bucket = None
+            if bucket is None:
+                bucket = buckets[period] = _Bucket(start)
+            bucket.add(sample, minutes)
+
+    def __append_rollups(self, period, rollups):
+        filename = self.__filenames[period]
+        last = self.__last_start(filename)
+        if last is not None:
+            rollups = [rollup for rollup in rollups if rollup.start > last]  # already appended before a crash
+        if not rollups: return
+        newfile = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        with open(filename, 'a', newline='') as csvfile:
+            writer = csv.writer(csvfile, lineterminator="\n")
+            if newfile: writer.writerow(ROLLUP_HEADER)
+            for rollup in rollups:
+                writer.writerow(_format_rollup(rollup))
+
+    def __last_start(self, filename):
+        """start of the last complete rollup in filename, or None; drops a partly written last row"""
+        try:
+            with open(filename, 'rb+') as csvfile:
+                size = csvfile.seek(0, os.SEEK_END)
+                csvfile.seek(max(size - 1024, 0))  # rows are well under 100 bytes
+                tail = csvfile.read()
+                if tail and not tail.endswith(b'\n'):
+                    csvfile.truncate(size - len(tail) + tail.rfind(b'\n') + 1)
+                    tail = tail[:tail.rfind(b'\n') + 1]
+        except FileNotFoundError:
+            return None
+        lines = tail.splitlines()
+        if not lines: return None
+        row = lines[-1].decode().split(',')
+        if row == ROLLUP_HEADER: return None
+        return tub_history.parse_time(row[0])
+
+    def __trim_raw(self, cutoff):
+        """drop raw samples before cutoff, rewriting the log (the caller holds the HistoryLock)"""
+        with open(self.filename, 'rb') as history_file:
+            binary = history_file.read(len(MAGIC)) == MAGIC
+        if binary:
+            with BinaryHistory(self.filename) as history:
+                index = history.index_of(cutoff)
+                if index == 0: return
+                logging.info(f"compacting {self.filename}: dropping {index} samples")
+                with open(self.filename, 'rb') as history_file:
+                    header = history_file.read(HEADER.size)
+                records = history.records(index)
+                try:
+                    self.__replace(header, records)
+                finally:
+                    records.release()
+        else:
+            reader = CsvHistoryReader(self.filename)
+            offset = reader.offset_of(cutoff)
+            with open(self.filename, 'rb') as csvfile:
+                header = csvfile.readline()
+                if offset <= len(header): return
+                logging.info(f"compacting {self.filename}: dropping {offset - len(header)} bytes")
+                csvfile.seek(offset)
+                self.__replace(header, csvfile.read())
+            try:
+                os.remove(f"{self.filename}.idx")
+            except FileNotFoundError:
+                pass
+
+    def __replace(self, header, data):
+        temp_filename = f"{self.filename}.{os.getpid()}.tmp"
+        with open(temp_filename, 'wb') as history_file:
+            history_file.write(header)
+            history_file.write(data)
+        os.replace(temp_filename, self.filename)  # appenders notice and reopen (see tub_history)
+
+    def __trim_rollups(self, period, cutoff):
+        filename = self.__filenames[period]
+        rollups = list(self.read(period))
+        keep = [rollup for rollup in rollups if rollup.start >= cutoff]
+        if len(keep) == len(rollups): return
+        temp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(temp_filename, 'w', newline='') as csvfile:
+            writer = csv.writer(csvfile, lineterminator="\n")
+            writer.writerow(ROLLUP_HEADER)
+            for rollup in keep:
+                writer.writerow(_format_rollup(rollup))
+        os.replace(temp_filename, filename)
+
+    def __load_state(self):
+        try:
+            with open(self.__state_filename) as json_data:
+                state = json.load(json_data)
+            if state.get('version') == STATE_VERSION:
+                return state
+            logging.warning(f"ignoring {self.__state_filename}: unknown version")
+        except FileNotFoundError:
+            pass
+        except ValueError as err:
+            logging.warning(f"ignoring corrupt {self.__state_filename}: {err}")
+        return {'version': STATE_VERSION, 'last': -1, 'pending': None, 'buckets': {}}
+
+    def __save_state(self, state):
+        temp_filename = f"{self.__state_filename}.{os.getpid()}.tmp"
+        with open(temp_filename, 'w') as json_data:
+            json.dump(state, json_data, indent=2)
+        os.replace(temp_filename, self.__state_filename)
+
+# ---------------------------------------------------------------------------
+
+def _format_rollup(rollup):
+    return [datetime.datetime.fromtimestamp(rollup.start).isoformat(timespec='seconds'),
+            rollup.samples,
+            '' if rollup.temp_min is None else rollup.temp_min,
+            '' if rollup.temp_max is None else rollup.temp_max,
+            '' if rollup.temp_mean is None else rollup.temp_mean,
+            rollup.heat_minutes,
+            rollup.pump_minutes]
+
+
+def _parse_rollup(row):
+    def number(text):
+        return float(text) if text else None
+    return Rollup(tub_history.parse_time(row[0]), int(row[1]),
+                  number(row[2]), number(row[3]), number(row[4]), float(row[5]), float(row[6]))
+
+# ---------------------------------------------------------------------------
@@ -0,0 +1,133 @@
+#
+# tub_scheduler - heapq based timer scheduler for the tub daemon
+#
+# jobs are kept in a heap ordered by their next run time, so finding the
+# next job due is O(1) and (re)scheduling is O(log n)
+#
+
+import datetime
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+# ---------------------------------------------------------------------------
+
+MAX_SLEEP = 60  # seconds: upper bound on a single wait, so clock changes are noticed
+
+# ---------------------------------------------------------------------------
+
+class Job:
+    """a scheduled function call; interval (seconds) None for one-off jobs"""
+
+    def __init__(self, name, function, when, interval=None, daily=None):
+        self.name = name
+        self.function = function
+        self.when = when
+        self.interval = interval
+        self.daily = daily  # "HH:MM" for jobs run once a day at a wall-clock time
+        self.cancelled = False
+
+    def __repr__(self):
+        return f"Job({self.name} at {datetime.datetime.fromtimestamp(self.when).isoformat(timespec='seconds')})"
+
+
+def next_daily(clock_time, now):
+    """epoch time of the next occurrence of clock_time ("HH:MM") after now"""
+    hours, minutes = (int(part) for part in clock_time.split(':'))
+    today = datetime.datetime.fromtimestamp(now)
+    when = today.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+    if when.timestamp() <= now:
+        when += datetime.timedelta(days=1)
+    return when.timestamp()
+
+# ---------------------------------------------------------------------------
+
+class TubScheduler:
+    """runs jobs at set times or intervals, one at a time, in the calling thread"""
+
+    def __init__(self, clock=time.time):
+        self.__clock = clock
+        self.__heap = []  # (when, sequence, job)
+        self.__sequence = itertools.count()  # tie-break: equal times run in the order scheduled
+        self.__stopping = threading.Event()
+
+    def at(self, when, function, name=None):
+        """run function once at epoch time when"""
+        return self.__push(Job(name or function.__name__, function, when))
+
+    def after(self, delay, function, name=None):
+        """run function once, delay seconds from now"""
+        return self.at(self.__clock() + delay, function, name)
+
+    def every(self, interval, function, name=None, delay=0):
+        """run function every interval seconds, the first time after delay seconds"""
+        return self.__push(Job(name or function.__name__, function, self.__clock() + delay, interval=interval))
+
+    def daily(self, clock_time, function, name=None):
+        """run function every day at clock_time ("HH:MM", local time)"""
+        when = next_daily(clock_time, self.__clock())
+        return self.__push(Job(name or function.__name__, function, when, daily=clock_time))
+
+    def cancel(self, job):
+        job.cancelled = True  # left in the heap; discarded when it comes due
+
+    def get_jobs(self):
+        """pending jobs, soonest first"""
+        return [job for when, sequence, job in sorted(self.__heap) if not job.cancelled]
+
+    def next_time(self):
+        """epoch time of the next pending job, or None"""
+        while self.__heap and self.__heap[0][2].cancelled:
+            heapq.heappop(self.__heap)
+        return self.__heap[0][0] if self.__heap else None
+
+    def run_pending(self):
+        """run every job that is due; returns the number run"""
+        count = 0
+        while True:
+            when = self.next_time()
+            if when is None or when > self.__clock(): return count
+            when, sequence, job = heapq.heappop(self.__heap)
+            self.__run(job)
+            count += 1
+
+    def run(self):
+        """run jobs until stop() is called (e.g. from a signal handler)"""
+        self.__stopping.clear()
+        while not self.__stopping.is_set():
+            self.run_pending()
+            when = self.next_time()
+            if when is None:
+                logging.info("no jobs scheduled - stopping")
+                return
+            self.__stopping.wait(min(max(when - self.__clock(), 0), MAX_SLEEP))
+
+    def stop(self):
+        self.__stopping.set()
+
+    # internal methods
+
+    def __push(self, job):
+        heapq.heappush(self.__heap, (job.when, next(self.__sequence), job))
+        logging.debug(f"scheduled {job}")
+        return job
+
+    def __run(self, job):
+        logging.debug(f"running {job.name}")
+        try:
+            job.function()
+        except Exception as err:
+            logging.error(f"job {job.name} failed: {err!r}")
+        if job.cancelled: return
+        now = self.__clock()
+        if job.interval:
+            # keep to the original cadence; skip runs missed while busy
+            job.when += job.interval * max(1, int((now - job.when) // job.interval) + 1)
+            self.__push(job)
+        elif job.daily:
+            job.when = next_daily(job.daily, now)
+            self.__push(job)
+
+# ---------------------------------------------------------------------------
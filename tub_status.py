@@ -14,16 +14,20 @@ import datetime
 
 from configuration import Configuration
 from bestway.bestwayapi import BestwayAPI
-from bestway.bestway_user_token import BestwayUserToken
+from bestway.bestway_token_store import BestwayTokenStore
+from bestway.bestway_bindings_cache import BestwayBindingsCache
 
 # CONSTANTS
 CFGFILENAME = 'configuration.json'
+BINDINGSFILENAME = 'bindings_cache.json'
+TOKENFILENAME = 'token.json'
 GIZWITS_URL = 'https://euapi.gizwits.com'
 STATES      = ['on', 'off']
 # parse arguments
 argparser = argparse.ArgumentParser(prog="tub_control.py", description="Hot Tub filter pump control", epilog="with no control arguments [-P, -H, -T] prints current status")
 argparser.add_argument('-c', '--cfgfile', help="location of configuration file; default='configuration.json'")
 argparser.add_argument('-l', '--loglevel', help="logging level: INFO, DEBUG, WARNING, ERROR, CRITICAL")
+argparser.add_argument('-m', '--metrics', help="write API request metrics (JSON) to this file on exit")
 argparser.add_argument('-r', '--raw', action='store_true', help="output raw JSON data")
 argparser.add_argument('-s', '--sorted', action='store_true', help="sort raw JSON data")
 args = argparser.parse_args()
@@ -52,9 +56,11 @@ if not cfg['gizwits_url']:
     logging.info(f"Using {cfg.gizwits_url}")
 
 logging.info("Logging in")
-token = BestwayUserToken(cfg.token)
-api = BestwayAPI(cfg.gizwits_url)
-token = api.check_login(token, cfg.username, cfg.password)
+bindings = BestwayBindingsCache(os.path.join(os.path.dirname(args.cfgfile), BINDINGSFILENAME))
+api = BestwayAPI(cfg.gizwits_url, bindings)
+if args.metrics: api.get_metrics().dump_at_exit(args.metrics)
+tokens = BestwayTokenStore(os.path.join(os.path.dirname(args.cfgfile), TOKENFILENAME))
+token = tokens.get_token(api, cfg.username, cfg.password, cfg['token'])
 
 raw_format = False
 raw_sorted = False
@@ -91,8 +97,4 @@ else:
     print(f"Heat Delay    : {delay if delay else 'OFF'}")
     print(f"Heat Duration : {duration if duration else 'OFF'}")
 
-logging.info("Saving configuration")
-cfg.token = dict(token)
-cfg.toFile(args.cfgfile)
-
 logging.info("Done.")
@@ -1,4 +1,6 @@
 import logging
+import math
+import time
 
 # ---------------------------------------------------------------------------
 
@@ -72,6 +74,90 @@ def CalcHeatTime_algebra(start_temp, target_temp, cool_rate, heat_rate, time_lef
 
 # ---------------------------------------------------------------------------
 
-CalcHeatTime = CalcHeatTime_algebra
+AMBIENT_TEMP = 12  # degrees: a typical night outdoors
+REF_DELTA = 25  # degrees between water and air at which cool_rate and heat_rate hold
+
+def CalcHeatTime_newton(start_temp, target_temp, cool_rate, heat_rate, time_left, ambient_temp=AMBIENT_TEMP):
+    logging.debug("calculating start and duration (Newton's law of cooling)")
+    tracked_temp = float(start_temp)
+    target_temp = float(target_temp)
+    ambient_temp = float(ambient_temp)
+    logging.debug(f"Temp now = {tracked_temp}, ambient = {ambient_temp}")
+    logging.debug(f"target temperature {target_temp} in {time_left} minutes")
+
+    # heat is lost in proportion to the gap to ambient: dT/dt = power - k (T - Ta)
+    # k and power reproduce cool_rate and heat_rate (minutes per degree) at a gap of REF_DELTA
+    k = 1.0 / (float(cool_rate) * REF_DELTA)
+    power = 1.0 / float(heat_rate) + k * REF_DELTA
+    equilibrium = ambient_temp + power / k  # where heating for ever would end up
+
+    # cool for (time_left - time_to_heat): T1 = Ta + (T0 - Ta) e^-k(L-d)
+    # then heat for time_to_heat:          T  = Teq + (T1 - Teq) e^-kd
+    # and solve T = target for d:      e^-kd = (Teq - target + (T0 - Ta) e^-kL) / (Teq - Ta)
+    x = (equilibrium - target_temp + (tracked_temp - ambient_temp) * math.exp(-k * time_left)) / (equilibrium - ambient_temp)
+
+    if x >= 1:
+        # will still be >= target temperature after cooling
+        logging.debug(f"current temperature ({start_temp}) projected to remain over target {target_temp}")
+        return tub_heating(None, None)
+    if x <= 0:
+        # target at or beyond what the heater can reach: heat for as long as allowed
+        time_to_heat = ECO_MINS
+    else:
+        time_to_heat = min(-math.log(x) / k, ECO_MINS)
+    time_to_heat = min(math.ceil(time_to_heat), math.floor(time_left))  # round up: better early than cold
+    start_time = int(time_left - time_to_heat)
+    logging.debug(f"Setting timer to start in {start_time} minutes; heat for {time_to_heat} minutes")
+    return tub_heating(start_time, time_to_heat)
+
+
+# ---------------------------------------------------------------------------
+
+CalcHeatTime = CalcHeatTime_algebra  # or CalcHeatTime_newton, given an ambient temperature
+
+# ---------------------------------------------------------------------------
+
+class HeatPredictor:
+    """predicts seconds until a heating tub reaches target_temp, for BestwayDevice.wait_for()
+
+    temperatures are reported in whole degrees and a change is only seen at the next
+    poll, so each estimate assumes the earliest crossing consistent with what has been
+    seen: the prediction errs early, and the polls close in before the target is reached.
+    Before the first rise the phase within the degree is unknown: it is taken as half
+    way and, if that proves early, as the latest possible (the first poll), rather than
+    polling as overdue. Once the tub has risen by two degrees the observed rate
+    replaces heat_rate"""
+
+    def __init__(self, target_temp, heat_rate, clock=time.monotonic):
+        self.target_temp = target_temp
+        self.rate = heat_rate * 60.0  # seconds per degree
+        self.clock = clock
+        self.temp = None
+        self.polled_at = None
+        self.first_polled_at = None
+        self.changed_at = None  # earliest time the current degree can have been reached
+        self.first_change = None  # (temp, changed_at) of the first observed rise
+
+    def __call__(self, snapshot):
+        now = self.clock()
+        temp = snapshot.temp
+        if self.temp is None:
+            self.changed_at = now - self.rate / 2
+            self.first_polled_at = now
+        elif temp != self.temp:
+            self.changed_at = self.polled_at
+            if temp > self.temp:
+                if self.first_change is None:
+                    self.first_change = (temp, self.changed_at)
+                else:
+                    first_temp, first_time = self.first_change
+                    self.rate = (self.changed_at - first_time) / (temp - first_temp)
+                    logging.debug(f"observed heat rate {self.rate / 60:.1f} minutes per degree")
+        self.temp = temp
+        self.polled_at = now
+        remaining = (self.target_temp - temp) * self.rate - (now - self.changed_at)
+        if remaining <= 0 and self.first_change is None and self.changed_at < self.first_polled_at:
+            remaining = (self.target_temp - temp) * self.rate - (now - self.first_polled_at)
+        return remaining
 
 # ---------------------------------------------------------------------------